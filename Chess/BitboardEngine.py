@@ -0,0 +1,575 @@
+# Bitboard Engine: a GameState that also keeps the position as 64-bit integer piece sets
+# and generates moves from precomputed attack tables instead of walking the 8x8 grid.
+#
+# Square numbering follows the board list: square = row * 8 + col, so a8 is 0 and h1 is 63.
+# The 8x8 board is still kept in sync, so anything that reads gs.board (ChessMain, Move,
+# SmartMoveFinder) works unchanged.
+import marshal
+import os
+import sys
+
+from .ChessEngine import BKS, BQS, WKS, WQS, GameState, Move
+
+PIECES = ("wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK")
+FULL = (1 << 64) - 1
+FILE_A = 0x0101010101010101
+FILE_H = 0x8080808080808080
+ROW_0 = 0xFF  # white promotes here
+ROW_2 = 0xFF << 16  # a black pawn's first single push ends here
+ROW_5 = 0xFF << 40  # a white pawn's first single push ends here
+ROW_7 = 0xFF << 56  # black promotes here
+
+# (row step, col step) for every ray, orthogonal first then diagonal
+RAY_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+# rays that walk towards higher square numbers take the lowest blocker, the others the highest
+RAY_INCREASING = tuple(dr * 8 + dc > 0 for dr, dc in RAY_DIRECTIONS)
+ORTHOGONAL = (0, 1, 2, 3)
+DIAGONAL = (4, 5, 6, 7)
+
+
+def _onBoard(r, c):
+    return 0 <= r <= 7 and 0 <= c <= 7
+
+
+def _stepTable(offsets):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        for dr, dc in offsets:
+            if _onBoard(r + dr, c + dc):
+                bb |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(bb)
+    return table
+
+
+def buildTables():
+    ''' Computes the attack tables, returns (knight, king, pawn, rays, between) '''
+    knight = _stepTable(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+    king = _stepTable(RAY_DIRECTIONS)
+    # squares attacked by a pawn of the given colour standing on a square
+    pawn = {"w": _stepTable(((-1, -1), (-1, 1))), "b": _stepTable(((1, -1), (1, 1)))}
+
+    # rays[direction][square]: every square from square to the edge of the board, square excluded
+    rays = []
+    for dr, dc in RAY_DIRECTIONS:
+        table = []
+        for sq in range(64):
+            r, c = divmod(sq, 8)
+            bb = 0
+            r, c = r + dr, c + dc
+            while _onBoard(r, c):
+                bb |= 1 << (r * 8 + c)
+                r, c = r + dr, c + dc
+            table.append(bb)
+        rays.append(table)
+
+    # between[a][b]: squares strictly between a and b when they share a line, otherwise 0
+    between = [[0] * 64 for _ in range(64)]
+    for d in range(8):
+        for sq in range(64):
+            ray = rays[d][sq]
+            bb = ray
+            while bb:
+                target = (bb & -bb).bit_length() - 1
+                between[sq][target] = ray & ~rays[d][target] & ~(1 << target)
+                bb &= bb - 1
+    return knight, king, pawn, rays, between
+
+
+def loadTables():
+    '''
+    Attack tables from the marshal cache in __pycache__, building and caching them when it is
+    missing or unreadable. Loading is about 30x faster than building, which matters for short-lived
+    worker processes. Like .pyc files, the cache is not written under PYTHONDONTWRITEBYTECODE.
+    '''
+    try:
+        with open(TABLE_CACHE, "rb") as f:
+            tables = marshal.loads(f.read())  # marshal.load(f) reads the file in tiny pieces, ~50x slower
+        if isinstance(tables, tuple) and len(tables) == 5:
+            return tables
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    tables = buildTables()
+    if not sys.dont_write_bytecode:
+        try:
+            os.makedirs(os.path.dirname(TABLE_CACHE), exist_ok=True)
+            temp = "%s.%d.tmp" % (TABLE_CACHE, os.getpid())
+            with open(temp, "wb") as f:
+                marshal.dump(tables, f)
+            os.replace(temp, TABLE_CACHE)  # concurrent workers never see a half written file
+        except OSError:
+            pass
+    return tables
+
+
+# bump TABLE_VERSION whenever buildTables changes so stale caches are ignored
+TABLE_VERSION = 1
+TABLE_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__", "bitboard_tables.v%d.marshal" % TABLE_VERSION)
+KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, RAYS, BETWEEN = loadTables()
+
+
+def rayAttacks(direction, sq, occupied):
+    ''' Squares a slider on sq attacks along one ray, stopping at (and including) the first blocker '''
+    ray = RAYS[direction][sq]
+    blockers = ray & occupied
+    if blockers:
+        if RAY_INCREASING[direction]:
+            blocker = (blockers & -blockers).bit_length() - 1
+        else:
+            blocker = blockers.bit_length() - 1
+        ray ^= RAYS[direction][blocker]
+    return ray
+
+
+def _relevantMask(sq, group):
+    ''' Squares of the rays of group whose occupancy can change a slider's attacks, the edge square of each ray left out '''
+    mask = 0
+    for d in group:
+        ray = RAYS[d][sq]
+        if ray:
+            edge = ray.bit_length() - 1 if RAY_INCREASING[d] else (ray & -ray).bit_length() - 1
+            mask |= ray ^ (1 << edge)
+    return mask
+
+
+# Slider attacks by square and the occupancy of its relevant squares, filled in as positions
+# come up: one dict lookup replaces four ray scans. At most 102400 rook and 5248 bishop entries.
+ROOK_MASKS = [_relevantMask(sq, ORTHOGONAL) for sq in range(64)]
+BISHOP_MASKS = [_relevantMask(sq, DIAGONAL) for sq in range(64)]
+ROOK_TABLE = [{} for _ in range(64)]
+BISHOP_TABLE = [{} for _ in range(64)]
+
+
+def rookAttacks(sq, occupied):
+    key = occupied & ROOK_MASKS[sq]
+    attacks = ROOK_TABLE[sq].get(key)
+    if attacks is None:
+        attacks = ROOK_TABLE[sq][key] = rayAttacks(0, sq, key) | rayAttacks(1, sq, key) | rayAttacks(2, sq, key) | rayAttacks(3, sq, key)
+    return attacks
+
+
+def bishopAttacks(sq, occupied):
+    key = occupied & BISHOP_MASKS[sq]
+    attacks = BISHOP_TABLE[sq].get(key)
+    if attacks is None:
+        attacks = BISHOP_TABLE[sq][key] = rayAttacks(4, sq, key) | rayAttacks(5, sq, key) | rayAttacks(6, sq, key) | rayAttacks(7, sq, key)
+    return attacks
+
+
+# Moves are immutable, so the generator hands out the same objects again instead of building new
+# ones at every node: the quiet moves of a piece by its square and set of empty target squares,
+# and single moves by piece moved, piece captured ("--" for none) and moveID. En passant and
+# castling moves are rare and always built.
+QUIET_MOVES = {piece: [{} for _ in range(64)] for piece in PIECES}
+QUIET_CACHE_LIMIT = 4096  # target sets kept per piece and square, a bound for long-running processes
+MOVE_TABLE = {piece: {} for piece in PIECES}
+
+
+def squares(bb):
+    ''' Yields the square number of every set bit '''
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+class BitboardGameState(GameState):
+    '''
+    GameState backed by twelve piece bitboards plus per-colour and total occupancy.
+    makeMove/undoMove update the bitboards alongside the 8x8 board, and move generation,
+    check and attack detection work purely on the bitboards.
+    '''
+    def __init__(self):
+        GameState.__init__(self)
+        self.loadBitboards()
+
+
+    def loadBitboards(self):
+        ''' Rebuilds every bitboard from self.board '''
+        self.bitboards = dict.fromkeys(PIECES, 0)
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    self.bitboards[piece] |= 1 << (r * 8 + c)
+        self.colorOccupancy = {"w": 0, "b": 0}
+        for piece, bb in self.bitboards.items():
+            self.colorOccupancy[piece[0]] |= bb
+        self.occupied = self.colorOccupancy["w"] | self.colorOccupancy["b"]
+
+
+    def loadFen(self, fen):
+        GameState.loadFen(self, fen)
+        self.loadBitboards()
+
+
+    def togglePiece(self, piece, sq):
+        bit = 1 << sq
+        self.bitboards[piece] ^= bit
+        self.colorOccupancy[piece[0]] ^= bit
+        self.occupied ^= bit
+
+
+    def toggleMove(self, move):
+        # every change a move makes is an xor, so the same call applies and reverts it
+        bb = self.bitboards
+        start = move.startRow * 8 + move.startCol
+        end = move.endRow * 8 + move.endCol
+        moved = move.pieceMoved
+        ownBits = (1 << start) | (1 << end)
+        bb[moved] ^= 1 << start
+        if move.isPawnPromotion:
+            bb[moved[0] + 'Q'] ^= 1 << end
+        else:
+            bb[moved] ^= 1 << end
+        captured = move.pieceCaptured
+        if captured != "--":
+            bit = 1 << (move.startRow * 8 + move.endCol) if move.isEnpassantmove else 1 << end
+            bb[captured] ^= bit
+            self.colorOccupancy[captured[0]] ^= bit
+        if move.iscastlemove:
+            if move.endCol - move.startCol == 2:
+                rookBits = (1 << (move.endRow * 8 + 7)) | (1 << (end - 1))
+            else:
+                rookBits = (1 << (move.endRow * 8)) | (1 << (end + 1))
+            bb[moved[0] + 'R'] ^= rookBits
+            ownBits |= rookBits
+        colorOccupancy = self.colorOccupancy
+        colorOccupancy[moved[0]] ^= ownBits
+        self.occupied = colorOccupancy["w"] | colorOccupancy["b"]
+
+
+    def makeMove(self, move):
+        GameState.makeMove(self, move)
+        self.toggleMove(move)
+
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog[-1]
+            GameState.undoMove(self)
+            self.toggleMove(move)
+
+
+    def hasPieces(self, color):
+        bb = self.bitboards
+        return (bb[color + 'N'] | bb[color + 'B'] | bb[color + 'R'] | bb[color + 'Q']) != 0
+
+
+    def hasPiece(self, piece):
+        return self.bitboards[piece] != 0
+
+
+    def attackersTo(self, sq, color, occupied):
+        ''' Bitboard of color's pieces attacking sq, with sliders blocked by occupied '''
+        bb = self.bitboards
+        queens = bb[color + 'Q']
+        return ((KNIGHT_ATTACKS[sq] & bb[color + 'N'])
+                | (KING_ATTACKS[sq] & bb[color + 'K'])
+                | (PAWN_ATTACKS["b" if color == "w" else "w"][sq] & bb[color + 'p'])
+                | (rookAttacks(sq, occupied) & (bb[color + 'R'] | queens))
+                | (bishopAttacks(sq, occupied) & (bb[color + 'B'] | queens)))
+
+
+    def attackedSquares(self, color, occupied):
+        ''' Every square attacked by color '''
+        bb = self.bitboards
+        attacks = 0
+        pawns = bb[color + 'p']
+        if color == "w":
+            attacks |= ((pawns & ~FILE_A) >> 9) | ((pawns & ~FILE_H) >> 7)
+        else:
+            attacks |= ((pawns & ~FILE_A) << 7) | ((pawns & ~FILE_H) << 9)
+        for sq in squares(bb[color + 'N']):
+            attacks |= KNIGHT_ATTACKS[sq]
+        for sq in squares(bb[color + 'K']):
+            attacks |= KING_ATTACKS[sq]
+        queens = bb[color + 'Q']
+        for sq in squares(bb[color + 'R'] | queens):
+            attacks |= rookAttacks(sq, occupied)
+        for sq in squares(bb[color + 'B'] | queens):
+            attacks |= bishopAttacks(sq, occupied)
+        return attacks & FULL
+
+
+    def staticExchange(self, move, values):
+        '''
+        Same as GameState.staticExchange. Both sides' attackers are found once, and when a piece
+        comes off only the ray it stood on is looked at again for a slider behind it.
+        '''
+        bb = self.bitboards
+        end = move.endRow * 8 + move.endCol
+        occupied = self.occupied ^ (1 << (move.startRow * 8 + move.startCol))
+        if move.isEnpassantmove:
+            occupied ^= 1 << (move.startRow * 8 + move.endCol)
+        diagonal = bb["wB"] | bb["bB"] | bb["wQ"] | bb["bQ"]
+        orthogonal = bb["wR"] | bb["bR"] | bb["wQ"] | bb["bQ"]
+        attackers = ((KNIGHT_ATTACKS[end] & (bb["wN"] | bb["bN"]))
+                     | (KING_ATTACKS[end] & (bb["wK"] | bb["bK"]))
+                     | (PAWN_ATTACKS["b"][end] & bb["wp"]) | (PAWN_ATTACKS["w"][end] & bb["bp"])
+                     | (rookAttacks(end, occupied) & orthogonal)
+                     | (bishopAttacks(end, occupied) & diagonal)) & occupied
+        gain = [values[move.pieceCaptured[1]] if move.pieceCaptured != "--" else 0]
+        onSquare = values[move.pieceMoved[1]]
+        if move.isPawnPromotion:
+            gain[0] += values["Q"] - values["p"]
+            onSquare = values["Q"]
+        color = "b" if move.pieceMoved[0] == "w" else "w"
+        while True:
+            own = attackers & self.colorOccupancy[color]
+            if not own:
+                break
+            for kind in "pNBRQK":
+                found = own & bb[color + kind]
+                if found:
+                    break
+            bit = found & -found
+            gain.append(onSquare - gain[-1])
+            occupied ^= bit
+            attackers ^= bit
+            if kind != "N":
+                for d in range(8):
+                    if RAYS[d][end] & bit:
+                        attackers |= rayAttacks(d, end, occupied) & (orthogonal if d < 4 else diagonal) & occupied
+                        break
+            onSquare = values[kind]
+            color = "b" if color == "w" else "w"
+        for i in range(len(gain) - 1, 0, -1):
+            gain[i - 1] = -max(-gain[i - 1], gain[i])
+        return gain[0]
+
+
+    def isSquareAttacked(self, r, c, attackerColor):
+        return self.attackersTo(r * 8 + c, attackerColor, self.occupied) != 0
+
+
+    def inCheck(self):
+        ally = "w" if self.whiteToMove else "b"
+        kingSq = self.bitboards[ally + 'K'].bit_length() - 1
+        return self.attackersTo(kingSq, "b" if ally == "w" else "w", self.occupied) != 0
+
+
+    def pinnedPieces(self, kingSq, ally, enemy):
+        ''' Maps each of ally's pinned pieces to the line it may still move along '''
+        pins = {}
+        bb = self.bitboards
+        occupied = self.occupied
+        queens = bb[enemy + 'Q']
+        for directionGroup, sliders in ((ORTHOGONAL, bb[enemy + 'R'] | queens), (DIAGONAL, bb[enemy + 'B'] | queens)):
+            if not sliders:
+                continue
+            for d in directionGroup:
+                ray = RAYS[d][kingSq]
+                if not ray & sliders:
+                    continue
+                blockers = ray & occupied
+                if RAY_INCREASING[d]:
+                    first = (blockers & -blockers).bit_length() - 1
+                else:
+                    first = blockers.bit_length() - 1
+                if not (1 << first) & self.colorOccupancy[ally]:
+                    continue
+                beyond = RAYS[d][first] & occupied
+                if not beyond:
+                    continue
+                if RAY_INCREASING[d]:
+                    second = (beyond & -beyond).bit_length() - 1
+                else:
+                    second = beyond.bit_length() - 1
+                if (1 << second) & sliders:
+                    pins[first] = BETWEEN[kingSq][second] | (1 << second)
+        return pins
+
+
+    def getValidMoves(self):
+        moves, checkers = self.generateMoves(False)
+        self.checkmate = len(moves) == 0 and checkers != 0
+        self.stalemate = len(moves) == 0 and checkers == 0
+        return moves
+
+
+    def getCaptureMoves(self):
+        return self.generateMoves(True)[0]
+
+
+    def generateMoves(self, capturesOnly):
+        '''
+        Legal moves, or only captures and promotions when capturesOnly is set.
+        Returns (moves, bitboard of pieces giving check).
+        '''
+        ally, enemy = ("w", "b") if self.whiteToMove else ("b", "w")
+        bb = self.bitboards
+        board = self.board
+        own = self.colorOccupancy[ally]
+        theirs = self.colorOccupancy[enemy]
+        occupied = self.occupied
+        kingSq = bb[ally + 'K'].bit_length() - 1
+        kingRow, kingCol = divmod(kingSq, 8)
+        checkers = self.attackersTo(kingSq, enemy, occupied)
+        moves = []
+        addMoves = self.addMoves
+
+        # king moves, looking through the king so it cannot step back along a checking ray
+        danger = self.attackedSquares(enemy, occupied & ~(1 << kingSq))
+        addMoves(moves, kingSq, KING_ATTACKS[kingSq] & (theirs if capturesOnly else ~own) & ~danger, ally + 'K')
+
+        if checkers & (checkers - 1):  # double check, only the king can move
+            return moves, checkers
+
+        if checkers:
+            checkerSq = checkers.bit_length() - 1
+            checkMask = checkers | BETWEEN[kingSq][checkerSq]
+        else:
+            checkMask = FULL
+        pins = self.pinnedPieces(kingSq, ally, enemy)
+        targets = (theirs if capturesOnly else ~own) & checkMask
+        promotionRow = 0 if ally == "w" else 7
+
+        # knights, a pinned knight can never move
+        piece = ally + 'N'
+        for sq in squares(bb[piece]):
+            if sq not in pins:
+                addMoves(moves, sq, KNIGHT_ATTACKS[sq] & targets, piece)
+        for kind in "BRQ":
+            piece = ally + kind
+            for sq in squares(bb[piece]):
+                if kind == "B":
+                    attacks = bishopAttacks(sq, occupied)
+                elif kind == "R":
+                    attacks = rookAttacks(sq, occupied)
+                else:
+                    attacks = bishopAttacks(sq, occupied) | rookAttacks(sq, occupied)
+                addMoves(moves, sq, attacks & targets & pins.get(sq, FULL), piece)
+
+        # pawns: the unpinned ones a whole set at a time, pinned ones one by one
+        forward = -8 if ally == "w" else 8
+        startRow = 6 if ally == "w" else 1
+        piece = ally + 'p'
+        pawns = bb[piece]
+        pinned = 0
+        for sq in pins:
+            pinned |= 1 << sq
+        free = pawns & ~pinned
+        empty = ~occupied & FULL
+        if ally == "w":
+            single = (free >> 8) & empty
+            double = ((single & ROW_5) >> 8) & empty
+            left = ((free & ~FILE_A) >> 9) & theirs
+            right = ((free & ~FILE_H) >> 7) & theirs
+            promotions = ROW_0
+        else:
+            single = (free << 8) & empty
+            double = ((single & ROW_2) << 8) & empty
+            left = ((free & ~FILE_A) << 7) & theirs
+            right = ((free & ~FILE_H) << 9) & theirs
+            promotions = ROW_7
+        if capturesOnly:
+            single &= promotions
+            double = 0
+        addPawnMoves = self.addPawnMoves
+        addPawnMoves(moves, single & checkMask, -forward, piece)
+        addPawnMoves(moves, double & checkMask, -2 * forward, piece)
+        addPawnMoves(moves, left & checkMask, 9 if ally == "w" else -7, piece)
+        addPawnMoves(moves, right & checkMask, 7 if ally == "w" else -9, piece)
+        for sq in squares(pawns & pinned):
+            mask = checkMask & pins[sq]
+            pawnTargets = PAWN_ATTACKS[ally][sq] & theirs
+            one = sq + forward
+            if not (1 << one) & occupied:
+                if not capturesOnly or one >> 3 == promotionRow:
+                    pawnTargets |= 1 << one
+                two = one + forward
+                if not capturesOnly and sq >> 3 == startRow and not (1 << two) & occupied:
+                    pawnTargets |= 1 << two
+            addMoves(moves, sq, pawnTargets & mask, piece)
+        epSq = self.enpassantSquare
+        if epSq >= 0:
+            for sq in squares(PAWN_ATTACKS[enemy][epSq] & pawns):
+                if self.isEnpassantSafe(sq, epSq, kingSq, ally, enemy):
+                    moves.append(Move.fromSquares(sq, epSq, board, isEnpassantmove=True))
+
+        if not checkers and not capturesOnly:
+            self.getCastleMoves(kingRow, kingCol, moves, danger)
+        return moves, checkers
+
+
+    def addMoves(self, moves, sq, targets, piece):
+        ''' Appends the moves of piece from sq to every square of targets, from the move caches '''
+        board = self.board
+        quiet = targets & ~self.occupied
+        if quiet:
+            byTargets = QUIET_MOVES[piece][sq]
+            found = byTargets.get(quiet)
+            if found is None:
+                found = tuple(Move.fromSquares(sq, to, board) for to in squares(quiet))
+                if len(byTargets) < QUIET_CACHE_LIMIT:
+                    byTargets[quiet] = found
+            moves.extend(found)
+        captures = targets ^ quiet
+        if captures:
+            cache = MOVE_TABLE[piece]
+            base = sq << 6
+            while captures:
+                low = captures & -captures
+                captures ^= low
+                to = low.bit_length() - 1
+                captured = board[to >> 3][to & 7]
+                byID = cache.get(captured)
+                if byID is None:
+                    byID = cache[captured] = [None] * 4096
+                move = byID[base | to]
+                if move is None:
+                    move = byID[base | to] = Move.fromSquares(sq, to, board)
+                moves.append(move)
+
+
+    def addPawnMoves(self, moves, targets, delta, piece):
+        ''' Appends the pawn move to every square of targets from the square delta away, from the move cache '''
+        board = self.board
+        cache = MOVE_TABLE[piece]
+        while targets:
+            low = targets & -targets
+            targets ^= low
+            to = low.bit_length() - 1
+            captured = board[to >> 3][to & 7]
+            byID = cache.get(captured)
+            if byID is None:
+                byID = cache[captured] = [None] * 4096
+            moveID = (to + delta) << 6 | to
+            move = byID[moveID]
+            if move is None:
+                move = byID[moveID] = Move.fromSquares(to + delta, to, board)
+            moves.append(move)
+
+
+    def isEnpassantSafe(self, fromSq, epSq, kingSq, ally, enemy):
+        # two pawns leave the rank at once, so recheck the king on the resulting occupancy
+        capturedSq = (fromSq // 8) * 8 + epSq % 8
+        occupied = (self.occupied ^ (1 << fromSq) ^ (1 << capturedSq)) | (1 << epSq)
+        bb = self.bitboards
+        queens = bb[enemy + 'Q']
+        if rookAttacks(kingSq, occupied) & (bb[enemy + 'R'] | queens):
+            return False
+        if bishopAttacks(kingSq, occupied) & (bb[enemy + 'B'] | queens):
+            return False
+        if KNIGHT_ATTACKS[kingSq] & bb[enemy + 'N']:
+            return False
+        # a checking pawn is only dealt with if it is the one captured
+        return not (PAWN_ATTACKS[ally][kingSq] & bb[enemy + 'p'] & ~(1 << capturedSq))
+
+
+    def getCastleMoves(self, r, c, moves, danger=None):
+        if danger is None:
+            enemy = "b" if self.whiteToMove else "w"
+            danger = self.attackedSquares(enemy, self.occupied)
+        kingSq = r * 8 + c
+        if self.castleRights & (WKS if self.whiteToMove else BKS):
+            path = (1 << (kingSq + 1)) | (1 << (kingSq + 2))
+            if not path & self.occupied and not path & danger:
+                moves.append(Move((r, c), (r, c + 2), self.board, iscastlemove=True))
+        if self.castleRights & (WQS if self.whiteToMove else BQS):
+            empty = (1 << (kingSq - 1)) | (1 << (kingSq - 2)) | (1 << (kingSq - 3))
+            safe = (1 << (kingSq - 1)) | (1 << (kingSq - 2))
+            if not empty & self.occupied and not safe & danger:
+                moves.append(Move((r, c), (r, c - 2), self.board, iscastlemove=True))
@@ -1,4 +1,43 @@
 # Chess Engine: Stores all info about current state of a chess game, stores the game log
+import random
+
+# Zobrist keys: one random 64-bit number per (piece, square), plus keys for side to move,
+# castling rights and the en passant file. Seeded so a position hashes the same in every run.
+_zobristRandom = random.Random(20240101)
+zobristPieces = {piece: [_zobristRandom.getrandbits(64) for _ in range(64)]
+                 for piece in ("wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK")}
+zobristBlackToMove = _zobristRandom.getrandbits(64)
+zobristCastleKeys = [_zobristRandom.getrandbits(64) for _ in range(4)]  # wks, bks, wqs, bqs
+zobristEnpassant = [_zobristRandom.getrandbits(64) for _ in range(8)]  # one per file
+# xor of the castle keys for every combination of rights, indexed by the castling rights mask
+zobristCastling = [0] * 16
+for _mask in range(16):
+    for _bit in range(4):
+        if _mask & (1 << _bit):
+            zobristCastling[_mask] ^= zobristCastleKeys[_bit]
+
+# castling rights are a 4-bit mask in the order of zobristCastleKeys
+WKS, BKS, WQS, BQS = 1, 2, 4, 8
+# rights still held after a move from or to each square: moving a king or a rook, or capturing a rook, drops them
+castleRightsKept = [WKS | BKS | WQS | BQS] * 64
+castleRightsKept[0] = WKS | BKS | WQS  # a8
+castleRightsKept[7] = WKS | WQS | BQS  # h8
+castleRightsKept[4] = WKS | WQS  # e8
+castleRightsKept[56] = WKS | BKS | BQS  # a1
+castleRightsKept[63] = BKS | WQS | BQS  # h1
+castleRightsKept[60] = BKS | BQS  # e1
+
+# makeMove saves the state a move cannot restore by itself on a preallocated stack, STATE_SIZE
+# slots per ply: castling rights, en passant square, halfmove clock, Zobrist hash and pawn hash
+STATE_SIZE = 5
+STATE_PLIES = 256  # initial capacity, doubled when a game gets longer
+
+
+# ray directions, orthogonal first then diagonal
+directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+knightOffsets = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+fenPieces = {"p": "p", "n": "N", "b": "B", "r": "R", "q": "Q", "k": "K"}
+
 
 class GameState():
     ''' Defines the board, an 8x8 2D list where each element is two characters -- represents an empty square '''
@@ -21,12 +60,198 @@ class GameState():
         self.blackKingLocation = (0,4)
         self.checkmate = False
         self.stalemate = False
-        self.enpassantPossible = () #coordinates of square where en passent is possible
-        self.enpassantPossibleLog = [self.enpassantPossible]
-        
-        self.currentcastlerights = CastleRights(True,True,True,True)
-        self.castleRightsLog = [CastleRights(self.currentcastlerights.wks,self.currentcastlerights.bks,self.currentcastlerights.wqs,self.currentcastlerights.bqs)]
+        self.enpassantSquare = -1  # row * 8 + col of the square a pawn can take en passant on, -1 if none
+        self.castleRights = WKS | BKS | WQS | BQS
+        self.halfmoveClock = 0  # moves since the last capture or pawn move, for the fifty move rule
+        self.fullmoveNumber = 1  # starts at 1 and goes up after every black move
+
+        self.zobristHash = self.computeHash()  # updated incrementally by makeMove/undoMove
+        self.pawnHash = self.computePawnHash()  # Zobrist key of the pawns alone, for the pawn structure table
+        self.stateStack = [0] * (STATE_SIZE * STATE_PLIES)
+        self.stateTop = 0  # index of the next free slot of stateStack
+
+        # running evaluation sums, only maintained once enableIncrementalEval has been called
+        self.pieceValues = None
+        self.positionValues = None
+        self.materialScore = 0
+        self.positionScore = 0
+
+
+    @classmethod
+    def from_fen(cls, fen):
+        ''' Builds a game state from a FEN string '''
+        gs = cls()
+        gs.loadFen(fen)
+        return gs
+
+
+    def loadFen(self, fen):
+        '''
+        Replaces the position with the one described by fen (piece placement, side to move,
+        castling rights, en passant square and the optional move counters). The move log is cleared.
+        Raises ValueError for FENs that are malformed or describe a position the engine cannot play:
+        not exactly one king per side, pawns on the first or last rank, an en passant square without
+        the pawn that just made the double push, or the side that just moved left in check.
+        '''
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("FEN needs at least 4 fields: " + fen)
+        rows = fields[0].split("/")
+        if len(rows) != 8:
+            raise ValueError("FEN board needs 8 ranks: " + fen)
+        if fields[1] not in ("w", "b"):
+            raise ValueError("FEN side to move must be w or b: " + fen)
+        if fields[2] != "-" and (not fields[2] or any(ch not in "KQkq" for ch in fields[2])):
+            raise ValueError("Bad castling rights in FEN: " + fen)
+        board = []
+        for r, rank in enumerate(rows):
+            row = []
+            for ch in rank:
+                if ch.isdigit():
+                    row.extend(["--"] * int(ch))
+                elif ch.lower() in fenPieces:
+                    piece = ("w" if ch.isupper() else "b") + fenPieces[ch.lower()]
+                    if piece == "wK":
+                        self.whiteKingLocation = (r, len(row))
+                    elif piece == "bK":
+                        self.blackKingLocation = (r, len(row))
+                    row.append(piece)
+                else:
+                    raise ValueError("Bad piece " + repr(ch) + " in FEN: " + fen)
+            if len(row) != 8:
+                raise ValueError("FEN rank " + rank + " is not 8 squares long")
+            board.append(row)
+        for color in "wb":
+            kings = sum(row.count(color + "K") for row in board)
+            if kings != 1:
+                raise ValueError("FEN has %d %s kings: %s" % (kings, "white" if color == "w" else "black", fen))
+        if "wp" in board[0] + board[7] or "bp" in board[0] + board[7]:
+            raise ValueError("FEN has a pawn on the first or last rank: " + fen)
+        whiteToMove = fields[1] == "w"
+        enpassant = fields[3]
+        if enpassant == "-":
+            enpassantSquare = -1
+        else:
+            # only right after a double push: the pawn that made it stands in front of the square
+            row, pawn = (2, "bp") if whiteToMove else (5, "wp")
+            pawnRow = row + 1 if whiteToMove else row - 1
+            if len(enpassant) != 2 or Move.ranksToRows.get(enpassant[1]) != row or enpassant[0] not in Move.filesToCol \
+                    or board[row][Move.filesToCol[enpassant[0]]] != "--" or board[pawnRow][Move.filesToCol[enpassant[0]]] != pawn:
+                raise ValueError("Bad en passant square in FEN: " + fen)
+            enpassantSquare = row * 8 + Move.filesToCol[enpassant[0]]
+        self.board = board
+        self.whiteToMove = whiteToMove
+        waiting = self.blackKingLocation if whiteToMove else self.whiteKingLocation
+        # the mailbox test, subclasses only rebuild their own structures after loadFen
+        if GameState.isSquareAttacked(self, waiting[0], waiting[1], fields[1]):
+            raise ValueError("FEN side not to move is in check: " + fen)
+        castling = fields[2]
+        # rights whose king or rook has left its square are dropped, many FENs just say KQkq
+        self.castleRights = ((WKS if "K" in castling and board[7][4] == "wK" and board[7][7] == "wR" else 0)
+                             | (BKS if "k" in castling and board[0][4] == "bK" and board[0][7] == "bR" else 0)
+                             | (WQS if "Q" in castling and board[7][4] == "wK" and board[7][0] == "wR" else 0)
+                             | (BQS if "q" in castling and board[0][4] == "bK" and board[0][0] == "bR" else 0))
+        self.enpassantSquare = enpassantSquare
+        try:
+            self.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+            self.fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("Bad move counters in FEN: " + fen)
+        self.moveLog = []
+        self.checkmate = False
+        self.stalemate = False
+        self.zobristHash = self.computeHash()
+        self.pawnHash = self.computePawnHash()
+        self.stateTop = 0
+        if self.positionValues is not None:
+            self.materialScore, self.positionScore = self.computeEval()
+
+
+    def to_fen(self):
+        ''' FEN string of the position '''
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for square in row:
+                if square == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += square[1].upper() if square[0] == "w" else square[1].lower()
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        rights = self.castleRights
+        castling = ("K" if rights & WKS else "") + ("Q" if rights & WQS else "") + ("k" if rights & BKS else "") + ("q" if rights & BQS else "")
+        if self.enpassantSquare < 0:
+            enpassant = "-"
+        else:
+            enpassant = Move.colsToFiles[self.enpassantSquare & 7] + Move.rowsToRanks[self.enpassantSquare >> 3]
+        return " ".join(("/".join(ranks), "w" if self.whiteToMove else "b", castling or "-", enpassant, str(self.halfmoveClock), str(self.fullmoveNumber)))
+
+
+    def enableIncrementalEval(self, pieceValues, positionValues):
+        '''
+        pieceValues maps each piece ("wN", "bp", ...) to an integer material value and positionValues
+        maps it to 64 integer square bonuses, both signed so white is positive.
+        From now on makeMove/undoMove keep materialScore and positionScore equal to their sums over the board.
+        '''
+        self.pieceValues = pieceValues
+        self.positionValues = positionValues
+        self.materialScore, self.positionScore = self.computeEval()
+
+
+    def computeEval(self):
+        ''' Full rescan of the (material, position) sums '''
+        material = 0
+        position = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    material += self.pieceValues[piece]
+                    position += self.positionValues[piece][r * 8 + c]
+        return material, position
+
+
+    def computeHash(self):
+        '''
+        Computes the Zobrist hash of the position from scratch.
+        makeMove/undoMove keep self.zobristHash up to date, this is only needed after setting up a position.
+        '''
+        h = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    h ^= zobristPieces[piece][r * 8 + c]
+        if not self.whiteToMove:
+            h ^= zobristBlackToMove
+        h ^= zobristCastling[self.castleRights]
+        if self.enpassantSquare >= 0:
+            h ^= zobristEnpassant[self.enpassantSquare & 7]
+        return h
+
+
+    def computePawnHash(self):
+        ''' Xor of the Zobrist keys of every pawn, kept up to date by makeMove/undoMove like zobristHash '''
+        h = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece[1] == "p":
+                    h ^= zobristPieces[piece][r * 8 + c]
+        return h
+
 
+    @property
+    def enpassantPossible(self):
+        ''' (row, col) of the en passant square, () if there is none '''
+        ep = self.enpassantSquare
+        return (ep >> 3, ep & 7) if ep >= 0 else ()
 
     def boardString(self):
         """
@@ -42,6 +267,36 @@ class GameState():
 
     # Update the game state with the given move
     def makeMove(self, move):
+        # save the irreversible state in preallocated slots, so make/undo builds no per-move objects
+        stack = self.stateStack
+        top = self.stateTop
+        if top == len(stack):
+            stack.extend([0] * len(stack))
+        rights = self.castleRights
+        ep = self.enpassantSquare
+        stack[top] = rights
+        stack[top + 1] = ep
+        stack[top + 2] = self.halfmoveClock
+        stack[top + 3] = self.zobristHash
+        stack[top + 4] = self.pawnHash
+        self.stateTop = top + STATE_SIZE
+
+        start = move.startRow * 8 + move.startCol
+        end = move.endRow * 8 + move.endCol
+        h = self.zobristHash ^ zobristBlackToMove ^ zobristCastling[rights]
+        if ep >= 0:
+            h ^= zobristEnpassant[ep & 7]
+        h ^= zobristPieces[move.pieceMoved][start]
+        if move.pieceCaptured != "--":
+            captureSq = move.startRow * 8 + move.endCol if move.isEnpassantmove else end
+            h ^= zobristPieces[move.pieceCaptured][captureSq]
+            if move.pieceCaptured[1] == "p":
+                self.pawnHash ^= zobristPieces[move.pieceCaptured][captureSq]
+        if move.pieceMoved[1] == "p":
+            self.pawnHash ^= zobristPieces[move.pieceMoved][start]
+            if not move.isPawnPromotion:
+                self.pawnHash ^= zobristPieces[move.pieceMoved][end]
+
         self.board[move.startRow][move.startCol] = "--"  # Clear the start square
         self.board[move.endRow][move.endCol] = move.pieceMoved  # Move the piece to the destination
         self.moveLog.append(move)  # Add the move to the move log
@@ -60,9 +315,10 @@ class GameState():
             self.board[move.startRow][move.endCol] = "--" #pawn captured
 
         if move.pieceMoved[1] == "p" and abs(move.startRow - move.endRow) == 2: #only on two square pan advanced
-            self.enpassantPossible = ((move.endRow + move.startRow)//2,move.endCol)
+            self.enpassantSquare = (start + end) >> 1
+            h ^= zobristEnpassant[move.endCol]
         else:
-            self.enpassantPossible = ()
+            self.enpassantSquare = -1
 
         #castle move 
         if move.iscastlemove:
@@ -72,48 +328,52 @@ class GameState():
             else: # queensidde castle
                 self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-2]
                 self.board[move.endRow][move.endCol-2] = '--'
-        
-        self.enpassantPossibleLog.append(self.enpassantPossible)
-        self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currentcastlerights.wks,self.currentcastlerights.bks,self.currentcastlerights.wqs,self.currentcastlerights.bqs))
+            rook = move.pieceMoved[0] + 'R'
+            if move.endCol - move.startCol == 2:
+                h ^= zobristPieces[rook][move.endRow * 8 + 7] ^ zobristPieces[rook][move.endRow * 8 + move.endCol - 1]
+            else:
+                h ^= zobristPieces[rook][move.endRow * 8] ^ zobristPieces[rook][move.endRow * 8 + move.endCol + 1]
 
+        if move.pieceMoved[1] == "p" or move.pieceCaptured != "--":
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if move.pieceMoved[0] == "b":
+            self.fullmoveNumber += 1
+        rights &= castleRightsKept[start] & castleRightsKept[end]
+        self.castleRights = rights
 
+        placed = self.board[move.endRow][move.endCol]  # piece as placed, after promotion
+        h ^= zobristPieces[placed][end]
+        h ^= zobristCastling[rights]
+        self.zobristHash = h
 
+        if self.positionValues is not None:
+            material, position = self.evalDelta(move)
+            self.materialScore += material
+            self.positionScore += position
+
+
+    def evalDelta(self, move):
+        ''' Change move makes to the (material, position) sums '''
+        values = self.positionValues
+        start = move.startRow * 8 + move.startCol
+        end = move.endRow * 8 + move.endCol
+        placed = move.pieceMoved[0] + 'Q' if move.isPawnPromotion else move.pieceMoved
+        material = self.pieceValues[placed] - self.pieceValues[move.pieceMoved]
+        position = values[placed][end] - values[move.pieceMoved][start]
+        if move.pieceCaptured != "--":
+            material -= self.pieceValues[move.pieceCaptured]
+            position -= values[move.pieceCaptured][move.startRow * 8 + move.endCol if move.isEnpassantmove else end]
+        if move.iscastlemove:
+            rook = move.pieceMoved[0] + 'R'
+            if move.endCol - move.startCol == 2:
+                position += values[rook][end - 1] - values[rook][move.endRow * 8 + 7]
+            else:
+                position += values[rook][end + 1] - values[rook][move.endRow * 8]
+        return material, position
 
-    def updateCastleRights(self,move):
-        if move.pieceMoved == "wK":
-            self.currentcastlerights.wks = False
-            self.currentcastlerights.wqs = False
-        elif move.pieceMoved == "bK":
-            self.currentcastlerights.bks = False
-            self.currentcastlerights.bqs = False
-        elif move.pieceMoved == "wR":
-            if move.startRow == 7:
-                if move.startCol == 0:
-                    self.currentcastlerights.wqs  = False
-                elif move.startCol == 7:
-                    self.currentcastlerights.wks = False
-        elif move.pieceMoved == "bR":
-            if move.startRow == 0:
-                if move.startCol == 0:
-                    self.currentcastlerights.bqs  = False
-                elif move.startCol == 7:
-                    self.currentcastlerights.bks = False
-        
-        if move.pieceCaptured == 'wR':
-            if move.endRow == 7:
-                if move.endCol == 0:
-                    self.currentcastlerights.wqs = False
-                elif move.endCol == 7:
-                    self.currentcastlerights.wks = False
-        elif move.pieceCaptured == 'bR':
-            if move.endRow == 0:
-                if move.endCol == 0:
-                    self.currentcastlerights.bqs = False
-                elif move.endCol == 7:
-                    self.currentcastlerights.bks = False
 
-            
 
 
     def undoMove(self):
@@ -130,16 +390,17 @@ class GameState():
             if move.isEnpassantmove:
                 self.board[move.endRow][move.endCol] = "--"
                 self.board[move.startRow][move.endCol] = move.pieceCaptured
-                self.enpassantPossible = (move.endRow,move.endCol)
-            #undo a 2 sqaure pawn advance
-            if move.pieceMoved[1] =="p" and abs(move.startRow-move.endRow)==2:
-                self.enpassantPossible = ()
-            self.enpassantPossibleLog.pop()
-            self.enpassantPossible = self.enpassantPossibleLog[-1]
-            #undo castle rights 
-            self.castleRightsLog.pop()
-            newRights = self.castleRightsLog[-1]
-            self.currentcastlerights = CastleRights(newRights.wks,newRights.bks,newRights.wqs,newRights.bqs)
+            #castle rights, en passant square, halfmove clock and hash from before the move
+            stack = self.stateStack
+            top = self.stateTop - STATE_SIZE
+            self.stateTop = top
+            self.castleRights = stack[top]
+            self.enpassantSquare = stack[top + 1]
+            self.halfmoveClock = stack[top + 2]
+            self.zobristHash = stack[top + 3]
+            self.pawnHash = stack[top + 4]
+            if move.pieceMoved[0] == "b":
+                self.fullmoveNumber -= 1
             #undo castle move 
             if move.iscastlemove:
                 if move.endCol - move.startCol == 2: #kingside
@@ -148,40 +409,239 @@ class GameState():
                 else:
                     self.board[move.endRow][move.endCol-2]= self.board[move.endRow][move.endCol+1]
                     self.board[move.endRow][move.endCol+1] = '--'
+            if self.positionValues is not None:
+                material, position = self.evalDelta(move)
+                self.materialScore -= material
+                self.positionScore -= position
             self.checkmate = False
-            self.stalemage = False
+            self.stalemate = False
 
 
             
+    def makeNullMove(self):
+        '''
+        Passes the turn without moving, for null move pruning in the search. The null move is not
+        put in moveLog, undoNullMove takes it back once the moves made after it are undone.
+        '''
+        stack = self.stateStack
+        top = self.stateTop
+        if top == len(stack):
+            stack.extend([0] * len(stack))
+        stack[top] = self.castleRights
+        stack[top + 1] = self.enpassantSquare
+        stack[top + 2] = self.halfmoveClock
+        stack[top + 3] = self.zobristHash
+        self.stateTop = top + STATE_SIZE
+        h = self.zobristHash ^ zobristBlackToMove
+        if self.enpassantSquare >= 0:
+            h ^= zobristEnpassant[self.enpassantSquare & 7]
+        self.zobristHash = h
+        self.enpassantSquare = -1
+        self.whiteToMove = not self.whiteToMove
+
+
+    def undoNullMove(self):
+        self.whiteToMove = not self.whiteToMove
+        top = self.stateTop - STATE_SIZE
+        self.stateTop = top
+        self.enpassantSquare = self.stateStack[top + 1]
+        self.zobristHash = self.stateStack[top + 3]
+        self.checkmate = False
+        self.stalemate = False
+
+
+    def hasPieces(self, color):
+        ''' True if color has a knight, bishop, rook or queen, positions without one are prone to zugzwang '''
+        for row in self.board:
+            for square in row:
+                if square[0] == color and square[1] in "NBRQ":
+                    return True
+        return False
+
+
+    def hasPiece(self, piece):
+        ''' True if piece ("bQ", ...) is on the board '''
+        for row in self.board:
+            if piece in row:
+                return True
+        return False
+
+
     def getValidMoves(self):
-        tempEnpassantPossilbe = self.enpassantPossible
-        tempCastlerights = CastleRights(self.currentcastlerights.wks,self.currentcastlerights.bks,self.currentcastlerights.wqs,self.currentcastlerights.bqs)
-        moves = self.getAllMoves()
-        #make each move 
-        if self.whiteToMove:
-            self.getCastleMoves(self.whiteKingLocation[0],self.whiteKingLocation[1],moves)
+        '''
+        Legal moves for the side to move. Checkers and pinned pieces are found once by scanning
+        out from the king, so moves are legalised with cheap square tests instead of make/undo.
+        '''
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        inCheck, pins, checks = self.checkForPinsAndChecks(kingRow, kingCol)
+        moves = []
+        if len(checks) > 1:  # double check, only the king can move
+            self.getKingMoves(kingRow, kingCol, moves)
         else:
-            self.getCastleMoves(self.blackKingLocation[0],self.blackKingLocation[1],moves)
-        for i in range (len(moves)-1,-1,-1):
-            self.makeMove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            if self.inCheck():
-                moves.remove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            self.undoMove()
-        if len(moves)==0:
-            if self.inCheck:
+            self.getAllMoves(moves)
+        legalMoves = self.filterLegalMoves(moves, kingRow, kingCol, pins, checks)
+        if not inCheck:
+            self.getCastleMoves(kingRow, kingCol, legalMoves)
+
+        if len(legalMoves)==0:
+            if inCheck:
                 self.checkmate = True
                 self.stalemate = False
             else:
                 self.stalemate = True
                 self.checkmate = False
+        else:
+            self.checkmate = False
+            self.stalemate = False
+        return legalMoves
+
+
+    def getCaptureMoves(self):
+        '''
+        Legal captures and promotions only, for the quiescence search. Does not touch checkmate/stalemate.
+        '''
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        inCheck, pins, checks = self.checkForPinsAndChecks(kingRow, kingCol)
+        ally, enemy = ("w", "b") if self.whiteToMove else ("b", "w")
+        board = self.board
+        moves = []
+        for r in range(8):
+            for c in range(8):
+                piece = board[r][c]
+                if piece[0] != ally:
+                    continue
+                kind = piece[1]
+                if kind == "p":
+                    dr = -1 if ally == "w" else 1
+                    if board[r + dr][c] == "--" and r + dr in (0, 7):  # promotion push
+                        moves.append(Move((r, c), (r + dr, c), board))
+                    for dc in (-1, 1):
+                        if 0 <= c + dc <= 7:
+                            if board[r + dr][c + dc][0] == enemy:
+                                moves.append(Move((r, c), (r + dr, c + dc), board))
+                            elif (r + dr) * 8 + c + dc == self.enpassantSquare:
+                                moves.append(Move((r, c), (r + dr, c + dc), board, isEnpassantmove=True))
+                elif kind == "N" or kind == "K":
+                    for dr, dc in (knightOffsets if kind == "N" else directions):
+                        i, x = r + dr, c + dc
+                        if 0 <= i <= 7 and 0 <= x <= 7 and board[i][x][0] == enemy:
+                            moves.append(Move((r, c), (i, x), board))
+                else:
+                    rays = directions[:4] if kind == "R" else directions[4:] if kind == "B" else directions
+                    for dr, dc in rays:
+                        i, x = r + dr, c + dc
+                        while 0 <= i <= 7 and 0 <= x <= 7:
+                            if board[i][x] != "--":
+                                if board[i][x][0] == enemy:
+                                    moves.append(Move((r, c), (i, x), board))
+                                break
+                            i += dr
+                            x += dc
+        return self.filterLegalMoves(moves, kingRow, kingCol, pins, checks)
+
+
+    def filterLegalMoves(self, moves, kingRow, kingCol, pins, checks):
+        ''' Keeps the pseudo-legal moves that don't leave the king in check, given the pins and checks found '''
+        validSquares = None
+        if len(checks) == 1:
+            # only capturing the checker or blocking its line gets out of check
+            checkRow, checkCol, dr, dc = checks[0]
+            validSquares = {(checkRow, checkCol)}
+            if self.board[checkRow][checkCol][1] != 'N':
+                i, x = kingRow + dr, kingCol + dc
+                while (i, x) != (checkRow, checkCol):
+                    validSquares.add((i, x))
+                    i += dr
+                    x += dc
+
+        legalMoves = []
+        for move in moves:
+            if move.pieceMoved[1] == 'K':
+                if self.isKingMoveSafe(move):
+                    legalMoves.append(move)
+            elif len(checks) > 1:
+                continue  # double check, only the king can move
+            elif move.isEnpassantmove:
+                if self.isEnpassantLegal(move, kingRow, kingCol):
+                    legalMoves.append(move)
+            else:
+                pin = pins.get((move.startRow, move.startCol))
+                if pin is not None and pin[0] * (move.endCol - move.startCol) != pin[1] * (move.endRow - move.startRow):
+                    continue  # pinned pieces can only slide along the pin
+                if validSquares is not None and (move.endRow, move.endCol) not in validSquares:
+                    continue
+                legalMoves.append(move)
+        return legalMoves
+
+
+    def checkForPinsAndChecks(self, kingRow, kingCol):
+        '''
+        Scans the 8 rays and the knight squares around the king of the side to move.
+        Returns (inCheck, pins, checks): pins maps a pinned piece's square to the ray direction,
+        checks is a list of (row, col, dr, dc) for every piece giving check.
+        '''
+        pins = {}
+        checks = []
+        if self.whiteToMove:
+            enemyColor, allyColor = "b", "w"
+        else:
+            enemyColor, allyColor = "w", "b"
+        board = self.board
+        for j, (dr, dc) in enumerate(directions):
+            possiblePin = None
+            i, x = kingRow + dr, kingCol + dc
+            distance = 1
+            while 0 <= i <= 7 and 0 <= x <= 7:
+                piece = board[i][x]
+                if piece[0] == allyColor:
+                    if possiblePin is None:
+                        possiblePin = (i, x)
+                    else:  # second allied piece on the ray, nothing to pin or check
+                        break
+                elif piece[0] == enemyColor:
+                    kind = piece[1]
+                    # first 4 directions are orthogonal, last 4 diagonal
+                    if (j < 4 and kind in "RQ") or (j >= 4 and kind in "BQ") or \
+                            (distance == 1 and kind == "K") or \
+                            (j >= 4 and distance == 1 and kind == "p" and dr == (-1 if enemyColor == "b" else 1)):
+                        if possiblePin is None:
+                            checks.append((i, x, dr, dc))
+                        else:
+                            pins[possiblePin] = (dr, dc)
+                    break
+                i += dr
+                x += dc
+                distance += 1
+        for dr, dc in knightOffsets:
+            i, x = kingRow + dr, kingCol + dc
+            if 0 <= i <= 7 and 0 <= x <= 7 and board[i][x] == enemyColor + "N":
+                checks.append((i, x, dr, dc))
+        return len(checks) > 0, pins, checks
+
+
+    def isKingMoveSafe(self, move):
+        # take the king off its square so sliders see through it
+        ally = move.pieceMoved
+        self.board[move.startRow][move.startCol] = "--"
+        attacked = self.isSquareAttacked(move.endRow, move.endCol, "b" if ally[0] == "w" else "w")
+        self.board[move.startRow][move.startCol] = ally
+        return not attacked
+
+
+    def isEnpassantLegal(self, move, kingRow, kingCol):
+        # en passant removes two pawns from one rank at once, so just try it on the board
+        board = self.board
+        capturedSquare = board[move.startRow][move.endCol]
+        board[move.startRow][move.startCol] = "--"
+        board[move.startRow][move.endCol] = "--"
+        board[move.endRow][move.endCol] = move.pieceMoved
+        attacked = self.isSquareAttacked(kingRow, kingCol, "b" if self.whiteToMove else "w")
+        board[move.startRow][move.startCol] = move.pieceMoved
+        board[move.startRow][move.endCol] = capturedSquare
+        board[move.endRow][move.endCol] = "--"
+        return not attacked
 
-        self.enpassantPossible = tempEnpassantPossilbe
-        self.currentcastlerights = tempCastlerights
-        return moves
 
-        
     #determine if current player is in check    
     def inCheck(self):
         if self.whiteToMove:
@@ -192,20 +652,109 @@ class GameState():
 
 
     def squareUnderAttack(self,r,c):
-        self.whiteToMove = not self.whiteToMove
-        oppMoves = self.getAllMoves()
-        self.whiteToMove = not self.whiteToMove
-        for move in oppMoves:
-            if move.endRow ==r and move.endCol == c:
+        # attacked by the opponent of the side to move
+        return self.isSquareAttacked(r, c, "b" if self.whiteToMove else "w")
+
+
+    def isSquareAttacked(self, r, c, attackerColor):
+        '''
+        Looks outwards from (r, c) for a piece of attackerColor that attacks it, without generating any moves.
+        '''
+        board = self.board
+        for j, (dr, dc) in enumerate(directions):
+            i, x = r + dr, c + dc
+            distance = 1
+            while 0 <= i <= 7 and 0 <= x <= 7:
+                piece = board[i][x]
+                if piece != "--":
+                    if piece[0] == attackerColor:
+                        kind = piece[1]
+                        if (j < 4 and kind in "RQ") or (j >= 4 and kind in "BQ") or \
+                                (distance == 1 and kind == "K") or \
+                                (j >= 4 and distance == 1 and kind == "p" and dr == (-1 if attackerColor == "b" else 1)):
+                            return True
+                    break
+                i += dr
+                x += dc
+                distance += 1
+        knight = attackerColor + "N"
+        for dr, dc in knightOffsets:
+            i, x = r + dr, c + dc
+            if 0 <= i <= 7 and 0 <= x <= 7 and board[i][x] == knight:
                 return True
-        return False 
-                
+        return False
 
 
-    
+    def staticExchange(self, move, values):
+        '''
+        Static exchange evaluation: the material the capture move wins once both sides have
+        recaptured on its square for as long as it pays, cheapest piece first. values maps each
+        piece letter to its worth, the king's more than all the others together. Pins are ignored
+        and nothing is moved, removed pieces are tracked as a bitmask so sliders behind them join in.
+        '''
+        end = move.endRow * 8 + move.endCol
+        removed = 1 << (move.startRow * 8 + move.startCol)
+        if move.isEnpassantmove:
+            removed |= 1 << (move.startRow * 8 + move.endCol)
+        gain = [values[move.pieceCaptured[1]] if move.pieceCaptured != "--" else 0]
+        onSquare = values[move.pieceMoved[1]]
+        if move.isPawnPromotion:
+            gain[0] += values["Q"] - values["p"]
+            onSquare = values["Q"]
+        color = "b" if move.pieceMoved[0] == "w" else "w"
+        while True:
+            attacker = self.leastValuableAttacker(end, color, removed, values)
+            if attacker is None:
+                break
+            value, sq = attacker
+            gain.append(onSquare - gain[-1])  # for the side recapturing, if the exchange stopped here
+            removed |= 1 << sq
+            onSquare = value
+            color = "b" if color == "w" else "w"
+        # each side may stop recapturing whenever that is better for it
+        for i in range(len(gain) - 1, 0, -1):
+            gain[i - 1] = -max(-gain[i - 1], gain[i])
+        return gain[0]
+
+
+    def leastValuableAttacker(self, sq, color, removed, values):
+        ''' (value, square) of color's cheapest piece attacking sq, squares in the removed bitmask count as empty. None if there is none '''
+        board = self.board
+        r, c = divmod(sq, 8)
+        pawn = color + "p"
+        i = r + (1 if color == "w" else -1)  # white pawns attack from the row below
+        if 0 <= i <= 7:
+            for x in (c - 1, c + 1):
+                if 0 <= x <= 7 and board[i][x] == pawn and not removed >> (i * 8 + x) & 1:
+                    return values["p"], i * 8 + x
+        knight = color + "N"
+        for dr, dc in knightOffsets:
+            i, x = r + dr, c + dc
+            if 0 <= i <= 7 and 0 <= x <= 7 and board[i][x] == knight and not removed >> (i * 8 + x) & 1:
+                return values["N"], i * 8 + x
+        best = None
+        for j, (dr, dc) in enumerate(directions):
+            i, x = r + dr, c + dc
+            distance = 1
+            while 0 <= i <= 7 and 0 <= x <= 7:
+                piece = board[i][x]
+                if piece != "--" and not removed >> (i * 8 + x) & 1:
+                    if piece[0] == color:
+                        kind = piece[1]
+                        if (j < 4 and kind in "RQ") or (j >= 4 and kind in "BQ") or (distance == 1 and kind == "K"):
+                            if best is None or (values[kind], i * 8 + x) < best:
+                                best = (values[kind], i * 8 + x)  # ties go to the lowest square, as with bitboards
+                    break
+                i += dr
+                x += dc
+                distance += 1
+        return best
+                
+
     # all moves not considering checks
-    def getAllMoves(self):
-        moves = []
+    def getAllMoves(self, moves=None):
+        if moves is None:
+            moves = []
         for r in range(len(self.board)):
             for c in range(len(self.board[r])): 
                 turn = self.board[r][c][0]
@@ -225,13 +774,13 @@ class GameState():
             if c-1 >=0:
                 if self.board[r-1][c-1][0] == "b": #black piece is there
                     moves.append(Move((r,c),(r-1,c-1),self.board))
-                elif (r-1,c-1) == self.enpassantPossible:
+                elif (r-1)*8+c-1 == self.enpassantSquare:
                     moves.append(Move((r,c),(r-1,c-1),self.board,isEnpassantmove=True))
 
             if c+1 <=7:
                 if self.board[r-1][c+1][0] == "b":
                     moves.append(Move((r,c),(r-1,c+1),self.board))
-                elif (r-1,c+1) == self.enpassantPossible:
+                elif (r-1)*8+c+1 == self.enpassantSquare:
                     moves.append(Move((r,c),(r-1,c+1),self.board,isEnpassantmove=True))
 
         
@@ -243,13 +792,13 @@ class GameState():
             if c-1 >=0:
                 if self.board[r+1][c-1][0] == "w": #white piece is there
                     moves.append(Move((r,c),(r+1,c-1),self.board))
-                elif (r+1,c-1) == self.enpassantPossible:
+                elif (r+1)*8+c-1 == self.enpassantSquare:
                     moves.append(Move((r,c),(r+1,c-1),self.board,isEnpassantmove=True))
 
             if c+1 <=7:
                 if self.board[r+1][c+1][0] == "w":
                     moves.append(Move((r,c),(r+1,c+1),self.board))
-                elif (r+1,c+1) == self.enpassantPossible:
+                elif (r+1)*8+c+1 == self.enpassantSquare:
                     moves.append(Move((r,c),(r+1,c+1),self.board,isEnpassantmove=True))
 
              
@@ -371,9 +920,9 @@ class GameState():
     def getCastleMoves(self,r,c,moves):
         if self.squareUnderAttack(r,c):
             return 
-        if (self.whiteToMove and self.currentcastlerights.wks) or (not self.whiteToMove and self.currentcastlerights.bks):
+        if self.castleRights & (WKS if self.whiteToMove else BKS):
             self.getKingsideCastleMoves(r,c,moves)
-        if(self.whiteToMove and self.currentcastlerights.wqs) or (not self.whiteToMove and self.currentcastlerights.bqs):
+        if self.castleRights & (WQS if self.whiteToMove else BQS):
             self.getQueensideCastleMoves(r,c,moves)
 
 
@@ -434,16 +983,6 @@ class GameState():
                 if piece == "--" or piece[0] != ally_color:  # Empty square or opponent's piece
                     moves.append(Move((r, c), (new_r, new_c), self.board))
         
-class CastleRights():
-
-    def __init__(self, wks,bks,wqs,bqs):
-        self.wks = wks
-        self.bks = bks
-        self.bqs = bqs
-        self.wqs = wqs
-
-
-
 # Move class handles chess notation and translating moves
 class Move():
 
@@ -453,6 +992,14 @@ class Move():
     filesToCol = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}  # Fixed mapping
     colsToFiles = {v: k for k, v in filesToCol.items()}
 
+    # no per-move attribute dict, the search creates a lot of these
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured",
+                 "isPawnPromotion", "isEnpassantmove", "iscastlemove", "moveID")
+
+    # flag bits above the 12 square bits of a packed move code
+    ENPASSANT_FLAG = 1 << 12
+    CASTLE_FLAG = 1 << 13
+
     def __init__(self, startSq, endSq, board, isEnpassantmove=False, iscastlemove = False):
         self.startRow = startSq[0]
         self.startCol = startSq[1]
@@ -467,14 +1014,45 @@ class Move():
         if self.isEnpassantmove:
             self.pieceCaptured = "wp" if self.pieceMoved == "bp" else "bp"
         self.iscastlemove = iscastlemove
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
-        
+        # start and end square as 0-63 indexes (row * 8 + col) packed into 12 bits
+        self.moveID = (self.startRow * 8 + self.startCol) << 6 | (self.endRow * 8 + self.endCol)
+
+    @classmethod
+    def fromSquares(cls, start, end, board, isEnpassantmove=False, iscastlemove=False):
+        ''' Same as Move() but takes 0-63 square indexes, used by the bitboard generator '''
+        move = cls.__new__(cls)
+        move.startRow = startRow = start >> 3
+        move.startCol = startCol = start & 7
+        move.endRow = endRow = end >> 3
+        move.endCol = endCol = end & 7
+        move.pieceMoved = pieceMoved = board[startRow][startCol]
+        if isEnpassantmove:
+            move.pieceCaptured = "wp" if pieceMoved == "bp" else "bp"
+        else:
+            move.pieceCaptured = board[endRow][endCol]
+        move.isPawnPromotion = pieceMoved[1] == "p" and (endRow == 0 or endRow == 7)
+        move.isEnpassantmove = isEnpassantmove
+        move.iscastlemove = iscastlemove
+        move.moveID = start << 6 | end
+        return move
+
+    @property
+    def code(self):
+        ''' The move as one int: moveID plus the en passant and castle flags '''
+        return self.moveID | (self.ENPASSANT_FLAG if self.isEnpassantmove else 0) | (self.CASTLE_FLAG if self.iscastlemove else 0)
+
+    @classmethod
+    def fromCode(cls, code, board):
+        ''' Rebuilds the move for a packed code on the board it was generated for '''
+        return cls.fromSquares(code >> 6 & 63, code & 63, board,
+                               isEnpassantmove=bool(code & cls.ENPASSANT_FLAG), iscastlemove=bool(code & cls.CASTLE_FLAG))
 
     def __eq__(self,other):
         if isinstance(other,Move):
             return self.moveID == other.moveID
 
-
+    def __repr__(self):
+        return "Move(%s)" % self.getChessNotation()
 
     # Return the move in standard chess notation
     def getChessNotation(self):
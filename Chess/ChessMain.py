@@ -1,5 +1,15 @@
-import pygame as p
-import ChessEngine,SmartMoveFinder
+import os
+import sys
+
+if not __package__:
+    # run as a script (python ChessMain.py), make the package importable so the imports below work
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import Chess
+    __package__ = "Chess"
+
+from . import ChessEngine, SmartMoveFinder, BitboardEngine, OpeningBook, Tablebase
+
+p = None  # pygame, imported by main() so importing this module does not need it
 
 # Constants for game dimensions and FPS
 WIDTH = 500
@@ -10,6 +20,11 @@ DIMENSION = 8
 SQ_SIZE = BOARD_HEIGHT // DIMENSION
 BORDER_WIDTH = 5  # Thickness of the border
 MAX_FPS = 15  # Animations FPS rate
+USE_BITBOARDS = True  # bitboard-backed GameState, False for the plain 8x8 board
+AI_TIME_LIMIT = 2.0  # seconds the AI may think per move
+PONDER = True  # search the human's expected reply while they think
+AVATAR_POSITION = (-178, -165)  # top left of the avatar image, which is larger than the window
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
 images = {}
 
 
@@ -19,38 +34,76 @@ def loadImages():
     pieces = ['wp', 'bp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bR', 'bN', 'bB', 'bK', 'bQ']
     for i in pieces:
         try:
-            images[i] = p.image.load("images/" + i + ".png")
+            images[i] = p.image.load(os.path.join(IMAGE_DIR, i + ".png"))
         except FileNotFoundError:
             print(f"Error: Image {i}.png not found.")
     try:
-        images['avatar'] = p.image.load("images/avatar.png")
+        images['avatar'] = p.image.load(os.path.join(IMAGE_DIR, "avatar.png"))
     except FileNotFoundError:
         print("Error: Image avatar.png not found.")
 
+def newGameState():
+    if USE_BITBOARDS:
+        return BitboardEngine.BitboardGameState()
+    return ChessEngine.GameState()
+
+# Guesses the human's reply from the AI's principal variation and starts searching the position after it,
+# returns (ponder search, guessed move), or (None, None) without a guess
+def startPonder(gs):
+    pv = SmartMoveFinder.getPrincipalVariation(gs, 1)
+    if not pv:
+        return None, None
+    gs.makeMove(pv[0])
+    ponder = SmartMoveFinder.BackgroundSearch(gs, gs.getValidMoves(), time_limit=AI_TIME_LIMIT, ponder=True)
+    gs.undoMove()
+    return ponder, pv[0]
+
+# Drops a ponder search on a different reply, or an AI search on undo/reset, waits the few nodes it
+# takes to stop so it is not still using the shared tables when the next search starts
+def stopPonder(ponder):
+    if ponder is not None:
+        ponder.cancel()
+        ponder.result()
+
 '''
 Main driver, takes in user input and handles game state updates
 '''
 def main():
+    global p
+    import pygame
+    p = pygame
     p.init()
     screen = p.display.set_mode((WIDTH, HEIGHT))
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
-    gs = ChessEngine.GameState()  # Create the initial game state
+    gs = newGameState()  # Create the initial game state
     validMoves = gs.getValidMoves()
     moveMade = False  # flag var if move is made 
     gameOver = False
     playertwo = False  # Black player (AI or human)
     playerone = True # White player (human or AI)
     loadImages()  # Load the chess piece images
+    renderer = BoardRenderer(screen)
+    exposeEvents = (p.VIDEOEXPOSE, getattr(p, "WINDOWEXPOSED", p.VIDEOEXPOSE))
+    SmartMoveFinder.openingBook = OpeningBook.loadBook()  # None if the book file is missing
+    SmartMoveFinder.tablebase = Tablebase.loadTablebase()  # None until tables are generated
     running = True
     sqSelected = ()  # Correct initialization of an empty tuple to track the selected square
     playerClicks = []  # List to store player clicks for move selection
+    aiSearch = None  # AI search running in the background, the window keeps drawing meanwhile
+    ponder, ponderMove = None, None  # search of the position after the human's expected reply
+    idle = False  # nothing was drawn and no search is running, so only an event can change anything
 
     while running:
         humanTurn = (gs.whiteToMove and playerone) or (not gs.whiteToMove and playertwo)
-        for e in p.event.get():
+        events = p.event.get()
+        if not events and idle:
+            events = [p.event.wait()]  # sleep until the next event instead of polling
+        for e in events:
             if e.type == p.QUIT:
                 running = False
+            elif e.type in exposeEvents:
+                renderer.invalidate()  # window uncovered, redraw all of it
             elif e.type == p.MOUSEBUTTONDOWN:
                 if not gameOver and humanTurn:
                     location = p.mouse.get_pos()  # Get mouse click location
@@ -78,12 +131,27 @@ def main():
                                 moveMade = True
                                 sqSelected = ()  # Reset selected square
                                 playerClicks = []  # Clear player clicks after the move
+                                if ponder is not None and validMoves[i] == ponderMove:
+                                    ponder.ponderhit()  # guessed right, the search so far counts
+                                    aiSearch = ponder
+                                else:
+                                    stopPonder(ponder)
+                                ponder, ponderMove = None, None
                         if not moveMade:
                             playerClicks = [sqSelected]
 
             if e.type == p.KEYDOWN:
+                if e.key in (p.K_z, p.K_r):
+                    stopPonder(ponder)
+                    ponder, ponderMove = None, None
                 if e.key == p.K_z:
-                    if len(gs.moveLog) > 0:  # Check if there are moves to undo
+                    if aiSearch is not None:  # AI still thinking, take back the move it is answering
+                        stopPonder(aiSearch)
+                        aiSearch = None
+                        if len(gs.moveLog) > 0:
+                            gs.undoMove()
+                            moveMade = True
+                    elif len(gs.moveLog) > 0:  # Check if there are moves to undo
                         if gs.whiteToMove == playerone:  # Only undo if it's the player's move
                             gs.undoMove()  # Undo the player's move
                             moveMade = True
@@ -92,7 +160,9 @@ def main():
                                 gs.undoMove()
                                 moveMade = True
                 if e.key == p.K_r:  # Reset game when 'r' is pressed
-                    gs = ChessEngine.GameState()
+                    stopPonder(aiSearch)
+                    aiSearch = None
+                    gs = newGameState()
                     validMoves = gs.getValidMoves()
                     sqSelected = ()
                     playerClicks = []
@@ -100,65 +170,158 @@ def main():
                     gameOver = False
 
 
-        # AI move here
-        if not gameOver and not humanTurn:
-            AImove = SmartMoveFinder.findBestMove(gs, validMoves)
-            if AImove is None:
-                AImove = SmartMoveFinder.findBestMove(gs,validMoves)
-            gs.makeMove(AImove)
-            moveMade = True
+        # AI move here, searched in the background and played once it is ready
+        if not gameOver and not humanTurn and not moveMade:
+            if aiSearch is None:
+                aiSearch = SmartMoveFinder.BackgroundSearch(gs, validMoves, time_limit=AI_TIME_LIMIT)
+            elif aiSearch.done():
+                AImove = aiSearch.result()
+                aiSearch = None
+                if AImove is not None:
+                    gs.makeMove(AImove)
+                    moveMade = True
+                    if PONDER and ((gs.whiteToMove and playerone) or (not gs.whiteToMove and playertwo)):
+                        ponder, ponderMove = startPonder(gs)
 
         if moveMade:
             validMoves = gs.getValidMoves()
             moveMade = False
 
-        drawGameState(screen, gs, validMoves, sqSelected)  # Draw the current state of the game
-
+        text = None
         if gs.checkmate:
             gameOver = True
             if gs.whiteToMove:
-                drawText(screen, "Black wins by checkmate!")
+                text = "Black wins by checkmate!"
             else:
-                drawText(screen, "White wins by checkmate!")
+                text = "White wins by checkmate!"
 
         elif gs.stalemate:
             gameOver = True
-            drawText(screen, "Draw by Stalemate")
+            text = "Draw by Stalemate"
 
+        drawn = renderer.render(gs, validMoves, sqSelected, text)  # Draw what changed since the last frame
+        idle = not drawn and aiSearch is None
         clock.tick(MAX_FPS)
-        p.display.flip()
-
-
-# Highlights selected piece and possible moves
-def highlightSquares(screen, gs, validMoves, sqSelected):
-    if sqSelected != ():
-        r, c = sqSelected
-        if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'):
-            s = p.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(100)  # Transparent
-            s.fill(p.Color('yellow'))
-            screen.blit(s, (c * SQ_SIZE, r * SQ_SIZE + TOP_PADDING))
-            # Highlight moves
-            s.fill(p.Color('blue'))
-            for move in validMoves:
-                if move.startRow == r and move.startCol == c:
-                    screen.blit(s, (move.endCol * SQ_SIZE, move.endRow * SQ_SIZE + TOP_PADDING))
-
-def drawText(screen, text):
-    font = p.font.SysFont("Helvitca", 32, True, False)
-    textObject = font.render(text, 0, p.Color("Gray"))
-    textLocation = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH/2 - textObject.get_width()/2, HEIGHT/2 - textObject.get_height()/2)
-    screen.blit(textObject, textLocation)
-    textObject = font.render(text, 0, p.Color("Black"))
-    screen.blit(textObject, textLocation.move(2, 2))
-
-# Draw the entire game state
-def drawGameState(screen, gs, validMoves, sqSelected):
-    drawBoard(screen)  
-    highlightSquares(screen, gs, validMoves, sqSelected)
-    drawPieces(screen, gs.board)  # Draw the chess pieces on the board
-    drawBorder(screen)  # Draw the border around the board
-    drawAvatar(screen)  # Draw the avatar image
+
+
+class BoardRenderer():
+    '''
+    Draws the game state and updates only the squares whose piece or highlight changed since the
+    last frame. The board, border and avatar never change, so they are drawn once to a cached
+    background that dirty squares are restored from. An unchanged position draws nothing.
+    '''
+    def __init__(self, screen):
+        self.screen = screen
+        self.background = p.Surface(screen.get_size())
+        self.background.fill(p.Color("white"))
+        drawBoard(self.background)
+        drawBorder(self.background)
+        drawAvatar(self.background)
+        # squares the border or the avatar image are drawn over, after the pieces
+        self.overlaid = set()
+        for sq in range(DIMENSION * DIMENSION):
+            r, c = divmod(sq, DIMENSION)
+            if r in (0, DIMENSION - 1) or c in (0, DIMENSION - 1):
+                self.overlaid.add(sq)
+            elif 'avatar' in images and images['avatar'].get_rect(topleft=AVATAR_POSITION).colliderect(self.squareRect(sq)):
+                self.overlaid.add(sq)
+        self.selectedShade = shadeSurface("yellow")
+        self.moveShade = shadeSurface("blue")
+        self.font = p.font.SysFont("Helvitca", 32, True, False)
+        self.textSurfaces = {}
+        self.invalidate()
+
+    def invalidate(self):
+        ''' Redraws the whole window on the next frame '''
+        self.shown = [None] * (DIMENSION * DIMENSION)  # (piece, shade) drawn on each square
+        self.shownText = None
+        self.textRect = None
+        self.fullRedraw = True
+
+    def render(self, gs, validMoves, sqSelected, text=None):
+        ''' Draws the changes since the last call, returns False if there were none '''
+        screen = self.screen
+        dirty = []
+        if self.fullRedraw:
+            screen.blit(self.background, (0, 0))
+        elif text != self.shownText and self.textRect is not None:
+            # erase the old text, the squares under it are redrawn below
+            screen.blit(self.background, self.textRect, self.textRect)
+            dirty.append(self.textRect)
+            for sq in range(DIMENSION * DIMENSION):
+                if self.squareRect(sq).colliderect(self.textRect):
+                    self.shown[sq] = None
+
+        # selected piece and the squares it can move to
+        shades = {}
+        if sqSelected != ():
+            r, c = sqSelected
+            if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'):
+                shades[r * DIMENSION + c] = self.selectedShade
+                for move in validMoves:
+                    if move.startRow == r and move.startCol == c:
+                        shades[move.endRow * DIMENSION + move.endCol] = self.moveShade
+
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                sq = r * DIMENSION + c
+                look = (gs.board[r][c], shades.get(sq))
+                if look != self.shown[sq]:
+                    self.shown[sq] = look
+                    dirty.append(self.drawSquare(sq, look))
+
+        if text is not None and (text != self.shownText or self.fullRedraw or self.textRect.collidelist(dirty) >= 0):
+            self.textRect = self.drawText(text)
+            dirty.append(self.textRect)
+        elif text is None:
+            self.textRect = None
+        self.shownText = text
+
+        if self.fullRedraw:
+            self.fullRedraw = False
+            p.display.flip()
+            return True
+        if dirty:
+            p.display.update(dirty)
+            return True
+        return False
+
+    def squareRect(self, sq):
+        r, c = divmod(sq, DIMENSION)
+        return p.Rect(c * SQ_SIZE, r * SQ_SIZE + TOP_PADDING, SQ_SIZE, SQ_SIZE)
+
+    def drawSquare(self, sq, look):
+        piece, shade = look
+        rect = self.squareRect(sq)
+        self.screen.blit(self.background, rect, rect)
+        if shade is not None:
+            self.screen.blit(shade, rect)
+        if piece != "--":
+            self.screen.blit(images[piece], rect)
+        if sq in self.overlaid:
+            self.screen.set_clip(rect)
+            drawBorder(self.screen)
+            if 'avatar' in images:
+                self.screen.blit(images['avatar'], AVATAR_POSITION)
+            self.screen.set_clip(None)
+        return rect
+
+    def drawText(self, text):
+        ''' Draws text centred on the board with a shadow, returns the rect it covers '''
+        if text not in self.textSurfaces:
+            self.textSurfaces[text] = (self.font.render(text, 0, p.Color("Gray")), self.font.render(text, 0, p.Color("Black")))
+        shadow, textObject = self.textSurfaces[text]
+        textLocation = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH/2 - shadow.get_width()/2, HEIGHT/2 - shadow.get_height()/2)
+        self.screen.blit(shadow, textLocation)
+        self.screen.blit(textObject, textLocation.move(2, 2))
+        return p.Rect(textLocation.x, textLocation.y, shadow.get_width() + 2, shadow.get_height() + 2)
+
+# Transparent square overlay for highlights
+def shadeSurface(colour):
+    s = p.Surface((SQ_SIZE, SQ_SIZE))
+    s.set_alpha(100)  # Transparent
+    s.fill(p.Color(colour))
+    return s
 
 # Draw the chessboard
 def drawBoard(screen):
@@ -169,14 +332,6 @@ def drawBoard(screen):
             colour = colours[(r + c) % 2]  # Alternate between two colors
             p.draw.rect(screen, colour, p.Rect(c * SQ_SIZE, r * SQ_SIZE + TOP_PADDING, SQ_SIZE, SQ_SIZE))
 
-# Draw the pieces on the chessboard based on the board state
-def drawPieces(screen, board):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            piece = board[r][c]
-            if piece != "--":  # Ensure there's a piece on the square
-                screen.blit(images[piece], p.Rect(c * SQ_SIZE, r * SQ_SIZE + TOP_PADDING, SQ_SIZE, SQ_SIZE))
-
 # Draw the black border around the chessboard
 def drawBorder(screen):
     border_rect = p.Rect(0, TOP_PADDING, WIDTH, BOARD_HEIGHT)
@@ -190,7 +345,7 @@ def drawAvatar(screen):
         avatar_x, avatar_y = 10, 10
         
         # Draw the avatar
-        avatar_rect = p.Rect(-178, -165, avatar_width, avatar_height)
+        avatar_rect = p.Rect(AVATAR_POSITION, (avatar_width, avatar_height))
         screen.blit(images['avatar'], avatar_rect)
         
         # Define text properties
@@ -0,0 +1,184 @@
+'''
+Opening book: positions from a corpus of games, stored as a sorted binary file keyed by Zobrist hash.
+
+    python -m Chess.OpeningBook Chess/book/openings.txt Chess/book/openings.bin --plies 20
+    python -m Chess.OpeningBook games.pgn Chess/book/openings.bin
+
+The corpus has one game per line as coordinate moves (e2e4 e7e5 g1f3 ...). Lines starting with
+# are comments and result tokens such as 1-0 are skipped. A corpus ending in .pgn is read as PGN. The compiled file is a 16 byte header
+followed by (hash, move code, weight) entries sorted by hash. At runtime the file is mmapped and
+binary searched, so opening a book reads nothing but the header.
+'''
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+from . import BitboardEngine, Pgn, profiling
+
+MAGIC = b"PYCHBOOK"
+VERSION = 1
+HEADER = struct.Struct(">8sII")  # magic, version, number of entries
+ENTRY = struct.Struct(">QHH")  # Zobrist hash, Move.code, weight
+KEY = struct.Struct(">Q")
+MAX_WEIGHT = 0xFFFF
+BOOK_PLIES = 20  # only the first plies of each game go into the book
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+DEFAULT_BOOK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book", "openings.bin")
+
+
+class OpeningBook():
+    ''' Read-only view of a compiled book file '''
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file, mmap cannot map it
+            self.file.close()
+            raise ValueError(path + " is not an opening book")
+        if len(self.data) < HEADER.size:
+            self.close()
+            raise ValueError(path + " is not an opening book")
+        magic, version, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION or len(self.data) != HEADER.size + self.count * ENTRY.size:
+            self.close()
+            raise ValueError(path + " is not a version %d opening book" % VERSION)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, key):
+        ''' [(move code, weight), ...] stored for the Zobrist hash key, empty when out of book '''
+        data = self.data
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if KEY.unpack_from(data, HEADER.size + mid * ENTRY.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        entries = []
+        offset = HEADER.size + lo * ENTRY.size
+        while lo < self.count:
+            entryKey, code, weight = ENTRY.unpack_from(data, offset)
+            if entryKey != key:
+                break
+            entries.append((code, weight))
+            lo += 1
+            offset += ENTRY.size
+        return entries
+
+    def pickMove(self, gs, validMoves, rng=random):
+        '''
+        One of validMoves picked at random with the book weights, so more popular moves are played
+        more often. None when the position is not in the book.
+        '''
+        candidates = []
+        weights = []
+        for code, weight in self.lookup(gs.zobristHash):
+            moveID = code & 0xFFF
+            for move in validMoves:
+                if move.moveID == moveID:
+                    candidates.append(move)
+                    weights.append(weight)
+                    break
+        if not candidates:
+            return None
+        return rng.choices(candidates, weights)[0]
+
+
+def loadBook(path=DEFAULT_BOOK):
+    ''' The book at path, None if there is no usable book there '''
+    try:
+        return OpeningBook(path)
+    except (OSError, ValueError):
+        return None
+
+
+def compileBook(lines, plies=BOOK_PLIES, errors=sys.stderr):
+    '''
+    Counts how often each move is played from each position in the first plies of the games.
+    Returns {(hash, move code): count}. Illegal or unreadable moves end their game with a message to errors.
+    '''
+    counts = {}
+    for lineNumber, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        gs = BitboardEngine.BitboardGameState()
+        for text in line.split()[:plies]:
+            if text in RESULTS:
+                break
+            move = None
+            for m in gs.getValidMoves():
+                if m.getChessNotation() == text[:4]:
+                    move = m
+                    break
+            if move is None:
+                print("line %d: illegal move %s" % (lineNumber, text), file=errors)
+                break
+            entry = (gs.zobristHash, move.code)
+            counts[entry] = counts.get(entry, 0) + 1
+            gs.makeMove(move)
+    return counts
+
+
+def compilePgn(f, plies=BOOK_PLIES, errors=sys.stderr):
+    ''' compileBook for the games of the binary PGN file f '''
+    counts = {}
+    for game in Pgn.readGames(f):
+        try:
+            for ply, (gs, move) in enumerate(Pgn.replay(game)):
+                if ply >= plies:
+                    break
+                entry = (gs.zobristHash, move.code)
+                counts[entry] = counts.get(entry, 0) + 1
+        except Pgn.PgnError as e:
+            print("game at byte %d: %s" % (game.offset, e), file=errors)
+    return counts
+
+
+def writeBook(counts, path):
+    ''' Writes the {(hash, move code): count} table as a sorted book file, returns the number of entries '''
+    entries = sorted(counts.items())
+    data = bytearray(HEADER.pack(MAGIC, VERSION, len(entries)))
+    for (key, code), count in entries:
+        data += ENTRY.pack(key, code, min(count, MAX_WEIGHT))
+    temp = "%s.%d.tmp" % (path, os.getpid())
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, path)  # a running engine never maps a half written book
+    return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile a move list corpus into an opening book")
+    parser.add_argument("corpus", help="games, one per line in coordinate notation")
+    parser.add_argument("book", help="output book file")
+    parser.add_argument("--plies", type=int, default=BOOK_PLIES, help="plies of each game to keep")
+    profiling.addProfileOption(parser)
+    args = parser.parse_args(argv)
+    return profiling.runProfiled(args.profile, run, args)
+
+
+def run(args):
+    if args.corpus.endswith(".pgn"):
+        with open(args.corpus, "rb") as f:
+            counts = compilePgn(f, args.plies)
+    else:
+        with open(args.corpus) as f:
+            counts = compileBook(f, args.plies)
+    entries = writeBook(counts, args.book)
+    print("%d positions, %d entries written to %s" % (len({key for key, code in counts}), entries, args.book))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
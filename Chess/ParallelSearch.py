@@ -0,0 +1,107 @@
+'''
+Parallel search: splits the root moves across a pool of worker processes.
+
+Each iteration of the iterative deepening searches the best move so far first, then hands every
+other root move to the pool with that score as a bound (young brothers wait). Workers only get
+the position as a FEN string plus a move id, never a pickled GameState, and keep their own
+transposition table between tasks.
+'''
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import BitboardEngine, SmartMoveFinder
+
+_pool = None
+_poolWorkers = 0
+
+
+def getPool(workers):
+    ''' Process pool with the given number of workers, reused between searches '''
+    global _pool, _poolWorkers
+    if _pool is None or _poolWorkers != workers:
+        shutdownPool()
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _poolWorkers = workers
+    return _pool
+
+
+def shutdownPool():
+    global _pool, _poolWorkers
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+    _pool = None
+    _poolWorkers = 0
+
+
+def searchRootMove(fen, moveID, depth, alpha, wallDeadline):
+    '''
+    Worker task: plays one root move and searches the reply to depth - 1.
+    With alpha the move is first tested with a null window and only searched fully if it beats alpha,
+    otherwise the returned score is just an upper bound no better than alpha.
+    wallDeadline is a time.time() value because perf_counter clocks differ between processes.
+    Returns (moveID, score or None if the deadline hit, nodes searched).
+    '''
+    gs = BitboardEngine.BitboardGameState.from_fen(fen)
+    move = None
+    for m in gs.getValidMoves():
+        if m.moveID == moveID:
+            move = m
+            break
+    context = SmartMoveFinder.SearchContext()
+    if wallDeadline is not None:
+        context.deadline = time.perf_counter() + wallDeadline - time.time()
+    turnMultiplier = 1 if gs.whiteToMove else -1
+    CHECKMATE = SmartMoveFinder.CHECKMATE
+    gs.makeMove(move)
+    replies = gs.getValidMoves()
+    try:
+        if alpha is None:
+            score = -SmartMoveFinder.findMoveNegaMaxAlphaBeta(gs, replies, depth - 1, -CHECKMATE, CHECKMATE, -turnMultiplier, context, 1)
+        else:
+            score = -SmartMoveFinder.findMoveNegaMaxAlphaBeta(gs, replies, depth - 1, -alpha - 1, -alpha, -turnMultiplier, context, 1)
+            if score > alpha:
+                score = -SmartMoveFinder.findMoveNegaMaxAlphaBeta(gs, replies, depth - 1, -CHECKMATE, -alpha, -turnMultiplier, context, 1)
+    except SmartMoveFinder.SearchTimeout:
+        return moveID, None, context.nodes
+    return moveID, score, context.nodes
+
+
+def findBestMoveParallel(gs, validMoves, max_depth=None, workers=None, time_limit=None):
+    '''
+    Iteratively deepened root-split search. Returns (bestMove, score), score from the side to
+    move's point of view, using the deepest iteration that finished before time_limit.
+    '''
+    if len(validMoves) == 0:
+        return None, 0
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_depth is None:
+        max_depth = SmartMoveFinder.DEPTH if time_limit is None else SmartMoveFinder.MAX_DEPTH
+    pool = getPool(workers)
+    fen = gs.to_fen()
+    start = time.time()
+    rootMoves = list(validMoves)
+    SmartMoveFinder.moveOrderer.orderMoves(rootMoves, 0)
+    bestMove, bestScore = rootMoves[0], 0
+    for depth in range(1, max_depth + 1):
+        # depth 1 always completes so there is a move to return
+        wallDeadline = start + time_limit if time_limit is not None and depth > 1 else None
+        moveID, firstScore, nodes = pool.submit(searchRootMove, fen, rootMoves[0].moveID, depth, None, wallDeadline).result()
+        if firstScore is None:
+            break
+        futures = [pool.submit(searchRootMove, fen, move.moveID, depth, firstScore, wallDeadline) for move in rootMoves[1:]]
+        scores = {rootMoves[0].moveID: firstScore}
+        for future in futures:
+            moveID, score, nodes = future.result()
+            scores[moveID] = score
+        if None in scores.values():
+            break
+        # stable sort keeps the previous best first among equal scores
+        rootMoves.sort(key=lambda move: scores[move.moveID], reverse=True)
+        bestMove, bestScore = rootMoves[0], scores[rootMoves[0].moveID]
+        if bestScore >= SmartMoveFinder.CHECKMATE:
+            break
+        if time_limit is not None and time.time() - start >= time_limit / 2:
+            break
+    return bestMove, bestScore
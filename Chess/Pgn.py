@@ -0,0 +1,295 @@
+'''
+PGN reader: streams games from PGN files of any size and replays their SAN moves on a GameState.
+
+    python -m Chess.Pgn games.pgn --output positions.fen --workers 4
+    python -m Chess.Pgn games.pgn --max-plies 20
+
+Games are parsed one at a time from the file's lines, so memory use does not depend on the file
+size. Every position before a move is written as a FEN line for Chess.analyze, and the games per
+second are reported. With workers the file is cut into byte ranges at game boundaries, the first
+tag line after a line ending in a result, each process replays the games of its range into its
+own part file, and the parts are joined in file order. The engine always promotes to a queen, so
+games with an underpromotion stop at it.
+'''
+import argparse
+import os
+import re
+import sys
+import time
+
+from . import BitboardEngine, profiling
+from .ChessEngine import Move
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+RESULT_TOKENS = tuple(result.encode() for result in RESULTS)
+CHUNK_BYTES = 4 << 20  # largest byte range per worker task
+
+# comments, variation brackets, NAGs, move numbers and everything else as one token each
+TOKEN = re.compile(r"\{[^}]*\}?|;[^\n]*|[()]|\$\d+|\d+\.+|[^\s(){};]+")
+TAG = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+
+
+class PgnError(ValueError):
+    ''' A move of a game could not be read or is illegal '''
+
+
+class PgnGame():
+    ''' Tags and SAN moves of one game, offset is the byte offset of its first line '''
+    def __init__(self, headers, moves, result, offset):
+        self.headers = headers
+        self.moves = moves
+        self.result = result
+        self.offset = offset
+
+    def __repr__(self):
+        return "PgnGame(%s - %s, %d moves)" % (self.headers.get("White", "?"), self.headers.get("Black", "?"), len(self.moves))
+
+
+def parseMovetext(text):
+    ''' (SAN moves, result) of a game's movetext, without comments, variations and NAGs '''
+    moves = []
+    result = "*"
+    variation = 0
+    for token in TOKEN.findall(text):
+        first = token[0]
+        if first == "(":
+            variation += 1
+        elif first == ")":
+            variation = max(variation - 1, 0)
+        elif variation or first in "{;$":
+            continue
+        elif token in RESULTS:
+            result = token
+        elif first.isdigit() and token[-1] == ".":
+            continue  # move number
+        else:
+            moves.append(token)
+    return moves, result
+
+
+def commentOpen(text, inComment):
+    ''' True if a { comment is still open at the end of the movetext line text '''
+    i = 0
+    while True:
+        if inComment:
+            i = text.find("}", i)
+            if i < 0:
+                return True
+            inComment = False
+        else:
+            brace = text.find("{", i)
+            semicolon = text.find(";", i)
+            if brace < 0 or 0 <= semicolon < brace:
+                return False  # no comment opens, or the rest of the line is a ; comment
+            i = brace
+            inComment = True
+        i += 1
+
+
+def readGames(f, end=None):
+    '''
+    Yields a PgnGame for every game of the binary file f from its current position, up to byte
+    end if given. A tag line after movetext starts the next game, unless it is inside a { comment.
+    '''
+    headers = {}
+    movetext = []
+    offset = f.tell()
+    gameOffset = None
+    inComment = False
+    while end is None or offset < end:
+        line = f.readline()
+        if not line:
+            break
+        stripped = line.strip()
+        if not inComment and stripped.startswith(b"["):
+            if movetext:
+                moves, result = parseMovetext("\n".join(movetext))
+                yield PgnGame(headers, moves, result, gameOffset)
+                headers, movetext = {}, []
+                gameOffset = None
+            if gameOffset is None:
+                gameOffset = offset
+            match = TAG.match(stripped.decode("utf-8", "replace"))
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+        elif stripped and (inComment or not stripped.startswith(b"%")):
+            if gameOffset is None:
+                gameOffset = offset  # movetext without tags
+            text = stripped.decode("utf-8", "replace")
+            movetext.append(text)
+            inComment = commentOpen(text, inComment)
+        offset += len(line)
+    if movetext or headers:
+        moves, result = parseMovetext("\n".join(movetext))
+        yield PgnGame(headers, moves, result, gameOffset)
+
+
+def seekGame(f, start):
+    '''
+    Moves f to the first game boundary at or after byte start and returns its offset: a tag line
+    following a line that ends in a result, or the end of the file.
+    '''
+    if start == 0:
+        f.seek(0)
+        return 0
+    f.seek(start - 1)
+    f.readline()  # rest of the line start falls in, unless start is a line start
+    terminated = False
+    while True:
+        offset = f.tell()
+        line = f.readline()
+        stripped = line.strip()
+        if not line or (terminated and stripped.startswith(b"[")):
+            f.seek(offset)
+            return offset
+        if stripped:
+            terminated = stripped.endswith(RESULT_TOKENS)
+
+
+def parseSan(san, gs, validMoves):
+    ''' The move of validMoves written as san (Nbd7, exd6, O-O, e8=Q+, ...), raises PgnError if there is none '''
+    text = san.rstrip("+#!?")
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        endCol = 6 if len(text) == 3 else 2
+        for move in validMoves:
+            if move.iscastlemove and move.endCol == endCol:
+                return move
+        raise PgnError("illegal castling " + san)
+    promotion = None
+    if "=" in text:
+        text, promotion = text.split("=", 1)
+    elif len(text) > 2 and text[-1] in "QRBN" and text[-2].isdigit():
+        text, promotion = text[:-1], text[-1]
+    if promotion is not None and promotion != "Q":
+        raise PgnError("underpromotion " + san + " is not supported")
+    piece = text[0] if text[0] in "KQRBN" else "p"
+    body = text[1:] if piece != "p" else text
+    body = body.replace("x", "").replace("-", "").replace(":", "")
+    if len(body) < 2 or body[-2] not in Move.filesToCol or body[-1] not in Move.ranksToRows:
+        raise PgnError("unreadable move " + san)
+    endRow, endCol = Move.ranksToRows[body[-1]], Move.filesToCol[body[-2]]
+    found = None
+    for move in validMoves:
+        if move.endRow != endRow or move.endCol != endCol or move.pieceMoved[1] != piece or move.iscastlemove:
+            continue
+        for ch in body[:-2]:  # disambiguation: file, rank or both
+            if (ch in Move.filesToCol and Move.filesToCol[ch] != move.startCol) or \
+                    (ch in Move.ranksToRows and Move.ranksToRows[ch] != move.startRow):
+                break
+        else:
+            if found is not None:
+                raise PgnError("ambiguous move " + san)
+            found = move
+    if found is None:
+        raise PgnError("illegal move " + san)
+    return found
+
+
+def replay(game, engine=BitboardEngine.BitboardGameState):
+    '''
+    Yields (gs, move) for every move of game, gs being the position before the move. The move is
+    made on the same GameState once the caller asks for the next one. Raises PgnError at a bad move.
+    '''
+    if "FEN" in game.headers:
+        gs = engine.from_fen(game.headers["FEN"])
+    else:
+        gs = engine()
+    for ply, san in enumerate(game.moves):
+        try:
+            move = parseSan(san, gs, gs.getValidMoves())
+        except PgnError as e:
+            raise PgnError("ply %d: %s" % (ply + 1, e))
+        yield gs, move
+        gs.makeMove(move)
+
+
+def extractRange(path, start, end, output=None, maxPlies=None):
+    '''
+    Worker task: replays the games of path in bytes start..end, game boundaries from gameRanges,
+    and writes the position before every move as a FEN line to the file output, if given.
+    Returns (games, positions, errors).
+    '''
+    games = positions = errors = 0
+    out = open(output, "w") if output is not None else None
+    try:
+        with open(path, "rb") as f:
+            f.seek(start)
+            for game in readGames(f, end):
+                games += 1
+                try:
+                    for ply, (gs, move) in enumerate(replay(game)):
+                        if maxPlies is not None and ply >= maxPlies:
+                            break
+                        positions += 1
+                        if out is not None:
+                            out.write(gs.to_fen() + "\n")
+                except PgnError as e:
+                    errors += 1
+                    print("%s: game at byte %d: %s" % (path, game.offset, e), file=sys.stderr)
+    finally:
+        if out is not None:
+            out.close()
+    return games, positions, errors
+
+
+def gameRanges(path, chunkBytes=CHUNK_BYTES):
+    ''' (start, end) byte ranges of about chunkBytes covering path, each starting and ending at a game boundary '''
+    size = os.path.getsize(path)
+    starts = [0]
+    with open(path, "rb") as f:
+        for start in range(chunkBytes, size, chunkBytes):
+            if start > starts[-1]:
+                offset = seekGame(f, start)
+                if offset < size:
+                    starts.append(offset)
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def extract(path, output=None, workers=1, maxPlies=None):
+    ''' Replays every game of path, writes its positions to output if given, returns (games, positions, errors) '''
+    if workers <= 1:
+        return extractRange(path, 0, None, output, maxPlies)
+    from concurrent.futures import ProcessPoolExecutor
+    # a few ranges per worker so they finish together, fewer bytes each on small files
+    ranges = gameRanges(path, max(min(CHUNK_BYTES, os.path.getsize(path) // (workers * 4)), 1 << 12))
+    parts = [None] * len(ranges) if output is None else ["%s.part%d" % (output, i) for i in range(len(ranges))]
+    totals = [0, 0, 0]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for counts in pool.map(extractRange, [path] * len(ranges), [start for start, end in ranges],
+                                   [end for start, end in ranges], parts, [maxPlies] * len(ranges)):
+                totals = [total + count for total, count in zip(totals, counts)]
+        if output is not None:
+            with open(output, "wb") as out:
+                for part in parts:
+                    with open(part, "rb") as f:
+                        while True:
+                            block = f.read(1 << 20)
+                            if not block:
+                                break
+                            out.write(block)
+    finally:
+        for part in parts:
+            if part is not None and os.path.exists(part):
+                os.remove(part)
+    return tuple(totals)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay the games of a PGN file and extract their positions")
+    parser.add_argument("pgn", help="PGN file")
+    parser.add_argument("--output", "-o", help="write the position before every move as a FEN line to this file")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, each replaying a byte range of the file")
+    parser.add_argument("--max-plies", type=int, help="only the first plies of each game")
+    profiling.addProfileOption(parser)
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    games, positions, errors = profiling.runProfiled(args.profile, extract, args.pgn, args.output, args.workers, args.max_plies)
+    seconds = time.perf_counter() - start
+    print("%d games (%d with errors), %d positions in %.2fs: %.1f games/s, %.0f positions/s" % (
+        games, errors, positions, seconds, games / max(seconds, 1e-9), positions / max(seconds, 1e-9)), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,42 @@
 import random
+import threading
+import time
+from array import array
 
 pieceScore = {"K":0,"R": 5, "Q": 9, "B":3, "N":3, "p":1 }
 
-#Scores for gameplay
-CHECKMATE = 1000
+#Scores for gameplay, in tenths of a pawn
+CHECKMATE = 10000
 STALEMATE = 0
 
-#depth of search, >3 becomes quite slow
+#depth of search without a time limit. Measured on the bench positions (bitboards, one core), a search
+#takes 0.16s on average at depth 3, 0.44s at depth 4 and 0.83s at depth 5, at most 0.4s, 1.1s and 2.2s
 DEPTH = 3
+#deepest iteration when searching on a time limit
+MAX_DEPTH = 32
+#deepest ply the quiescence search may reach
+MAX_PLY = 64
+#safety margin for delta pruning in the quiescence search, 2 pawns
+DELTA_MARGIN = 20
+#null move pruning searches the reply to the pass this much shallower, from this depth on
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+#late move reductions: quiet moves after the first few are searched a ply shallower, from this depth on
+LMR_MIN_MOVES = 3
+LMR_MIN_DEPTH = 3
+#score of a tablebase win, less the plies to mate: below a mate on the board, above any material balance
+TABLEBASE_WIN = CHECKMATE // 2
+#captures that lose more than this per remaining ply by static exchange are not searched, up to this depth
+SEE_PRUNE_MARGIN = 10
+SEE_PRUNE_DEPTH = 2
+#pawn structure terms in tenths of a pawn, counted for the pawn's side
+DOUBLED_PAWN = -2  # every extra pawn on a file
+ISOLATED_PAWN = -2  # no pawn of its side on the files next to it
+PASSED_PAWN = (0, 1, 2, 3, 5, 8)  # no enemy pawn ahead on its own or the next files, by squares advanced
+#king shield while the opponent has a queen, per file in front of the king and next to it
+SHIELD_ADVANCED = -1  # the shield pawn has moved a square
+SHIELD_MISSING = -3  # no pawn on the two squares in front of the king
+KING_EXPOSED = 3 * SHIELD_MISSING  # the king has left its first two ranks
 
 #piece-square position tables, indicating which squares for which peices are most positionally advantageous
 knightScore = [[1,1,1,1,1,1,1,1],
@@ -67,46 +96,928 @@ pawnScore = [[10,10,10,10,10,10,10,10],
 
 piecePositionScores = {"N": knightScore, "K": KingScore, "B": bishopScore,"p": pawnScore, "R": rookScore, "Q":QueenScore  }
 
+# The same scores as integers in tenths of a pawn, signed so white is positive, for GameState's running sums.
+# Kings only count through checkmate, so their position table is not used.
+pieceValues = {}
+positionValues = {}
+for _piece in pieceScore:
+    for _color, _sign in (("w", 1), ("b", -1)):
+        pieceValues[_color + _piece] = _sign * pieceScore[_piece] * 10
+        if _piece == "K":
+            positionValues[_color + _piece] = [0] * 64
+        else:
+            positionValues[_color + _piece] = [_sign * piecePositionScores[_piece][r][c] for r in range(8) for c in range(8)]
+
+# piece values for the static exchange evaluation, the king worth more than all other pieces together
+seeValues = {_piece: pieceScore[_piece] * 10 for _piece in pieceScore}
+seeValues["K"] = 1000
+
+# check every incremental evaluation against a full rescan of the board
+DEBUG_EVAL = False
+
+#bound types stored in the transposition table
+EXACT = 0
+LOWERBOUND = 1  # search failed high, real score is >= stored score
+UPPERBOUND = 2  # search failed low, real score is <= stored score
+
+NO_MOVE = -1
+
+
+class TranspositionTable():
+    '''
+    Fixed-size table of search results keyed by GameState.zobristHash.
+    Every slot is preallocated in flat arrays, so memory is bounded no matter how long we search.
+    An entry is replaced when the slot is empty, holds the same position, comes from an older
+    search, or was searched to a depth no greater than the new result (depth-preferred).
+    '''
+    def __init__(self, sizeBits=18):
+        self.size = 1 << sizeBits
+        self.mask = self.size - 1
+        self.keys = array('Q', [0]) * self.size
+        self.depths = array('b', [-1]) * self.size  # -1 marks an empty slot
+        self.scores = array('i', [0]) * self.size
+        self.flags = array('B', [EXACT]) * self.size
+        self.moves = array('i', [NO_MOVE]) * self.size  # Move.moveID of the best move
+        self.ages = array('B', [0]) * self.size
+        self.age = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.hits = 0  # probe found the position
+        self.misses = 0  # probe found nothing usable, includes collisions
+        self.collisions = 0  # slot was holding a different position
+        self.stores = 0
+        self.overwrites = 0  # a different position was evicted by a store
+
+    def clear(self):
+        for i in range(self.size):
+            self.depths[i] = -1
+        self.age = 0
+        self.resetStats()
+
+    def newSearch(self):
+        # entries from previous searches become replaceable regardless of depth
+        self.age = (self.age + 1) & 0xFF
+
+    def probe(self, key):
+        ''' Returns (depth, score, flag, moveID) for the position, or None '''
+        i = key & self.mask
+        if self.depths[i] < 0:
+            self.misses += 1
+            return None
+        if self.keys[i] != key:
+            self.misses += 1
+            self.collisions += 1
+            return None
+        self.hits += 1
+        return self.depths[i], self.scores[i], self.flags[i], self.moves[i]
+
+    def store(self, key, depth, score, flag, moveID):
+        i = key & self.mask
+        storedDepth = self.depths[i]
+        if storedDepth >= 0 and self.keys[i] != key:
+            if self.ages[i] == self.age and storedDepth > depth:
+                return
+            self.overwrites += 1
+        self.keys[i] = key
+        self.depths[i] = depth
+        self.scores[i] = score
+        self.flags[i] = flag
+        self.moves[i] = moveID
+        self.ages[i] = self.age
+        self.stores += 1
+
+    def getStats(self):
+        used = sum(1 for d in self.depths if d >= 0)
+        return {"hits": self.hits, "misses": self.misses, "collisions": self.collisions,
+                "stores": self.stores, "overwrites": self.overwrites,
+                "size": self.size, "used": used}
+
+
+_transpositionTable = None
+
+
+def getTranspositionTable():
+    ''' Table shared by searches that are not given their own, allocated on first use to keep imports fast '''
+    global _transpositionTable
+    if _transpositionTable is None:
+        _transpositionTable = TranspositionTable()
+    return _transpositionTable
+
+
+# the file itself and the files next to it
+NEARBY_FILES = tuple(tuple(range(max(f - 1, 0), min(f + 2, 8))) for f in range(8))
+
+
+def pawnStructure(board):
+    '''
+    Pawn terms of board as (score, whiteShield, blackShield). score adds up the doubled, isolated
+    and passed pawns, white positive. The shields hold each side's king shield penalty for the
+    king on square (rank offset * 8 + file) of its first two ranks.
+    '''
+    whitePawns = []
+    blackPawns = []
+    # per file, the rearmost pawn of each side: an enemy pawn level with a pawn or behind it can't stop it
+    whiteRear = [-1] * 8
+    blackRear = [8] * 8
+    for r in range(1, 7):
+        row = board[r]
+        for c in range(8):
+            piece = row[c]
+            if piece == "wp":
+                whitePawns.append((r, c))
+                whiteRear[c] = r
+            elif piece == "bp":
+                blackPawns.append((r, c))
+                if blackRear[c] == 8:
+                    blackRear[c] = r
+    score = 0
+    for pawns, sign in ((whitePawns, 1), (blackPawns, -1)):
+        counts = [0] * 8
+        for r, c in pawns:
+            counts[c] += 1
+        for count in counts:
+            if count > 1:
+                score += sign * DOUBLED_PAWN * (count - 1)
+        for r, c in pawns:
+            if (c == 0 or counts[c - 1] == 0) and (c == 7 or counts[c + 1] == 0):
+                score += sign * ISOLATED_PAWN
+            passed = True
+            for f in NEARBY_FILES[c]:
+                if (blackRear[f] < r) if sign > 0 else (whiteRear[f] > r):
+                    passed = False
+                    break
+            if passed:
+                score += sign * PASSED_PAWN[min(6 - r if sign > 0 else r - 1, 5)]
+    shields = []
+    for pawn, homeRow, forward in (("wp", 7, -1), ("bp", 0, 1)):
+        shield = []
+        for offset in range(2):
+            front = board[homeRow + forward * (offset + 1)]
+            behind = board[homeRow + forward * (offset + 2)]
+            files = [0 if front[f] == pawn else SHIELD_ADVANCED if behind[f] == pawn else SHIELD_MISSING for f in range(8)]
+            shield.append(files[0] + files[1])
+            shield.extend([files[f - 1] + files[f] + files[f + 1] for f in range(1, 7)])
+            shield.append(files[6] + files[7])
+        shields.append(shield)
+    return score, shields[0], shields[1]
+
+
+def kingSafety(gs, whiteShield, blackShield):
+    ''' King shield terms of gs from the pawnStructure shields, white positive '''
+    score = 0
+    if gs.hasPiece("bQ"):
+        r, c = gs.whiteKingLocation
+        score += whiteShield[(7 - r) * 8 + c] if r >= 6 else KING_EXPOSED
+    if gs.hasPiece("wQ"):
+        r, c = gs.blackKingLocation
+        score -= blackShield[r * 8 + c] if r <= 1 else KING_EXPOSED
+    return score
+
+
+class PawnHashTable():
+    '''
+    pawnStructure results keyed by GameState.pawnHash, the Zobrist key of the pawns alone. Few
+    moves of a search touch a pawn, so nearly every probe finds the structure already scored.
+    Slots are overwritten on a collision.
+    '''
+    def __init__(self, sizeBits=12):
+        self.size = 1 << sizeBits
+        self.mask = self.size - 1
+        self.entries = [None] * self.size  # (pawnHash, pawnStructure result)
+        self.resetStats()
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.resetStats()
+
+    def probe(self, gs):
+        ''' pawnStructure of gs, computed and stored on a miss '''
+        key = gs.pawnHash
+        i = key & self.mask
+        entry = self.entries[i]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        structure = pawnStructure(gs.board)
+        self.entries[i] = (key, structure)
+        return structure
+
+    def getStats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": self.size,
+                "used": sum(1 for entry in self.entries if entry is not None)}
+
+
+class EvalCache():
+    '''
+    evaluate() scores keyed by GameState.zobristHash, for positions evaluated again: by the
+    null move test and the quiescence search of the same node, or through transpositions.
+    Always replaces, small enough to stay cheap.
+    '''
+    def __init__(self, sizeBits=14):
+        self.size = 1 << sizeBits
+        self.mask = self.size - 1
+        self.entries = [None] * self.size  # (zobristHash, score)
+        self.resetStats()
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.resetStats()
+
+    def probe(self, key):
+        ''' Score stored for the position, or None '''
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def store(self, key, score):
+        self.entries[key & self.mask] = (key, score)
+
+    def getStats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": self.size,
+                "used": sum(1 for entry in self.entries if entry is not None)}
+
+
+pawnTable = PawnHashTable()
+evalCache = EvalCache()
+
+
+class MoveOrderer():
+    '''
+    Sorts moves so the likeliest cutoffs are searched first: the hash move, captures by
+    MVV-LVA (most valuable victim, least valuable attacker), promotions, the two killer
+    moves of the ply, then quiet moves by their history score. Given the position, captures
+    that lose material by static exchange go after the quiet moves.
+    Any object with orderMoves/recordCutoff/newSearch can be given to SearchContext instead.
+    '''
+    HASH_MOVE = 1000000
+    CAPTURE = 100000
+    PROMOTION = 90000
+    KILLER = 80000
+    HISTORY_LIMIT = 50000  # history stays below the killer scores
+    LOSING_CAPTURE = 2 * CAPTURE  # taken off a capture's score when it loses material, below any quiet move
+
+    def __init__(self, maxPly=MAX_DEPTH + 1):
+        self.maxPly = maxPly
+        self.killers = [[NO_MOVE, NO_MOVE] for _ in range(maxPly + 1)]
+        self.history = array('i', [0]) * 4096  # indexed by Move.moveID
+
+    def newSearch(self):
+        # killers are position specific, history is kept but faded
+        for ply in range(len(self.killers)):
+            self.killers[ply][0] = self.killers[ply][1] = NO_MOVE
+        for i in range(len(self.history)):
+            self.history[i] >>= 2
+
+    def scoreMove(self, move, ply, hashMoveID, gs=None):
+        if move.moveID == hashMoveID:
+            return self.HASH_MOVE
+        score = 0
+        if move.pieceCaptured != "--":
+            score = self.CAPTURE + pieceScore[move.pieceCaptured[1]] * 100 - pieceScore[move.pieceMoved[1]]
+            if gs is not None and losesMaterial(gs, move):
+                score -= self.LOSING_CAPTURE
+        if move.isPawnPromotion:
+            score += self.PROMOTION
+        if score:
+            return score
+        if ply <= self.maxPly:
+            killers = self.killers[ply]
+            if move.moveID == killers[0]:
+                return self.KILLER
+            if move.moveID == killers[1]:
+                return self.KILLER - 1
+        return self.history[move.moveID]
+
+    def orderMoves(self, moves, ply, hashMoveID=NO_MOVE, gs=None, rng=None):
+        '''
+        Sorts moves in place, best first. gs is the position, to find the losing captures.
+        rng, a random.Random, puts moves with the same score in random order.
+        '''
+        if rng is not None:
+            scores = {id(move): self.scoreMove(move, ply, hashMoveID, gs) + rng.random() for move in moves}
+            moves.sort(key=lambda move: scores[id(move)], reverse=True)
+        else:
+            moves.sort(key=lambda move: self.scoreMove(move, ply, hashMoveID, gs), reverse=True)
+
+    def recordCutoff(self, move, depth, ply):
+        ''' Called when move caused a beta cutoff '''
+        if move.pieceCaptured != "--" or move.isPawnPromotion:
+            return  # captures are already ordered by MVV-LVA
+        if ply <= self.maxPly:
+            killers = self.killers[ply]
+            if killers[0] != move.moveID:
+                killers[1] = killers[0]
+                killers[0] = move.moveID
+        self.history[move.moveID] += depth * depth
+        if self.history[move.moveID] > self.HISTORY_LIMIT:
+            for i in range(len(self.history)):
+                self.history[i] >>= 1
+
+
+class NoOrdering():
+    ''' Leaves moves in generation order (shuffled when given rng), for comparing against MoveOrderer '''
+    def newSearch(self):
+        pass
+
+    def orderMoves(self, moves, ply, hashMoveID=NO_MOVE, gs=None, rng=None):
+        if rng is not None:
+            rng.shuffle(moves)
+
+    def recordCutoff(self, move, depth, ply):
+        pass
+
+
+moveOrderer = MoveOrderer()
+
+openingBook = None  # OpeningBook.OpeningBook played from before searching, None searches every move
+
+
+def bookMove(gs, validMoves):
+    ''' Weighted random pick from the opening book, None when out of book or without a book '''
+    if openingBook is None:
+        return None
+    return openingBook.pickMove(gs, validMoves)
+
+
+tablebase = None  # Tablebase.Tablebase probed at the root and in the search, None to search everything
+
+
+def tablebaseMove(gs, validMoves):
+    ''' Best move by the endgame tablebase, None when the position is not in it or without tablebases '''
+    if tablebase is None:
+        return None
+    return tablebase.bestMove(gs, validMoves)
+
+
+def tablebaseScore(gs):
+    ''' Score of the position for the side to move from the tablebase, None when it is not covered '''
+    result = tablebase.probe(gs)
+    if result is None:
+        return None
+    outcome, plies = result
+    return outcome * (TABLEBASE_WIN - plies)  # outcome is 0 for a draw
+
+
+def tablebasePlies(gs, pv):
+    '''
+    Plies to mate for a tablebase score at gs: the moves of pv are played until a position the
+    tablebase covers, whose distance is added. None when pv never reaches one.
+    '''
+    if tablebase is None:
+        return None
+    made = 0
+    try:
+        for move in list(pv) + [None]:
+            result = tablebase.probe(gs)
+            if result is not None:
+                return made + result[1]
+            if move is None:
+                return None
+            gs.makeMove(move)
+            made += 1
+    finally:
+        for _ in range(made):
+            gs.undoMove()
+
+def losesMaterial(gs, move, margin=0):
+    ''' True if the capture move loses more than margin by static exchange evaluation '''
+    if move.pieceCaptured == "--" or seeValues[move.pieceCaptured[1]] >= seeValues[move.pieceMoved[1]]:
+        return False  # taking a piece worth at least the capturer can't lose, even if it is recaptured
+    return gs.staticExchange(move, seeValues) < -margin
+
 # random move mostly for testing
 def findRandomMove(validMoves):
     return validMoves[random.randint(0,len(validMoves)-1)]
 
 
-def findBestMove(gs, validMoves):
-    global nextMove 
-    nextMove = None
-    # shuffle rooms so it does not constantly play the same moves 
-    random.shuffle(validMoves)
-    findMoveNegaMaxAlphaBeta(gs,validMoves,DEPTH,-CHECKMATE,CHECKMATE, 1 if gs.whiteToMove else -1)
-    # findMoveNegaMax(gs,validMoves,DEPTH, 1 if gs.whiteToMove else -1)
-    return nextMove
+class SearchTimeout(Exception):
+    ''' Raised inside the search once the time budget has run out '''
 
 
-def findMoveNegaMaxAlphaBeta(gs,validMoves,depth, alpha,beta, turnMultiplier):
-    global nextMove
-    if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
+class SearchContext():
+    ''' State shared by every node of one search '''
+    def __init__(self, tt=None, deadline=None, orderer=None, quiescence=True, stopEvent=None, onIteration=None,
+                 pvs=True, nullMove=True, lateMoveReductions=True, staticExchange=True, stats=None, rng=None):
+        self.tt = tt if tt is not None else getTranspositionTable()
+        self.orderer = orderer if orderer is not None else moveOrderer
+        self.quiescence = quiescence  # False scores depth 0 statically, even mid-exchange
+        self.pvs = pvs  # principal variation search: moves after the first get a zero window first
+        self.nullMove = nullMove  # null move pruning
+        self.lateMoveReductions = lateMoveReductions
+        self.staticExchange = staticExchange  # order losing captures last and prune them in quiescence and near the leaves
+        self.rng = rng if rng is not None else random.Random()  # breaks ties between root moves, seed it for repeatable searches
+        self.deadline = deadline  # time.perf_counter() value to stop at, None searches until done
+        self.timeLimit = None  # seconds from searchStart, set by iterativeDeepening or ponderhit
+        self.searchStart = None
+        self.completedDepth = 0
+        self.stopEvent = stopEvent  # threading.Event that aborts the search when set
+        self.onIteration = onIteration  # called as onIteration(depth, bestMove, score) after each completed depth
+        self.stats = stats  # SearchStats filled in by iterativeDeepening, None to skip the bookkeeping
+        self.evaluate = evaluate  # replaced by timed versions while stats are collected
+        self.scoreBoard = scoreBoard
+        self.nodes = 0
+        self.qnodes = 0  # nodes of the quiescence search, included in nodes
+
+    def checkTime(self):
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+        if self.stopEvent is not None and self.stopEvent.is_set():
+            raise SearchTimeout()
+
+    def ponderhit(self, time_limit):
+        '''
+        Gives a search started without a time limit (pondering on the opponent's time) time_limit
+        seconds counted from its start, so the time already spent pondering counts. Called from
+        another thread while the search runs.
+        '''
+        if time_limit is None:
+            return
+        self.timeLimit = time_limit
+        if self.completedDepth > 0:  # otherwise iterativeDeepening sets it once depth 1 is done
+            self.deadline = self.searchStart + time_limit
+
+
+class SearchStats():
+    '''
+    Counters and phase timings of one search, filled in when given as SearchContext(stats=...).
+    While a search collects stats its GameState and evaluation calls go through timing wrappers,
+    without stats the search runs exactly the uninstrumented code.
+    '''
+    PHASES = ("movegen", "makeundo", "eval")
+
+    def __init__(self):
+        self.nodes = 0
+        self.qnodes = 0
+        self.cutoffs = 0  # beta cutoffs in the main search
+        self.firstMoveCutoffs = 0  # cutoffs by the first move searched, the better the move ordering the more
+        self.ttProbes = 0
+        self.ttHits = 0
+        self.pawnProbes = 0  # pawnTable, probed when evalCache misses
+        self.pawnHits = 0
+        self.evalProbes = 0  # evalCache
+        self.evalHits = 0
+        self.depth = 0
+        self.seconds = 0.0
+        self.iterationNodes = []  # nodes searched by the end of each completed depth
+        self.phaseSeconds = dict.fromkeys(self.PHASES, 0.0)
+
+    def recordCutoff(self, moveNumber):
+        self.cutoffs += 1
+        if moveNumber == 0:
+            self.firstMoveCutoffs += 1
+
+    def timed(self, phase, function):
+        phaseSeconds = self.phaseSeconds
+        clock = time.perf_counter
+
+        def wrapper(*args):
+            start = clock()
+            try:
+                return function(*args)
+            finally:
+                phaseSeconds[phase] += clock() - start
+        return wrapper
+
+    def start(self, gs, context):
+        ''' Installs the timing wrappers on gs and context '''
+        for name, phase in (("getValidMoves", "movegen"), ("getCaptureMoves", "movegen"), ("makeMove", "makeundo"), ("undoMove", "makeundo")):
+            setattr(gs, name, self.timed(phase, getattr(gs, name)))
+        context.evaluate = self.timed("eval", evaluate)
+        context.scoreBoard = self.timed("eval", scoreBoard)
+        self.ttStart = (context.tt.hits, context.tt.hits + context.tt.misses)
+        self.cacheStart = (pawnTable.hits, pawnTable.misses, evalCache.hits, evalCache.misses)
+        self.startTime = time.perf_counter()
+
+    def finish(self, gs, context):
+        ''' Removes the wrappers and takes the totals from context '''
+        self.seconds += time.perf_counter() - self.startTime
+        for name in ("getValidMoves", "getCaptureMoves", "makeMove", "undoMove"):
+            gs.__dict__.pop(name, None)
+        context.evaluate = evaluate
+        context.scoreBoard = scoreBoard
+        self.nodes = context.nodes
+        self.qnodes = context.qnodes
+        self.ttHits += context.tt.hits - self.ttStart[0]
+        self.ttProbes += context.tt.hits + context.tt.misses - self.ttStart[1]
+        pawnHits, pawnMisses, evalHits, evalMisses = self.cacheStart
+        self.pawnHits += pawnTable.hits - pawnHits
+        self.pawnProbes += pawnTable.hits + pawnTable.misses - pawnHits - pawnMisses
+        self.evalHits += evalCache.hits - evalHits
+        self.evalProbes += evalCache.hits + evalCache.misses - evalHits - evalMisses
+
+    @property
+    def nps(self):
+        return self.nodes / self.seconds if self.seconds else 0.0
+
+    @property
+    def firstMoveCutoffRate(self):
+        return self.firstMoveCutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    @property
+    def branchingFactor(self):
+        ''' Effective branching factor, how many times more nodes the last depth took than the one before '''
+        counts = self.iterationNodes
+        if len(counts) < 2:
+            return 0.0
+        last, previous = counts[-1] - counts[-2], counts[-2] - (counts[-3] if len(counts) > 2 else 0)
+        return last / previous if previous else 0.0
+
+    def asDict(self):
+        result = {"nodes": self.nodes, "qnodes": self.qnodes, "cutoffs": self.cutoffs,
+                  "firstMoveCutoffRate": round(self.firstMoveCutoffRate, 3), "ttProbes": self.ttProbes,
+                  "ttHits": self.ttHits, "pawnProbes": self.pawnProbes, "pawnHits": self.pawnHits,
+                  "evalProbes": self.evalProbes, "evalHits": self.evalHits, "depth": self.depth, "branchingFactor": round(self.branchingFactor, 2),
+                  "seconds": round(self.seconds, 4), "nps": round(self.nps)}
+        for phase in self.PHASES:
+            result[phase + "Seconds"] = round(self.phaseSeconds[phase], 4)
+        return result
+
+    def report(self):
+        ''' Multi-line summary for humans '''
+        lines = ["depth %d, %d nodes (%d quiescence) in %.3fs, %.0f nps, branching factor %.2f" % (
+                     self.depth, self.nodes, self.qnodes, self.seconds, self.nps, self.branchingFactor),
+                 "%d beta cutoffs, %.1f%% by the first move" % (self.cutoffs, 100 * self.firstMoveCutoffRate),
+                 "TT hits %d of %d probes (%.1f%%)" % (self.ttHits, self.ttProbes, 100 * self.ttHits / max(self.ttProbes, 1)),
+                 "eval cache hits %d of %d (%.1f%%), pawn table hits %d of %d (%.1f%%)" % (
+                     self.evalHits, self.evalProbes, 100 * self.evalHits / max(self.evalProbes, 1),
+                     self.pawnHits, self.pawnProbes, 100 * self.pawnHits / max(self.pawnProbes, 1))]
+        for phase in self.PHASES:
+            seconds = self.phaseSeconds[phase]
+            lines.append("%-9s %8.3fs %5.1f%%" % (phase, seconds, 100 * seconds / max(self.seconds, 1e-9)))
+        return "\n".join(lines)
+
+
+class BackgroundSearch():
+    '''
+    Runs findBestMove on a copy of the position in a daemon thread, so the caller (the pygame loop)
+    keeps running. Poll done() and collect result(), or cancel() to abort within a few nodes.
+    With ponder the search runs without a time limit, on the opponent's time, until ponderhit().
+    '''
+    def __init__(self, gs, validMoves, time_limit=None, max_depth=None, ponder=False):
+        if ponder and time_limit is None:
+            raise ValueError("pondering needs a time_limit to switch to on ponderhit")
+        self.validMoves = validMoves
+        self.position = type(gs).from_fen(gs.to_fen())  # the search makes and unmakes moves on its own copy
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.ponder = ponder
+        self.stopEvent = threading.Event()
+        self.context = SearchContext(stopEvent=self.stopEvent)
+        self.finished = threading.Event()
+        self.bestMove = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        positionMoves = self.position.getValidMoves()
+        move = bookMove(self.position, positionMoves)
+        if move is None:
+            move = tablebaseMove(self.position, positionMoves)
+        if move is None:
+            if self.ponder:
+                # no limit until ponderhit gives the search its time
+                maxDepth = self.max_depth if self.max_depth is not None else MAX_DEPTH
+                move, score, depth = iterativeDeepening(self.position, positionMoves, None, maxDepth, self.context)
+            else:
+                move, score, depth = iterativeDeepening(self.position, positionMoves, self.time_limit, self.max_depth, self.context)
+        if move is not None and not self.stopEvent.is_set():
+            # hand back the caller's own Move object
+            for m in self.validMoves:
+                if m.moveID == move.moveID:
+                    self.bestMove = m
+                    break
+        self.finished.set()
+
+    def done(self):
+        return self.finished.is_set()
+
+    def result(self):
+        ''' Best move found, None if cancelled or there are no legal moves '''
+        self.finished.wait()
+        return self.bestMove
+
+    def cancel(self):
+        self.stopEvent.set()
+
+    def ponderhit(self):
+        '''
+        The predicted move was played: the ponder search becomes the real one and finishes once
+        time_limit has passed since it started, at once if it has been pondering longer than that.
+        '''
+        self.context.ponderhit(self.time_limit)
+
+
+def findBestMove(gs, validMoves, time_limit=None, max_depth=None, withStats=False):
+    '''
+    Searches with iterative deepening and returns the best move of the deepest completed iteration.
+    time_limit is in seconds; without one the search goes to max_depth (DEPTH by default).
+    Book positions are answered from the opening book and endgames in the tablebases without searching.
+    With withStats the result is (move, SearchStats), the stats are empty for book and tablebase moves.
+    '''
+    stats = SearchStats() if withStats else None
+    move = bookMove(gs, validMoves)
+    if move is None:
+        move = tablebaseMove(gs, validMoves)
+    if move is None:
+        move, bestScore, depth = iterativeDeepening(gs, validMoves, time_limit, max_depth, SearchContext(stats=stats))
+    return (move, stats) if withStats else move
+
+
+def iterativeDeepening(gs, validMoves, time_limit=None, max_depth=None, context=None):
+    '''
+    Searches depth 1, 2, ... until max_depth or the deadline, returns (bestMove, score, depth reached).
+    Each iteration searches the previous best move first and the transposition table carries the
+    rest of the principal variation, so the deeper searches are mostly spent on new nodes.
+    '''
+    if len(validMoves) == 0:
+        return None, 0, 0
+    if max_depth is None:
+        max_depth = DEPTH if time_limit is None else MAX_DEPTH
+    if context is None:
+        context = SearchContext()
+    stats = context.stats
+    if stats is not None:
+        stats.start(gs, context)
+        try:
+            return _iterativeDeepening(gs, validMoves, time_limit, max_depth, context)
+        finally:
+            stats.finish(gs, context)
+    return _iterativeDeepening(gs, validMoves, time_limit, max_depth, context)
+
+
+def _iterativeDeepening(gs, validMoves, time_limit, max_depth, context):
+    start = time.perf_counter()
+    context.searchStart = start
+    context.completedDepth = 0
+    if time_limit is not None:
+        context.timeLimit = time_limit
+    startPly = len(gs.moveLog)
+    rootMoves = list(validMoves)
+    context.tt.newSearch()
+    context.orderer.newSearch()
+    # random tie-break among equally ordered root moves so it does not constantly play the same moves
+    context.orderer.orderMoves(rootMoves, 0, rng=context.rng)
+    bestMove, bestScore, completedDepth = rootMoves[0], 0, 0
+    for depth in range(1, max_depth + 1):
+        try:
+            move, score = searchRoot(gs, rootMoves, depth, context)
+        except SearchTimeout:
+            # unwind whatever the interrupted iteration left on the board
+            while len(gs.moveLog) > startPly:
+                gs.undoMove()
+            break
+        bestMove, bestScore, completedDepth = move, score, depth
+        context.completedDepth = depth
+        if context.stats is not None:
+            context.stats.depth = depth
+            context.stats.iterationNodes.append(context.nodes)
+        rootMoves.remove(move)
+        rootMoves.insert(0, move)
+        if context.onIteration is not None:
+            context.onIteration(depth, move, score)
+        if score >= CHECKMATE:
+            break
+        time_limit = context.timeLimit  # a ponder search gets its limit while it runs
+        if time_limit is not None:
+            elapsed = time.perf_counter() - start
+            # the next iteration takes several times longer than this one, don't start what can't finish
+            if elapsed >= time_limit / 2:
+                break
+            context.deadline = start + time_limit  # depth 1 always completes so there is a move to return
+    return bestMove, bestScore, completedDepth
+
+
+def searchRoot(gs, rootMoves, depth, context):
+    ''' Searches every root move to depth, returns (bestMove, score) '''
+    turnMultiplier = 1 if gs.whiteToMove else -1
+    alpha, beta = -CHECKMATE, CHECKMATE
+    bestMove = rootMoves[0]
     maxScore = -CHECKMATE
-    for move in validMoves:
+    for i, move in enumerate(rootMoves):
         gs.makeMove(move)
         nextMoves = gs.getValidMoves()
-        score = -findMoveNegaMaxAlphaBeta(gs,nextMoves,depth-1,-beta,-alpha,-turnMultiplier)
+        if i > 0 and context.pvs:
+            # only a move beating the best so far needs its exact score
+            score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth-1, -alpha-1, -alpha, -turnMultiplier, context, 1)
+            if score > alpha:
+                score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth-1, -beta, -alpha, -turnMultiplier, context, 1)
+        else:
+            score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth-1, -beta, -alpha, -turnMultiplier, context, 1)
+        gs.undoMove()
         if score > maxScore:
             maxScore = score
-            if depth == DEPTH:
-                nextMove = move
+            bestMove = move
+        if maxScore > alpha:
+            alpha = maxScore
+    context.tt.store(gs.zobristHash, depth, maxScore, EXACT, bestMove.moveID)
+    return bestMove, maxScore
+
+
+def getPrincipalVariation(gs, maxLength=MAX_DEPTH, tt=None):
+    ''' Follows best moves stored in the transposition table from the current position '''
+    if tt is None:
+        tt = getTranspositionTable()
+    pv = []
+    seen = set()
+    while len(pv) < maxLength and gs.zobristHash not in seen:
+        seen.add(gs.zobristHash)
+        entry = tt.probe(gs.zobristHash)
+        if entry is None:
+            break
+        move = None
+        for m in gs.getValidMoves():
+            if m.moveID == entry[3]:
+                move = m
+                break
+        if move is None:
+            break
+        pv.append(move)
+        gs.makeMove(move)
+    for _ in pv:
         gs.undoMove()
+    return pv
+
+
+def findMoveNegaMaxAlphaBeta(gs,validMoves,depth, alpha,beta, turnMultiplier, context, ply, nullAllowed=True):
+    '''
+    Negamax alpha-beta search to depth, the score is from the side to move's point of view.
+    Depending on the context, moves after the first are tried with a zero window first (PVS), late
+    quiet moves a ply shallower (LMR), and a pass that still fails high prunes the node (null move).
+    '''
+    if tablebase is not None:
+        score = tablebaseScore(gs)
+        if score is not None:
+            context.nodes += 1
+            return score
+    if depth == 0:
+        if context.quiescence:
+            return quiescenceSearch(gs, alpha, beta, turnMultiplier, context, ply, validMoves)
+        context.nodes += 1
+        return turnMultiplier * context.scoreBoard(gs)
+    context.nodes += 1
+    if len(validMoves) == 0:
+        return turnMultiplier * context.scoreBoard(gs)  # checkmate or stalemate
+    if context.nodes & 63 == 0:
+        context.checkTime()
+    alphaOrig = alpha
+    key = gs.zobristHash
+    tt = context.tt
+    hashMoveID = NO_MOVE
+    entry = tt.probe(key)
+    if entry is not None:
+        ttDepth, ttScore, ttFlag, ttMove = entry
+        if ttDepth >= depth:
+            if ttFlag == EXACT:
+                return ttScore
+            elif ttFlag == LOWERBOUND:
+                alpha = max(alpha, ttScore)
+            else:
+                beta = min(beta, ttScore)
+            if alpha >= beta:
+                return ttScore
+        hashMoveID = ttMove
+    pruneCaptures = context.staticExchange and depth <= SEE_PRUNE_DEPTH
+    inCheck = ((context.nullMove or context.lateMoveReductions) and depth >= 2 or pruneCaptures) and gs.inCheck()
+    pruneCaptures = pruneCaptures and not inCheck
+    if context.nullMove and nullAllowed and depth >= NULL_MOVE_MIN_DEPTH and not inCheck and beta < TABLEBASE_WIN \
+            and gs.hasPieces("w" if gs.whiteToMove else "b") and turnMultiplier * context.evaluate(gs) >= beta:
+        # if passing still holds beta, a real move will too. Not in check, not twice in a row and
+        # not with only pawns left, where passing would be better than any move (zugzwang).
+        startPly = len(gs.moveLog)
+        gs.makeNullMove()
+        try:
+            score = -findMoveNegaMaxAlphaBeta(gs, gs.getValidMoves(), depth-1-NULL_MOVE_REDUCTION, -beta, -beta+1, -turnMultiplier, context, ply+1, False)
+        except SearchTimeout:
+            while len(gs.moveLog) > startPly:
+                gs.undoMove()
+            gs.undoNullMove()
+            raise
+        gs.undoNullMove()
+        if score >= beta:
+            return beta
+    context.orderer.orderMoves(validMoves, ply, hashMoveID, gs if context.staticExchange else None)
+    maxScore = -CHECKMATE
+    bestMoveID = NO_MOVE
+    for i, move in enumerate(validMoves):
+        if pruneCaptures and i > 0 and losesMaterial(gs, move, SEE_PRUNE_MARGIN * depth):
+            continue  # clearly losing capture this close to the leaves, the exchange won't come back
+        gs.makeMove(move)
+        nextMoves = gs.getValidMoves()
+        if i == 0:
+            score = -findMoveNegaMaxAlphaBeta(gs,nextMoves,depth-1,-beta,-alpha,-turnMultiplier, context, ply+1)
+        else:
+            fullSearch = True
+            if context.lateMoveReductions and i >= LMR_MIN_MOVES and depth >= LMR_MIN_DEPTH and not inCheck \
+                    and move.pieceCaptured == "--" and not move.isPawnPromotion and not gs.inCheck():
+                score = -findMoveNegaMaxAlphaBeta(gs,nextMoves,depth-2,-alpha-1,-alpha,-turnMultiplier, context, ply+1)
+                fullSearch = score > alpha
+            if fullSearch and context.pvs:
+                score = -findMoveNegaMaxAlphaBeta(gs,nextMoves,depth-1,-alpha-1,-alpha,-turnMultiplier, context, ply+1)
+                fullSearch = alpha < score < beta
+            if fullSearch:
+                score = -findMoveNegaMaxAlphaBeta(gs,nextMoves,depth-1,-beta,-alpha,-turnMultiplier, context, ply+1)
+        gs.undoMove()
+        if score > maxScore:
+            maxScore = score
+            bestMoveID = move.moveID
         if maxScore > alpha:
             alpha = maxScore
         if alpha >=beta:
+            context.orderer.recordCutoff(move, depth, ply)
+            if context.stats is not None:
+                context.stats.recordCutoff(i)
             break
 
+    if maxScore <= alphaOrig:
+        flag = UPPERBOUND
+    elif maxScore >= beta:
+        flag = LOWERBOUND
+    else:
+        flag = EXACT
+    tt.store(key, depth, maxScore, flag, bestMoveID)
     return maxScore
 
 
 
 
 
+def quiescenceSearch(gs, alpha, beta, turnMultiplier, context, ply, validMoves=None):
+    '''
+    Searches captures and promotions until the position is quiet, so the evaluation is never taken
+    in the middle of an exchange. The side to move can always stand pat on the static score instead
+    of capturing, and captures that can't lift the score to alpha even if the piece is won for free
+    are skipped (delta pruning), as are captures that lose material by static exchange. When in
+    check every evasion is searched instead.
+    validMoves are the legal moves when the caller already generated them.
+    '''
+    context.nodes += 1
+    context.qnodes += 1
+    if context.nodes & 63 == 0:
+        context.checkTime()
+    if validMoves is not None and len(validMoves) == 0:
+        return turnMultiplier * context.scoreBoard(gs)  # checkmate or stalemate
+    inCheck = gs.inCheck()
+    if inCheck:
+        moves = validMoves if validMoves is not None else gs.getValidMoves()
+        if len(moves) == 0:
+            return -CHECKMATE
+        standPat = -CHECKMATE
+    else:
+        standPat = turnMultiplier * context.evaluate(gs)
+        if standPat >= beta or ply >= MAX_PLY:
+            return standPat
+        if standPat > alpha:
+            alpha = standPat
+        moves = gs.getCaptureMoves()
+    context.orderer.orderMoves(moves, ply)
+    maxScore = standPat
+    for move in moves:
+        if not inCheck and not move.isPawnPromotion:
+            if standPat + pieceScore[move.pieceCaptured[1]] * 10 + DELTA_MARGIN <= alpha:
+                continue
+            if context.staticExchange and losesMaterial(gs, move):
+                continue  # the exchange on the square would lose material
+        gs.makeMove(move)
+        score = -quiescenceSearch(gs, -beta, -alpha, -turnMultiplier, context, ply + 1)
+        gs.undoMove()
+        if score > maxScore:
+            maxScore = score
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+    return maxScore
+
+
+# material, position, pawn structure and king shield score of the board without looking for checkmate,
+# white positive. Pawn terms come from pawnTable and whole scores from evalCache.
+def evaluate(gs):
+    if gs.positionValues is not positionValues:
+        gs.enableIncrementalEval(pieceValues, positionValues)
+    key = gs.zobristHash
+    score = evalCache.probe(key)
+    if score is None:
+        structure, whiteShield, blackShield = pawnTable.probe(gs)
+        score = gs.materialScore + gs.positionScore + structure + kingSafety(gs, whiteShield, blackShield)
+        evalCache.store(key, score)
+    if DEBUG_EVAL:
+        assert score == scoreBoardFull(gs), "incremental or cached evaluation out of sync with the board"
+    return score
+
+
 # Pos number means whites winning, negative means black is winning 
 def scoreBoard(gs):
     if gs.checkmate:
@@ -116,7 +1027,11 @@ def scoreBoard(gs):
             return CHECKMATE
     elif gs.stalemate:
         return STALEMATE
+    return evaluate(gs)
 
+
+# same as evaluate, rescanning all 64 squares without the incremental sums and caches
+def scoreBoardFull(gs):
     score = 0
     for row in range(len(gs.board)):
         for col in range(len(gs.board[row])):
@@ -124,13 +1039,14 @@ def scoreBoard(gs):
                 if square != "--":
                     piecePositionScore = 0
                     if square[1] != "K":
-                        piecePositionScore = piecePositionScores[square[1]][row][col] *.1
+                        piecePositionScore = piecePositionScores[square[1]][row][col]
                         #score position
                     if square[0] == 'w':
-                        score += pieceScore[square[1]] + piecePositionScore
+                        score += pieceScore[square[1]] * 10 + piecePositionScore
                     elif square[0] == 'b':
-                        score -= pieceScore[square[1]] + piecePositionScore
-    return score
+                        score -= pieceScore[square[1]] * 10 + piecePositionScore
+    structure, whiteShield, blackShield = pawnStructure(gs.board)
+    return score + structure + kingSafety(gs, whiteShield, blackShield)
 
 
 #score board based on material 
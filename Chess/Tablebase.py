@@ -0,0 +1,536 @@
+'''
+Endgame tablebases: distance to mate for every position of small material sets (up to 4 pieces),
+generated by retrograde analysis with the engine's own move generator.
+
+    python -m Chess.Tablebase --pieces 3 --workers 4
+    python -m Chess.Tablebase KQvKR KRvKP --workers 4
+
+A material set is named by its white and black pieces, KQvKR. Positions where black has the
+stronger side are probed through the colour-mirrored set. Each set is one file in
+Chess/tablebases: a 16 byte header, then one byte per (side to move, piece squares) index,
+2 * 64^pieces bytes, so a probe is an index computation and one read from the mmapped file.
+Byte values: 0 draw, 1 illegal position, v >= 2 mate in v - 2 plies, won for the side to move
+when that is odd and lost when it is even (0 plies is checkmate).
+
+The engine always promotes to a queen, so the tables do too. Positions with castling rights or
+a possible en passant capture are not covered and probe as unknown.
+'''
+import argparse
+import mmap
+import os
+import sys
+import time
+from array import array
+
+from . import BitboardEngine, profiling
+from .BitboardEngine import KING_ATTACKS, KNIGHT_ATTACKS, bishopAttacks, rookAttacks, squares
+
+MAGIC = b"PYCHDTM1"
+HEADER_SIZE = 16  # MAGIC and the set name padded to 8 bytes
+MAX_PIECES = 4
+PIECE_ORDER = "QRBNp"  # non-king pieces, strongest first
+DRAW, ILLEGAL = 0, 1
+PENDING = 255  # generation only: not decided yet
+SUB_DRAW = 255  # generation only: a capture or promotion reaches a draw
+MAX_PLIES = 252  # longest mate a table byte can hold
+WIN, LOSS = 1, -1
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+CHUNK = 8192  # positions per worker task
+
+
+def parseSet(name):
+    ''' Pieces of a set in index order, "KRvKP" -> ["wK", "wR", "bK", "bp"] '''
+    white, black = name.split("v")
+    return [color + ("p" if ch == "P" else ch) for color, side in (("w", white), ("b", black)) for ch in side]
+
+
+def sideName(extras):
+    ''' Name of one side from its non-king pieces in engine letters, ["p", "R"] -> "KRP" '''
+    return "K" + "".join(sorted(extras, key=PIECE_ORDER.index)).upper()
+
+
+def sideStrength(extras):
+    return (len(extras), sorted(len(PIECE_ORDER) - PIECE_ORDER.index(ch) for ch in extras)[::-1])
+
+
+def setName(whiteExtras, blackExtras):
+    return sideName(whiteExtras) + "v" + sideName(blackExtras)
+
+
+def allSets(maxPieces):
+    ''' Every stored set with up to maxPieces pieces, fewest pieces first '''
+    def combinations(count, start=0):
+        if count == 0:
+            yield ""
+            return
+        for i in range(start, len(PIECE_ORDER)):
+            for rest in combinations(count - 1, i):
+                yield PIECE_ORDER[i] + rest
+    names = []
+    for total in range(1, maxPieces - 1):
+        for whiteCount in range(total, -1, -1):
+            for white in combinations(whiteCount):
+                for black in combinations(total - whiteCount):
+                    if sideStrength(white) >= sideStrength(black):
+                        name = setName(white, black)
+                        if name not in names:
+                            names.append(name)
+    return names
+
+
+def positionKey(pieces, whiteToMove):
+    '''
+    (set name, index) of a position given as [(piece, square), ...], mirrored so the stronger
+    side is white. Pieces of the same kind take their slots in square order.
+    '''
+    pieces = list(pieces)
+    whiteExtras = [piece[1] for piece, sq in pieces if piece[0] == "w" and piece[1] != "K"]
+    blackExtras = [piece[1] for piece, sq in pieces if piece[0] == "b" and piece[1] != "K"]
+    if sideStrength(whiteExtras) < sideStrength(blackExtras):
+        pieces = [(("b" if piece[0] == "w" else "w") + piece[1], sq ^ 56) for piece, sq in pieces]
+        whiteToMove = not whiteToMove
+        whiteExtras, blackExtras = blackExtras, whiteExtras
+    name = setName(whiteExtras, blackExtras)
+    index = 0 if whiteToMove else 1
+    for piece in parseSet(name):
+        sq = min(s for p, s in pieces if p == piece)
+        pieces.remove((piece, sq))
+        index = index * 64 + sq
+    return name, index
+
+
+def decodeValue(value):
+    ''' (WIN/LOSS/DRAW, plies to mate) for a table byte, None for illegal or unknown positions '''
+    if value == DRAW:
+        return DRAW, 0
+    if value == ILLEGAL or value == PENDING:
+        return None
+    plies = value - 2
+    return (WIN if plies & 1 else LOSS), plies
+
+
+def tablePath(directory, name):
+    return os.path.join(directory, name + ".dtm")
+
+
+def openTable(path, name):
+    ''' Read-only mmap of the table file of set name, raises ValueError if it is not one '''
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if data[:8] != MAGIC or data[8:16].rstrip(b"\0").decode() != name or len(data) != HEADER_SIZE + 2 * 64 ** len(parseSet(name)):
+        data.close()
+        raise ValueError(path + " is not a tablebase file")
+    return data
+
+
+class Tablebase():
+    ''' Probes the table files of a directory, each mmapped on first use '''
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+        self.tables = {}
+        names = [f[:-4] for f in os.listdir(directory) if f.endswith(".dtm")] if os.path.isdir(directory) else []
+        self.available = set(names)
+        self.maxPieces = max((len(parseSet(name)) for name in names), default=0)
+
+    def __len__(self):
+        return len(self.available)
+
+    def table(self, name):
+        data = self.tables.get(name)
+        if data is None and name in self.available:
+            try:
+                data = self.tables[name] = openTable(tablePath(self.directory, name), name)
+            except (OSError, ValueError):
+                self.available.discard(name)
+        return data
+
+    def probe(self, gs):
+        '''
+        (WIN/LOSS/DRAW, plies to mate) for the side to move, None when the position is not covered.
+        Cheap to call on bigger positions, those are rejected by their piece count first.
+        '''
+        occupied = getattr(gs, "occupied", None)
+        if occupied is not None:
+            if bin(occupied).count("1") > self.maxPieces:
+                return None
+            pieces = [(piece, sq) for piece, bb in gs.bitboards.items() if bb for sq in squares(bb)]
+        else:
+            pieces = [(gs.board[r][c], r * 8 + c) for r in range(8) for c in range(8) if gs.board[r][c] != "--"]
+            if len(pieces) > self.maxPieces:
+                return None
+        if gs.castleRights:
+            return None
+        if gs.enpassantSquare >= 0:
+            # only matters when a pawn of the side to move can take en passant
+            row, col = divmod(gs.enpassantSquare, 8)
+            pawnRow, pawn = (row + 1, "wp") if gs.whiteToMove else (row - 1, "bp")
+            if (pawn, pawnRow * 8 + col - 1) in pieces and col > 0 or (pawn, pawnRow * 8 + col + 1) in pieces and col < 7:
+                return None
+        name, index = positionKey(pieces, gs.whiteToMove)
+        if name == "KvK":
+            return DRAW, 0
+        data = self.table(name)
+        if data is None:
+            return None
+        return decodeValue(data[HEADER_SIZE + index])
+
+    def bestMove(self, gs, validMoves):
+        '''
+        The move keeping the best tablebase result: the fastest mate when winning, the longest
+        resistance when losing, a drawing move otherwise. None when any reply is not covered.
+        '''
+        result = self.probe(gs)
+        if result is None or not validMoves:
+            return None
+        best, bestKey = None, None
+        for move in validMoves:
+            gs.makeMove(move)
+            child = self.probe(gs)
+            gs.undoMove()
+            if child is None:
+                return None
+            outcome, plies = child
+            # the child is from the opponent's point of view: their loss in few plies is best
+            if outcome == LOSS:
+                key = (2, -plies)
+            elif outcome == DRAW:
+                key = (1, 0)
+            else:
+                key = (0, plies)
+            if bestKey is None or key > bestKey:
+                best, bestKey = move, key
+        return best
+
+
+def loadTablebase(directory=DEFAULT_DIRECTORY):
+    ''' Tablebase of directory, None if it holds no tables '''
+    tablebase = Tablebase(directory)
+    return tablebase if len(tablebase) else None
+
+
+class SetSolver():
+    '''
+    Evaluates positions of one set for the generator. Lives in the worker processes for pass 0 and
+    keeps an empty-board game state and the finished smaller tables open between tasks.
+    '''
+    def __init__(self, name, directory):
+        self.name = name
+        self.pieces = parseSet(name)
+        count = len(self.pieces)
+        self.multipliers = [64 ** (count - 1 - slot) for slot in range(count)]
+        self.sideSize = 64 ** count
+        self.directory = directory
+        self.subTables = Tablebase(directory)
+        self.gs = gs = BitboardEngine.BitboardGameState()
+        gs.board = [["--"] * 8 for _ in range(8)]  # not a legal FEN, setPosition places the pieces
+        gs.castleRights = 0
+        gs.loadBitboards()
+        self.placed = []
+
+    def setPosition(self, index):
+        '''
+        Puts the position of index on the board, returns its squares in slot order,
+        or None when the index is not a legal position.
+        '''
+        gs = self.gs
+        for piece, sq in self.placed:
+            gs.board[sq >> 3][sq & 7] = "--"
+            gs.togglePiece(piece, sq)
+        self.placed = []
+        gs.whiteToMove = index < self.sideSize
+        rest = index % self.sideSize
+        slots = []
+        for multiplier in self.multipliers:
+            slots.append(rest // multiplier)
+            rest %= multiplier
+        if len(set(slots)) != len(slots):
+            return None
+        for piece, sq in zip(self.pieces, slots):
+            if piece[1] == "p" and (sq < 8 or sq >= 56):
+                return None
+        for piece, sq in zip(self.pieces, slots):
+            gs.board[sq >> 3][sq & 7] = piece
+            gs.togglePiece(piece, sq)
+            if piece == "wK":
+                gs.whiteKingLocation = (sq >> 3, sq & 7)
+            elif piece == "bK":
+                gs.blackKingLocation = (sq >> 3, sq & 7)
+        self.placed = list(zip(self.pieces, slots))
+        # the side that just moved may not be in check
+        waiting = "b" if gs.whiteToMove else "w"
+        kingSq = gs.bitboards[waiting + "K"].bit_length() - 1
+        if gs.attackersTo(kingSq, "w" if waiting == "b" else "b", gs.occupied):
+            return None
+        return slots
+
+    def initial(self, start, end):
+        '''
+        Pass 0 over indexes start..end with the engine's move generator. Returns four bytearrays:
+        the value (ILLEGAL, checkmate 2, stalemate DRAW or PENDING), the number of quiet moves staying
+        in the set, the best win reached through a capture or promotion (0 for none) and the longest
+        mate against the side to move through one (SUB_DRAW when one of them draws).
+        '''
+        count = end - start
+        values, quiet, subWin, subLongest = bytearray(count), bytearray(count), bytearray(count), bytearray(count)
+        gs = self.gs
+        for index in range(start, end):
+            i = index - start
+            if self.setPosition(index) is None:
+                values[i] = ILLEGAL
+                continue
+            moves, checkers = gs.generateMoves(False)
+            if not moves:
+                values[i] = 2 if checkers else DRAW
+                continue
+            values[i] = PENDING
+            for move in moves:
+                if move.pieceCaptured == "--" and not move.isPawnPromotion:
+                    quiet[i] += 1
+                    continue
+                value = self.subValue(move)
+                if value == DRAW:
+                    subLongest[i] = SUB_DRAW
+                elif value & 1:  # the opponent wins
+                    if subLongest[i] != SUB_DRAW:
+                        subLongest[i] = max(subLongest[i], value - 2)
+                elif subWin[i] == 0 or value + 1 < subWin[i]:
+                    subWin[i] = value + 1
+        return values, quiet, subWin, subLongest
+
+    def subValue(self, move):
+        ''' Table byte, from the opponent's side, of the smaller set reached by a capture or promotion '''
+        start = move.startRow * 8 + move.startCol
+        end = move.endRow * 8 + move.endCol
+        moved = move.pieceMoved[0] + "Q" if move.isPawnPromotion else move.pieceMoved
+        pieces = [((moved, end) if sq == start else (piece, sq)) for piece, sq in self.placed if sq != end]
+        name, index = positionKey(pieces, not self.gs.whiteToMove)
+        if name == "KvK":
+            return DRAW
+        table = self.subTables.table(name)
+        if table is None:
+            raise ValueError("tablebase %s needs %s first" % (self.name, name))
+        return table[HEADER_SIZE + index]
+
+    def predecessors(self, index):
+        '''
+        Indexes of the positions one quiet move (no capture or promotion) before index: every
+        piece of the side that just moved is taken back along its moves to an empty square.
+        Some of them may be illegal positions.
+        '''
+        sideSize = self.sideSize
+        whiteToMove = index < sideSize
+        rest = index if whiteToMove else index - sideSize
+        base = sideSize if whiteToMove else -sideSize  # the other side was to move before
+        slots = []
+        for multiplier in self.multipliers:
+            slots.append(rest // multiplier)
+            rest %= multiplier
+        occupied = 0
+        for sq in slots:
+            occupied |= 1 << sq
+        empty = ~occupied & BitboardEngine.FULL
+        mover = "b" if whiteToMove else "w"
+        result = []
+        for slot, piece in enumerate(self.pieces):
+            if piece[0] != mover:
+                continue
+            sq = slots[slot]
+            kind = piece[1]
+            if kind == "K":
+                targets = KING_ATTACKS[sq] & empty
+            elif kind == "N":
+                targets = KNIGHT_ATTACKS[sq] & empty
+            elif kind == "B":
+                targets = bishopAttacks(sq, occupied) & empty
+            elif kind == "R":
+                targets = rookAttacks(sq, occupied) & empty
+            elif kind == "Q":
+                targets = (rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)) & empty
+            elif mover == "w":  # white pawns came up the board, from row 6 on a double push
+                targets = 0
+                if sq < 48 and not occupied >> (sq + 8) & 1:
+                    targets = 1 << (sq + 8)
+                    if sq >> 3 == 4 and not occupied >> (sq + 16) & 1:
+                        targets |= 1 << (sq + 16)
+            else:
+                targets = 0
+                if sq >= 16 and not occupied >> (sq - 8) & 1:
+                    targets = 1 << (sq - 8)
+                    if sq >> 3 == 3 and not occupied >> (sq - 16) & 1:
+                        targets |= 1 << (sq - 16)
+            multiplier = self.multipliers[slot]
+            partial = index + base - sq * multiplier
+            for origin in squares(targets):
+                result.append(partial + origin * multiplier)
+        return result
+
+
+_solvers = {}
+
+
+def _solver(name, directory):
+    solver = _solvers.get(name)
+    if solver is None:
+        solver = _solvers[name] = SetSolver(name, directory)
+    return solver
+
+
+def _initialTask(name, directory, start, end):
+    return (start,) + _solver(name, directory).initial(start, end)
+
+
+def writeTable(path, name, values):
+    temp = "%s.%d.tmp" % (path, os.getpid())
+    with open(temp, "wb") as f:
+        f.write(MAGIC + name.encode().ljust(8, b"\0"))
+        f.write(values)
+    os.replace(temp, path)
+
+
+def dependencies(name):
+    ''' Sets reached from name by a capture or a promotion '''
+    pieces = parseSet(name)
+    result = []
+    for i, piece in enumerate(pieces):
+        if piece[1] == "K":
+            continue
+        rest = pieces[:i] + pieces[i + 1:]
+        children = [rest]
+        if piece[1] == "p":
+            children.append(pieces[:i] + [piece[0] + "Q"] + pieces[i + 1:])
+        for child in children:
+            white = [p[1] for p in child if p[0] == "w" and p[1] != "K"]
+            black = [p[1] for p in child if p[0] == "b" and p[1] != "K"]
+            if sideStrength(white) < sideStrength(black):
+                white, black = black, white
+            childName = setName(white, black)
+            if childName != "KvK" and childName not in result:
+                result.append(childName)
+    return result
+
+
+def queueInitial(values, counters, longest, buckets, chunkStart, chunk, quiet, subWin, subLongest):
+    '''
+    Copies one chunk of pass 0 into the generation arrays and queues the positions it decides:
+    checkmates, wins through a capture or promotion, and positions whose every move is a capture
+    or promotion losing to the opponent, lost in the longest of those mates plus one ply.
+    '''
+    chunkEnd = chunkStart + len(chunk)
+    values[chunkStart:chunkEnd] = chunk.replace(bytes([PENDING]), bytes([DRAW]))
+    counters[chunkStart:chunkEnd] = quiet
+    longest[chunkStart:chunkEnd] = subLongest
+    for i, value in enumerate(chunk):
+        if value == 2:
+            buckets[0].append(chunkStart + i)
+        elif value == PENDING and not subWin[i] and not quiet[i] and subLongest[i] != SUB_DRAW:
+            values[chunkStart + i] = subLongest[i] + 3
+            buckets[subLongest[i] + 1].append(chunkStart + i)
+    for i, value in enumerate(subWin):
+        if value:
+            values[chunkStart + i] = value
+            buckets[value - 2].append(chunkStart + i)
+
+
+def generateSet(name, directory=DEFAULT_DIRECTORY, workers=1, out=sys.stdout):
+    ''' Builds and writes the table of one set, its dependencies must already exist '''
+    pieces = parseSet(name)
+    size = 2 * 64 ** len(pieces)
+    begin = time.perf_counter()
+    pool = None
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=workers)
+    run = pool.map if pool is not None else map
+    values = bytearray(size)
+    counters = bytearray(size)  # quiet moves whose result is not known yet
+    longest = bytearray(size)  # longest mate against the side to move among the decided moves
+    buckets = [array("I") for _ in range(256)]  # positions to decide, by plies to mate
+    try:
+        starts = range(0, size, CHUNK)
+        for chunkStart, chunk, quiet, subWin, subLongest in run(
+                _initialTask, [name] * len(starts), [directory] * len(starts), starts, [min(s + CHUNK, size) for s in starts]):
+            queueInitial(values, counters, longest, buckets, chunkStart, chunk, quiet, subWin, subLongest)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    initialSeconds = time.perf_counter() - begin
+
+    # Retrograde pass: positions are decided in order of plies to mate, each one then updating the
+    # positions a quiet move before it. A lost position makes them won one ply later, a won one
+    # counts down their undecided moves and they are lost once every move is known to lose.
+    # Until decided, values holds DRAW or the best win found so far.
+    solver = _solver(name, directory)
+    decided = bytearray(size)
+    for plies in range(MAX_PLIES + 1):
+        value = plies + 2
+        lost = not plies & 1
+        for index in buckets[plies]:
+            if decided[index] or values[index] != value:
+                continue  # decided earlier or improved since it was queued
+            decided[index] = 1
+            for previous in solver.predecessors(index):
+                if decided[previous]:
+                    continue
+                previousValue = values[previous]
+                if lost:
+                    if previousValue == DRAW or previousValue > value + 1:
+                        values[previous] = value + 1
+                        buckets[plies + 1].append(previous)
+                elif previousValue == DRAW:
+                    counters[previous] -= 1
+                    if longest[previous] != SUB_DRAW:
+                        if plies > longest[previous]:
+                            longest[previous] = plies
+                        if counters[previous] == 0:
+                            values[previous] = longest[previous] + 3
+                            buckets[longest[previous] + 1].append(previous)
+        buckets[plies] = None
+    writeTable(tablePath(directory, name), name, values)
+    wins = sum(1 for v in values if v >= 2 and v & 1)
+    print("%-6s %9d positions  longest mate %3d plies  %7.1fs (move generation %.1fs)" % (
+        name, size - values.count(ILLEGAL), max(values) - 2 if wins else 0, time.perf_counter() - begin, initialSeconds), file=out)
+
+
+def generate(names, directory=DEFAULT_DIRECTORY, workers=1, force=False, out=sys.stdout):
+    ''' Generates the named sets and everything they depend on, smallest first '''
+    order = []
+
+    def visit(name):
+        if name in order:
+            return
+        for dependency in dependencies(name):
+            visit(dependency)
+        order.append(name)
+    for name in names:
+        visit(name)
+    os.makedirs(directory, exist_ok=True)
+    for name in order:
+        if force or not os.path.exists(tablePath(directory, name)):
+            generateSet(name, directory, workers, out)
+    return order
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate endgame tablebases by retrograde analysis")
+    parser.add_argument("sets", nargs="*", help="material sets such as KQvK or KRvKP")
+    parser.add_argument("--pieces", type=int, choices=range(3, MAX_PIECES + 1), help="every set with up to this many pieces")
+    parser.add_argument("--directory", default=DEFAULT_DIRECTORY)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--force", action="store_true", help="regenerate tables that already exist")
+    profiling.addProfileOption(parser)
+    args = parser.parse_args(argv)
+    names = list(args.sets)
+    if args.pieces:
+        names += allSets(args.pieces)
+    if not names:
+        parser.error("name some sets or use --pieces")
+    for name in names:
+        if "v" not in name or not name.startswith("K") or len(parseSet(name)) > MAX_PIECES:
+            parser.error("bad set " + name)
+    profiling.runProfiled(args.profile, generate, names, args.directory, args.workers, args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+'''
+Batch analysis: searches every FEN of a file (one per line) and writes one JSON line per position.
+
+    python -m Chess.analyze positions.fen --depth 3 > results.jsonl
+    python -m Chess.analyze positions.fen --time 0.5 --workers 4 --output results.jsonl
+    cat positions.fen | python -m Chess.analyze - --depth 2
+    python -m Chess.analyze positions.fen --depth 3 --stats --profile analyze.prof
+
+The file is streamed and only a few positions per worker are in flight at a time, so memory use
+does not grow with the size of the input. Results come out in input order. --stats adds node,
+cutoff, TT and phase timing counts to every result; --profile only sees the main process, so
+profile without --workers.
+'''
+import argparse
+import collections
+import json
+import sys
+import time
+
+from . import BitboardEngine, SmartMoveFinder, profiling
+
+# positions queued per worker, enough to keep the workers busy while results are written
+QUEUE_PER_WORKER = 4
+
+
+def analyzePosition(fen, depth=None, time_limit=None, stats=False):
+    '''
+    Searches one position and returns its result as a dict. Scores are in tenths of a pawn from
+    the side to move's point of view. Bad FENs give a dict with an "error" key instead of raising.
+    With stats the search statistics (SearchStats.asDict) are added under "stats".
+    '''
+    try:
+        gs = BitboardEngine.BitboardGameState.from_fen(fen)
+    except (ValueError, IndexError, KeyError) as e:
+        return {"fen": fen, "error": str(e)}
+    validMoves = gs.getValidMoves()
+    if len(validMoves) == 0:
+        return {"fen": fen, "move": None, "result": "checkmate" if gs.checkmate else "stalemate"}
+    context = SmartMoveFinder.SearchContext(stats=SmartMoveFinder.SearchStats() if stats else None)
+    start = time.perf_counter()
+    move, score, reached = SmartMoveFinder.iterativeDeepening(gs, validMoves, time_limit, depth, context)
+    result = {"fen": fen, "move": move.getChessNotation(), "score": score, "depth": reached,
+              "nodes": context.nodes, "seconds": round(time.perf_counter() - start, 4)}
+    if stats:
+        result["stats"] = context.stats.asDict()
+    return result
+
+
+def readFens(lines):
+    ''' FEN strings of lines, skipping blank lines and # comments '''
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def analyzeStream(fens, depth=None, time_limit=None, workers=1, stats=False):
+    '''
+    Yields the result of every FEN of the iterable fens, in order. With more than one worker the
+    positions are searched in a process pool, with at most QUEUE_PER_WORKER positions per worker pending.
+    '''
+    if workers <= 1:
+        for fen in fens:
+            yield analyzePosition(fen, depth, time_limit, stats)
+        return
+    # imported here, multiprocessing is a large part of the start-up time otherwise
+    from concurrent.futures import ProcessPoolExecutor
+    pending = collections.deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for fen in fens:
+            pending.append(pool.submit(analyzePosition, fen, depth, time_limit, stats))
+            if len(pending) >= workers * QUEUE_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search every FEN of a file and write the results as JSON lines")
+    parser.add_argument("input", help="file with one FEN per line, - for stdin")
+    parser.add_argument("--output", "-o", help="JSONL output file, stdout by default")
+    parser.add_argument("--depth", type=int, help="search depth, the default is SmartMoveFinder.DEPTH without --time")
+    parser.add_argument("--time", type=float, help="seconds per position")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser.add_argument("--stats", action="store_true", help="add search statistics to every result")
+    profiling.addProfileOption(parser)
+    args = parser.parse_args(argv)
+    return profiling.runProfiled(args.profile, run, args)
+
+
+def run(args):
+    inFile = sys.stdin if args.input == "-" else open(args.input)
+    outFile = sys.stdout if args.output is None else open(args.output, "w")
+    count = 0
+    errors = 0
+    start = time.perf_counter()
+    try:
+        for result in analyzeStream(readFens(inFile), args.depth, args.time, args.workers, args.stats):
+            outFile.write(json.dumps(result) + "\n")
+            count += 1
+            if "error" in result:
+                errors += 1
+    finally:
+        if inFile is not sys.stdin:
+            inFile.close()
+        if outFile is not sys.stdout:
+            outFile.close()
+    seconds = time.perf_counter() - start
+    print("analysed %d positions (%d errors) in %.2fs, %.1f positions/s" % (count, errors, seconds, count / max(seconds, 1e-9)), file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+'''
+Search benchmarks on a fixed set of positions.
+
+    python -m Chess.bench ordering --depth 3
+    python -m Chess.bench quiescence --depth 3
+    python -m Chess.bench pruning --depth 4
+    python -m Chess.bench see --depth 4
+    python -m Chess.bench eval --depth 3
+    python -m Chess.bench parallel --depth 3 --workers 1 2 4 8
+    python -m Chess.bench movegen --depth 3
+    python -m Chess.bench startup --repeat 10
+    python -m Chess.bench pgn games.pgn --workers 1 2 4
+    python -m Chess.bench ponder --time 2 --think 3
+'''
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from . import BitboardEngine, ChessEngine, SmartMoveFinder, ParallelSearch, Pgn, perft, profiling
+
+BENCH_POSITIONS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+]
+
+
+def searchPosition(fen, depth, context):
+    ''' Fixed depth search of one position, returns (nodes, seconds, best move notation) '''
+    gs = BitboardEngine.BitboardGameState.from_fen(fen)
+    context.rng = random.Random(fen)  # the same root tie-breaks on every run
+    start = time.perf_counter()
+    move, score, reached = SmartMoveFinder.iterativeDeepening(gs, gs.getValidMoves(), max_depth=depth, context=context)
+    return context.nodes, time.perf_counter() - start, move.getChessNotation()
+
+
+def runConfigs(configs, depth, out=sys.stdout):
+    '''
+    Searches every bench position with each configuration, a dict of name -> function returning
+    a fresh SearchContext. Each configuration starts with an empty pawn table and eval cache, so
+    none of them runs on the ones the configurations before it warmed up. Prints per position
+    results and returns {name: (nodes, seconds)}.
+    '''
+    totals = {}
+    saved = SmartMoveFinder.pawnTable, SmartMoveFinder.evalCache
+    try:
+        for name, makeContext in configs.items():
+            SmartMoveFinder.pawnTable, SmartMoveFinder.evalCache = SmartMoveFinder.PawnHashTable(), SmartMoveFinder.EvalCache()
+            nodes = 0
+            seconds = 0.0
+            for fen in BENCH_POSITIONS:
+                n, s, move = searchPosition(fen, depth, makeContext())
+                nodes += n
+                seconds += s
+                print("%-10s %-5s %9d nodes %7.2fs  %s" % (name, move, n, s, fen), file=out)
+            totals[name] = (nodes, seconds)
+    finally:
+        SmartMoveFinder.pawnTable, SmartMoveFinder.evalCache = saved
+    print(file=out)
+    baseNodes, baseSeconds = next(iter(totals.values()))
+    for name, (nodes, seconds) in totals.items():
+        print("%-10s %9d nodes %7.2fs %8.0f nps  %5.2fx fewer nodes" % (
+            name, nodes, seconds, nodes / max(seconds, 1e-9), baseNodes / max(nodes, 1)), file=out)
+    return totals
+
+
+def benchOrdering(depth):
+    # without the quiescence search, unordered capture sequences blow up on the tactical positions
+    return runConfigs({
+        "unordered": lambda: SmartMoveFinder.SearchContext(tt=SmartMoveFinder.TranspositionTable(), orderer=SmartMoveFinder.NoOrdering(), quiescence=False),
+        "ordered": lambda: SmartMoveFinder.SearchContext(tt=SmartMoveFinder.TranspositionTable(), orderer=SmartMoveFinder.MoveOrderer(), quiescence=False),
+    }, depth)
+
+
+def benchQuiescence(depth):
+    return runConfigs({
+        "static": lambda: SmartMoveFinder.SearchContext(tt=SmartMoveFinder.TranspositionTable(), orderer=SmartMoveFinder.MoveOrderer(), quiescence=False),
+        "quiescence": lambda: SmartMoveFinder.SearchContext(tt=SmartMoveFinder.TranspositionTable(), orderer=SmartMoveFinder.MoveOrderer()),
+    }, depth)
+
+
+def benchPruning(depth):
+    ''' Plain alpha-beta against PVS, null move pruning and late move reductions, alone and together '''
+    def config(pvs=False, nullMove=False, lateMoveReductions=False):
+        return lambda: SmartMoveFinder.SearchContext(tt=SmartMoveFinder.TranspositionTable(), orderer=SmartMoveFinder.MoveOrderer(),
+                                                     pvs=pvs, nullMove=nullMove, lateMoveReductions=lateMoveReductions)
+    return runConfigs({
+        "alphabeta": config(),
+        "pvs": config(pvs=True),
+        "nullmove": config(nullMove=True),
+        "lmr": config(lateMoveReductions=True),
+        "all": config(True, True, True),
+    }, depth)
+
+
+def benchSee(depth, seconds=1.0, out=sys.stdout):
+    '''
+    Static exchange evaluations per second on the captures of the bench positions with each engine,
+    then nodes searched with MVV-LVA ordering only against SEE ordering and pruning.
+    '''
+    for engine in (ChessEngine.GameState, BitboardEngine.BitboardGameState):
+        captures = []
+        for fen in BENCH_POSITIONS:
+            gs = engine.from_fen(fen)
+            captures.extend((gs, move) for move in gs.getCaptureMoves())
+        calls = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            for gs, move in captures:
+                gs.staticExchange(move, SmartMoveFinder.seeValues)
+            calls += len(captures)
+        elapsed = time.perf_counter() - start
+        print("%-18s %3d captures %8.0f SEE calls/s %6.1fus per call" % (
+            engine.__name__, len(captures), calls / elapsed, elapsed / calls * 1e6), file=out)
+    print(file=out)
+    return runConfigs({
+        "mvv-lva": lambda: SmartMoveFinder.SearchContext(tt=SmartMoveFinder.TranspositionTable(), orderer=SmartMoveFinder.MoveOrderer(), staticExchange=False),
+        "see": lambda: SmartMoveFinder.SearchContext(tt=SmartMoveFinder.TranspositionTable(), orderer=SmartMoveFinder.MoveOrderer()),
+    }, depth)
+
+
+def benchEval(depth, out=sys.stdout):
+    '''
+    Cost per evaluation: the positions evaluated while searching the bench positions are recorded
+    and replayed in the same order through the material and position sums alone, the full
+    evaluation computed from scratch, and evaluate() with a fresh pawn table and eval cache.
+    Returns {name: seconds per call}.
+    '''
+    recorded = []
+
+    def record(gs):
+        recorded.append(gs.to_fen())
+        return SmartMoveFinder.evaluate(gs)
+
+    for fen in BENCH_POSITIONS:
+        context = SmartMoveFinder.SearchContext(tt=SmartMoveFinder.TranspositionTable(), orderer=SmartMoveFinder.MoveOrderer())
+        context.evaluate = record
+        searchPosition(fen, depth, context)
+    states = [BitboardEngine.BitboardGameState.from_fen(fen) for fen in recorded]
+    for gs in states:
+        gs.enableIncrementalEval(SmartMoveFinder.pieceValues, SmartMoveFinder.positionValues)
+
+    def plain(gs):
+        return gs.materialScore + gs.positionScore
+
+    def uncached(gs):
+        structure, whiteShield, blackShield = SmartMoveFinder.pawnStructure(gs.board)
+        return gs.materialScore + gs.positionScore + structure + SmartMoveFinder.kingSafety(gs, whiteShield, blackShield)
+
+    saved = SmartMoveFinder.pawnTable, SmartMoveFinder.evalCache
+    SmartMoveFinder.pawnTable, SmartMoveFinder.evalCache = SmartMoveFinder.PawnHashTable(), SmartMoveFinder.EvalCache()
+    perCall = {}
+    try:
+        for name, function in (("material+position", plain), ("uncached", uncached), ("cached", SmartMoveFinder.evaluate)):
+            start = time.perf_counter()
+            for gs in states:
+                function(gs)
+            perCall[name] = (time.perf_counter() - start) / len(states)
+            print("%-18s %7.2fus per evaluation" % (name, perCall[name] * 1e6), file=out)
+        for name, table in (("pawn table", SmartMoveFinder.pawnTable), ("eval cache", SmartMoveFinder.evalCache)):
+            stats = table.getStats()
+            print("%-18s %6d hits of %6d probes (%.1f%%)" % (
+                name, stats["hits"], stats["hits"] + stats["misses"], 100 * stats["hits"] / max(stats["hits"] + stats["misses"], 1)), file=out)
+    finally:
+        SmartMoveFinder.pawnTable, SmartMoveFinder.evalCache = saved
+    print("%d evaluations recorded at depth %d" % (len(states), depth), file=out)
+    return perCall
+
+
+def benchParallel(depth, workerCounts, out=sys.stdout):
+    ''' Wall time of the root-split search for each worker count, returns {workers: seconds} '''
+    times = {}
+    for workers in workerCounts:
+        pool = ParallelSearch.getPool(workers)
+        list(pool.map(abs, range(workers)))  # start the processes before timing
+        start = time.perf_counter()
+        for fen in BENCH_POSITIONS:
+            gs = BitboardEngine.BitboardGameState.from_fen(fen)
+            move, score = ParallelSearch.findBestMoveParallel(gs, gs.getValidMoves(), max_depth=depth, workers=workers)
+            print("%2d workers %-5s %6d  %s" % (workers, move.getChessNotation(), score, fen), file=out)
+        times[workers] = time.perf_counter() - start
+        ParallelSearch.shutdownPool()
+    print(file=out)
+    base = times[workerCounts[0]]
+    for workers, seconds in times.items():
+        print("%2d workers %7.2fs  %5.2fx speedup" % (workers, seconds, base / seconds), file=out)
+    return times
+
+
+def objectSize(obj):
+    ''' Bytes used by an object and its attribute dict, if it has one '''
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def benchMovegen(depth, out=sys.stdout):
+    ''' Move object size, perft speed and peak memory of a search per searched node '''
+    gs = BitboardEngine.BitboardGameState.from_fen(BENCH_POSITIONS[1])
+    moves = gs.getValidMoves()
+    print("Move object: %d bytes" % objectSize(moves[0]), file=out)
+
+    nodes, seconds = perft.timedPerft(gs, depth + 1)
+    print("perft %d: %d nodes %.2fs %.0f nps" % (depth + 1, nodes, seconds, nodes / max(seconds, 1e-9)), file=out)
+
+    context = SmartMoveFinder.SearchContext(tt=SmartMoveFinder.TranspositionTable(), orderer=SmartMoveFinder.MoveOrderer(), rng=random.Random(0))
+    tracemalloc.start()
+    SmartMoveFinder.iterativeDeepening(gs, gs.getValidMoves(), max_depth=depth, context=context)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("search depth %d: %d nodes, peak %d bytes, %.1f bytes/node" % (depth, context.nodes, peak, peak / context.nodes), file=out)
+
+
+STARTUP_MODULES = ["Chess.ChessEngine", "Chess.BitboardEngine", "Chess.SmartMoveFinder", "Chess.analyze", "Chess.uci", "Chess.ChessMain"]
+
+# run in a fresh interpreter: import time, whether pygame got loaded, and the time to a first search
+STARTUP_SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import %s
+imported = time.perf_counter()
+if sys.argv[1] == "search":
+    from Chess import BitboardEngine, SmartMoveFinder
+    gs = BitboardEngine.BitboardGameState()
+    SmartMoveFinder.findBestMove(gs, gs.getValidMoves(), max_depth=1)
+print(imported - start, time.perf_counter() - start, "pygame" in sys.modules)
+'''
+
+
+def benchStartup(repeat, out=sys.stdout):
+    '''
+    Cold start of each entry module in fresh interpreters, median of repeat runs.
+    Returns {module: (import seconds, seconds to a finished depth 1 search, process seconds)}.
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = {}
+    for module in STARTUP_MODULES:
+        imports, searches, processes = [], [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT % module, "search"], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.split()
+            processes.append(time.perf_counter() - start)
+            imports.append(float(output[0]))
+            searches.append(float(output[1]))
+        results[module] = (statistics.median(imports), statistics.median(searches), statistics.median(processes))
+        print("%-22s import %6.1fms  first search %6.1fms  process %6.1fms  pygame loaded: %s" % (
+            module, results[module][0] * 1000, results[module][1] * 1000, results[module][2] * 1000, output[2]), file=out)
+    if sys.dont_write_bytecode:
+        print("note: bytecode caching is off (PYTHONDONTWRITEBYTECODE), every run recompiles the modules", file=out)
+    return results
+
+
+def benchPgn(path, workerCounts, out=sys.stdout):
+    ''' Games per second replaying a PGN file for each worker count, returns {workers: games per second} '''
+    rates = {}
+    for workers in workerCounts:
+        start = time.perf_counter()
+        games, positions, errors = Pgn.extract(path, workers=workers)
+        seconds = time.perf_counter() - start
+        rates[workers] = games / max(seconds, 1e-9)
+        print("%2d workers %6d games %8d positions %7.2fs %7.1f games/s %8.0f positions/s" % (
+            workers, games, positions, seconds, rates[workers], positions / max(seconds, 1e-9)), file=out)
+    return rates
+
+
+def benchPonder(timeLimit, think, out=sys.stdout):
+    '''
+    Seconds from the opponent's move to the engine's reply: a fresh search with timeLimit, after
+    pondering the position for think seconds (ponderhit), and to drop the ponder search on a miss.
+    Returns {name: mean seconds}.
+    '''
+    latencies = {"fresh": [], "ponderhit": [], "miss": []}
+    for fen in BENCH_POSITIONS:
+        gs = BitboardEngine.BitboardGameState.from_fen(fen)
+        for name in latencies:
+            SmartMoveFinder.getTranspositionTable().clear()
+            search = SmartMoveFinder.BackgroundSearch(gs, gs.getValidMoves(), time_limit=timeLimit, ponder=name != "fresh")
+            if name != "fresh":
+                time.sleep(think)  # the opponent thinking
+            start = time.perf_counter()
+            if name == "ponderhit":
+                search.ponderhit()
+            elif name == "miss":
+                search.cancel()
+            search.result()
+            latencies[name].append(time.perf_counter() - start)
+        print("fresh %6.0fms  ponderhit %6.1fms  miss %6.1fms  %s" % tuple(
+            [latencies[name][-1] * 1000 for name in latencies] + [fen]), file=out)
+    means = {name: statistics.mean(values) for name, values in latencies.items()}
+    print(file=out)
+    print("mean: fresh %.0fms  ponderhit %.1fms  miss %.1fms (time limit %.1fs, pondered %.1fs)" % (
+        means["fresh"] * 1000, means["ponderhit"] * 1000, means["miss"] * 1000, timeLimit, think), file=out)
+    return means
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+    ordering = sub.add_parser("ordering", help="nodes searched with and without move ordering")
+    ordering.add_argument("--depth", type=int, default=3)
+    quiescence = sub.add_parser("quiescence", help="search with and without the quiescence search")
+    quiescence.add_argument("--depth", type=int, default=3)
+    pruning = sub.add_parser("pruning", help="nodes searched with PVS, null move pruning and late move reductions")
+    pruning.add_argument("--depth", type=int, default=4)
+    see = sub.add_parser("see", help="static exchange evaluation speed and the nodes it saves")
+    see.add_argument("--depth", type=int, default=4)
+    evaluation = sub.add_parser("eval", help="evaluation cost with and without the pawn table and eval cache")
+    evaluation.add_argument("--depth", type=int, default=3)
+    parallel = sub.add_parser("parallel", help="root-split search speedup per worker count")
+    parallel.add_argument("--depth", type=int, default=3)
+    parallel.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    movegen = sub.add_parser("movegen", help="move object size, perft speed and search memory")
+    movegen.add_argument("--depth", type=int, default=3)
+    pgn = sub.add_parser("pgn", help="games per second replaying a PGN file")
+    pgn.add_argument("pgn", help="PGN file")
+    pgn.add_argument("--workers", type=int, nargs="+", default=[1])
+    ponder = sub.add_parser("ponder", help="reply latency after a ponderhit against a fresh search")
+    ponder.add_argument("--time", type=float, default=2.0, help="time limit of the searches")
+    ponder.add_argument("--think", type=float, default=3.0, help="seconds pondered before the opponent moves")
+    startup = sub.add_parser("startup", help="cold start time of the entry modules")
+    startup.add_argument("--repeat", type=int, default=10)
+    profiling.addProfileOption(parser)
+    args = parser.parse_args(argv)
+    return profiling.runProfiled(args.profile, run, args)
+
+
+def run(args):
+    if args.bench == "ordering":
+        benchOrdering(args.depth)
+    elif args.bench == "quiescence":
+        benchQuiescence(args.depth)
+    elif args.bench == "pruning":
+        benchPruning(args.depth)
+    elif args.bench == "see":
+        benchSee(args.depth)
+    elif args.bench == "eval":
+        benchEval(args.depth)
+    elif args.bench == "parallel":
+        benchParallel(args.depth, args.workers)
+    elif args.bench == "movegen":
+        benchMovegen(args.depth)
+    elif args.bench == "pgn":
+        benchPgn(args.pgn, args.workers)
+    elif args.bench == "ponder":
+        benchPonder(args.time, args.think)
+    elif args.bench == "startup":
+        benchStartup(args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+'''
+Load generator for Chess.server: plays many engine-vs-engine games at once and reports throughput
+and latency percentiles, from the client's side and the server's.
+
+    python -m Chess.loadgen --spawn --workers 4 --games 500 --depth 2
+    python -m Chess.loadgen --port 8765 --games 1000 --connections 32 --plies 20 --deadline 2
+
+Every game opens a session, plays a few random opening moves so the games differ, then asks for
+go with play until the game ends or --plies searches were made. Games are spread over --connections
+connections and all run concurrently; a go refused as overloaded is retried with exponential
+backoff and its latency includes the waits. With --spawn a server is started on a temporary Unix socket
+for the run and stopped afterwards.
+'''
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from . import BitboardEngine, profiling, server
+
+STREAM_LIMIT = 1 << 20
+RETRY_BACKOFF = 0.05  # first wait in seconds after an "overloaded" reply, doubled up to MAX_BACKOFF
+MAX_BACKOFF = 1.0
+
+
+class Connection():
+    ''' One socket to the server, requests are matched to their replies by id '''
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.requestIDs = itertools.count(1)
+        self.pending = {}
+        self.receiver = asyncio.ensure_future(self.receive())
+
+    @classmethod
+    async def open(cls, address):
+        if address[0] == "unix":
+            reader, writer = await asyncio.open_unix_connection(address[1], limit=STREAM_LIMIT)
+        else:
+            reader, writer = await asyncio.open_connection(address[1], address[2], limit=STREAM_LIMIT)
+        return cls(reader, writer)
+
+    async def request(self, **fields):
+        requestID = next(self.requestIDs)
+        fields["id"] = requestID
+        future = asyncio.get_running_loop().create_future()
+        self.pending[requestID] = future
+        self.writer.write((json.dumps(fields) + "\n").encode())
+        await self.writer.drain()
+        return await future
+
+    async def receive(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            reply = json.loads(line)
+            future = self.pending.pop(reply.get("id"), None)
+            if future is not None and not future.done():
+                future.set_result(reply)
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("server closed the connection"))
+
+    async def close(self):
+        self.writer.close()
+        self.receiver.cancel()
+
+
+def randomOpening(rng, plies):
+    ''' Coordinate moves of a random legal opening of the given length '''
+    gs = BitboardEngine.BitboardGameState()
+    moves = []
+    for _ in range(plies):
+        valid = gs.getValidMoves()
+        if not valid:
+            break
+        move = rng.choice(valid)
+        gs.makeMove(move)
+        moves.append(move.getChessNotation())
+    return moves
+
+
+async def playGame(connection, opening, args, results):
+    reply = await connection.request(op="new")
+    if "error" in reply:
+        results["errors"][reply["error"]] += 1
+        return
+    session = reply["session"]
+    for text in opening:
+        reply = await connection.request(op="move", session=session, move=text)
+        if "error" in reply:
+            results["errors"][reply["error"]] += 1
+            return
+    for _ in range(args.plies):
+        start = time.perf_counter()
+        backoff = RETRY_BACKOFF
+        while True:
+            reply = await connection.request(op="go", session=session, depth=args.depth, time=args.time,
+                                             deadline=args.deadline, play=True)
+            if reply.get("error") != "overloaded":
+                break
+            results["retries"] += 1  # the server's queue is full, back off and ask again
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+        if "error" in reply:
+            results["errors"][reply["error"]] += 1
+            break
+        results["latencies"].append(time.perf_counter() - start)
+        results["nodes"] += reply["nodes"] if "nodes" in reply else 0
+        if reply.get("move") is None:
+            break  # checkmate or stalemate
+    await connection.request(op="close", session=session)
+    results["games"] += 1
+
+
+async def runLoad(address, args, out=sys.stdout):
+    ''' Plays args.games games against the server at address, returns the results dict '''
+    rng = random.Random(args.seed)
+    openings = [randomOpening(rng, args.opening_plies) for _ in range(args.games)]
+    connections = [await Connection.open(address) for _ in range(min(args.connections, args.games))]
+    results = {"games": 0, "nodes": 0, "retries": 0, "latencies": [], "errors": collections.Counter()}
+    start = time.perf_counter()
+    await asyncio.gather(*(playGame(connections[i % len(connections)], openings[i], args, results) for i in range(args.games)))
+    seconds = time.perf_counter() - start
+    serverStats = await connections[0].request(op="stats")
+    for connection in connections:
+        await connection.close()
+
+    searches = len(results["latencies"])
+    print("%d games, %d searches in %.2fs: %.1f searches/s, %.2f games/s, %.0f nodes/s" % (
+        results["games"], searches, seconds, searches / max(seconds, 1e-9), results["games"] / max(seconds, 1e-9),
+        results["nodes"] / max(seconds, 1e-9)), file=out)
+    client = server.percentiles(results["latencies"])
+    if searches:
+        print("client latency ms: p50 %.1f  p90 %.1f  p99 %.1f  max %.1f, %d retries after overloaded" % (
+            client["p50"], client["p90"], client["p99"], client["max"], results["retries"]), file=out)
+    for error, count in results["errors"].items():
+        print("%6d errors: %s" % (count, error), file=out)
+    print("server: " + json.dumps(serverStats), file=out)
+    results["seconds"] = seconds
+    results["server"] = serverStats
+    return results
+
+
+def spawnServer(workers, maxQueue):
+    ''' Starts Chess.server on a temporary Unix socket, returns (process, address) once it listens '''
+    path = os.path.join(tempfile.mkdtemp(), "chess.sock")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, "-m", "Chess.server", "--unix", path, "--workers", str(workers),
+                                "--max-queue", str(maxQueue)], cwd=root, stderr=subprocess.PIPE, text=True)
+    line = process.stderr.readline()  # "listening on ..." once the socket is bound
+    if not line.startswith("listening"):
+        process.kill()
+        raise RuntimeError("server did not start: " + line + process.stderr.read())
+    # keep reading the pipe, a full one would block the server's next write to stderr
+    threading.Thread(target=forwardLines, args=(process.stderr, sys.stderr), daemon=True).start()
+    return process, ("unix", path)
+
+
+def forwardLines(source, target):
+    for line in source:
+        target.write("server: " + line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play many concurrent games against Chess.server and report throughput and latency")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", help="connect to a Unix socket instead of TCP")
+    parser.add_argument("--spawn", action="store_true", help="start a server for the run on a temporary Unix socket")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="search processes of the spawned server")
+    parser.add_argument("--max-queue", type=int, default=server.MAX_QUEUE, help="queue limit of the spawned server")
+    parser.add_argument("--games", type=int, default=100, help="concurrent games")
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--plies", type=int, default=10, help="searches per game")
+    parser.add_argument("--opening-plies", type=int, default=4, help="random moves played before searching")
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--time", type=float, help="seconds per search")
+    parser.add_argument("--deadline", type=float, help="seconds each go request may take, queueing included")
+    parser.add_argument("--seed", type=int, default=1)
+    profiling.addProfileOption(parser)
+    args = parser.parse_args(argv)
+    return profiling.runProfiled(args.profile, run, args)
+
+
+def run(args):
+    process = None
+    if args.spawn:
+        process, address = spawnServer(args.workers, args.max_queue)
+    elif args.unix is not None:
+        address = ("unix", args.unix)
+    else:
+        address = ("tcp", args.host, args.port)
+    try:
+        results = asyncio.run(runLoad(address, args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+            if os.path.exists(address[1]):
+                os.remove(address[1])
+            os.rmdir(os.path.dirname(address[1]))
+    return 1 if results["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+'''
+Perft: counts the leaf nodes of the legal move tree to a fixed depth.
+Used to check the move generator against known node counts and to measure its speed.
+
+    python -m Chess.perft --depth 4
+    python -m Chess.perft --fen "<fen>" --depth 3 --divide
+    python -m Chess.perft --suite
+    python -m Chess.perft --suite --save-baseline perft_baseline.json
+    python -m Chess.perft --suite --regress perft_baseline.json --threshold 0.15
+'''
+import argparse
+import json
+import sys
+import time
+
+from . import ChessEngine, BitboardEngine, profiling
+
+STARTPOS = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+ENGINES = {"mailbox": ChessEngine.GameState, "bitboard": BitboardEngine.BitboardGameState}
+
+# Reference positions with their node counts per depth. The engine always promotes to a queen,
+# so positions where promotions happen inside the tree (promotion, kiwipete at depth 4, ...)
+# have smaller counts than the usual published ones; the rest match the published numbers.
+SUITE = [
+    ("startpos", STARTPOS,
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862, 4: 4074224}),
+    ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("promotion", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6, 2: 228, 3: 8087, 4: 320802}),
+    ("talkchess", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     {1: 41, 2: 1373, 3: 54007, 4: 1806790}),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+]
+# deepest depth of each suite position run by default, --full runs every depth listed
+QUICK_DEPTH = {"startpos": 4, "kiwipete": 3, "endgame": 4, "promotion": 3, "talkchess": 3, "middlegame": 3}
+
+
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moves = gs.getValidMoves()
+    if depth == 1:
+        return len(moves)  # bulk count the last ply
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+
+def divide(gs, depth):
+    ''' Node count below each root move, as a list of (move notation, nodes) '''
+    results = []
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        results.append((move.getChessNotation(), perft(gs, depth - 1)))
+        gs.undoMove()
+    return results
+
+
+def timedPerft(gs, depth):
+    ''' Returns (nodes, seconds) '''
+    start = time.perf_counter()
+    nodes = perft(gs, depth)
+    return nodes, time.perf_counter() - start
+
+
+def runSuite(engine, full=False, out=sys.stdout):
+    '''
+    Runs every suite position and checks its node counts.
+    Returns (all counts correct, total nodes, total seconds).
+    '''
+    ok = True
+    totalNodes = 0
+    totalTime = 0.0
+    for name, fen, expected in SUITE:
+        maxDepth = max(expected) if full else QUICK_DEPTH[name]
+        for depth in sorted(expected):
+            if depth > maxDepth:
+                break
+            nodes, seconds = timedPerft(engine.from_fen(fen), depth)
+            totalNodes += nodes
+            totalTime += seconds
+            status = "ok" if nodes == expected[depth] else "FAIL (expected %d)" % expected[depth]
+            if nodes != expected[depth]:
+                ok = False
+            print("%-10s depth %d  %10d nodes  %7.2fs  %9.0f nps  %s" % (name, depth, nodes, seconds, nodes / max(seconds, 1e-9), status), file=out)
+    return ok, totalNodes, totalTime
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft move generator test and benchmark")
+    parser.add_argument("--fen", default=STARTPOS)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--divide", action="store_true", help="print the node count below each root move")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="bitboard")
+    parser.add_argument("--suite", action="store_true", help="run the reference positions and check their counts")
+    parser.add_argument("--full", action="store_true", help="run the suite to its deepest listed depths")
+    parser.add_argument("--save-baseline", metavar="PATH", help="store the suite's nodes per second in PATH")
+    parser.add_argument("--regress", metavar="PATH", help="fail if the suite's nodes per second dropped against PATH")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown for --regress, as a fraction")
+    profiling.addProfileOption(parser)
+    args = parser.parse_args(argv)
+    return profiling.runProfiled(args.profile, run, args)
+
+
+def run(args):
+    engine = ENGINES[args.engine]
+
+    if args.suite or args.save_baseline or args.regress:
+        if args.regress:
+            with open(args.regress) as f:
+                baseline = json.load(f)
+            # nodes per second are only comparable for the same engine and suite depths
+            if baseline.get("engine") != args.engine or baseline.get("full") != args.full:
+                print("baseline %s is for --engine %s%s, not --engine %s%s" % (
+                    args.regress, baseline.get("engine"), " --full" if baseline.get("full") else "",
+                    args.engine, " --full" if args.full else ""))
+                return 1
+        ok, nodes, seconds = runSuite(engine, args.full)
+        nps = nodes / max(seconds, 1e-9)
+        print("total %d nodes in %.2fs, %.0f nps" % (nodes, seconds, nps))
+        if not ok:
+            print("perft counts are wrong")
+            return 1
+        if args.save_baseline:
+            with open(args.save_baseline, "w") as f:
+                json.dump({"engine": args.engine, "full": args.full, "nps": nps}, f)
+            print("baseline saved to " + args.save_baseline)
+        if args.regress:
+            change = nps / baseline["nps"] - 1
+            print("baseline %.0f nps, change %+.1f%%" % (baseline["nps"], change * 100))
+            if change < -args.threshold:
+                print("throughput regression beyond %.0f%%" % (args.threshold * 100))
+                return 1
+        return 0
+
+    gs = engine.from_fen(args.fen)
+    start = time.perf_counter()
+    if args.divide:
+        results = divide(gs, args.depth)
+        for notation, count in results:
+            print("%s: %d" % (notation, count))
+        nodes = sum(count for _, count in results)
+        print("moves: %d" % len(results))
+    else:
+        nodes = perft(gs, args.depth)
+    seconds = time.perf_counter() - start
+    print("nodes: %d  time: %.3fs  nps: %.0f" % (nodes, seconds, nodes / max(seconds, 1e-9)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
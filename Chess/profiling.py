@@ -0,0 +1,36 @@
+'''
+--profile option of the command line tools.
+
+    python -m Chess.analyze positions.fen --depth 3 --profile analyze.prof
+    python -m pstats analyze.prof
+    flameprof analyze.prof > analyze.svg
+
+The profile is written in cProfile's format, which pstats, snakeviz, gprof2dot and flameprof read.
+The most expensive functions by cumulative time are also printed to stderr.
+'''
+import sys
+
+SUMMARY_LINES = 25
+
+
+def addProfileOption(parser):
+    parser.add_argument("--profile", metavar="FILE", help="run under cProfile and write the profile to FILE")
+
+
+def writeProfile(profiler, path, out=sys.stderr):
+    import pstats
+    profiler.dump_stats(path)
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(SUMMARY_LINES)
+    print("profile written to " + path, file=out)
+
+
+def runProfiled(path, function, *args):
+    ''' function(*args), under cProfile with the profile written to path unless path is None '''
+    if path is None:
+        return function(*args)
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        writeProfile(profiler, path)
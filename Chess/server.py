@@ -0,0 +1,328 @@
+'''
+Engine server: hosts many games at once over a local socket, speaking JSON lines, and searches
+them in a bounded pool of worker processes.
+
+    python -m Chess.server --port 8765 --workers 4
+    python -m Chess.server --unix /tmp/chess.sock --max-queue 256
+
+Every request is a JSON object on one line and gets one JSON line back carrying the same "id":
+
+    {"id": 1, "op": "new", "fen": "<fen>"}               -> {"id": 1, "session": 7, "fen": "..."}
+    {"id": 2, "op": "move", "session": 7, "move": "e2e4"}  -> {"id": 2, "fen": "..."}
+    {"id": 3, "op": "go", "session": 7, "depth": 3, "time": 0.5, "deadline": 2.0, "play": true}
+        -> {"id": 3, "move": "e7e5", "score": 1, "depth": 3, "nodes": 812, "seconds": 0.2, "queued": 0.001, "latency": 0.21, "fen": "..."}
+    {"id": 4, "op": "stats", "session": 7}                 -> latency percentiles of the session
+    {"id": 5, "op": "stats"}                               -> server counters and latency percentiles
+    {"id": 6, "op": "close", "session": 7}
+
+fen is optional and defaults to the start position. go searches to depth and/or for time seconds
+(SmartMoveFinder.DEPTH without either) and with play makes the move in the session. deadline bounds
+the whole request, queueing included: the search is cut short to finish in time and a request still
+queued at its deadline fails. Errors come back as {"id": ..., "error": "..."}.
+
+A connection's requests are handled concurrently, so replies can come out of order. Backpressure:
+at most MAX_INFLIGHT requests per connection are in progress, beyond that the server stops reading
+from it; go requests wait in a FIFO for one of the worker slots, and once max-queue of them are
+waiting further ones are refused with "overloaded" instead of queueing without bound.
+Sessions belong to their connection and are closed with it.
+'''
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import math
+import os
+import signal
+import sys
+import time
+
+from . import BitboardEngine, analyze, profiling
+
+STARTPOS = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+MAX_INFLIGHT = 256  # requests in progress per connection before the server stops reading it
+MAX_QUEUE = 1024  # go requests waiting for a worker before new ones are refused
+MAX_SESSIONS = 10000
+LATENCY_SAMPLES = 10000  # most recent go latencies kept for the server percentiles
+SESSION_LATENCY_SAMPLES = 1000
+DEADLINE_MARGIN = 0.05  # seconds of a deadline kept back for dispatch and the reply
+
+
+class ServerError(Exception):
+    ''' A request failed, the message is sent back as its "error" '''
+
+
+def percentiles(samples):
+    ''' Count and p50/p90/p99/max of latency samples in seconds, reported in milliseconds '''
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    result = {"count": len(ordered)}
+    for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+        result[name] = round(ordered[round(fraction * last)] * 1000, 2)
+    result["max"] = round(ordered[-1] * 1000, 2)
+    return result
+
+
+def applyMove(fen, text):
+    ''' FEN after the move text (coordinate notation, e2e4 or e7e8q) is played from fen '''
+    try:
+        gs = BitboardEngine.BitboardGameState.from_fen(fen)
+    except (ValueError, IndexError, KeyError) as e:
+        raise ServerError("bad position: " + str(e))
+    for move in gs.getValidMoves():
+        if move.getChessNotation() == text[:4]:
+            gs.makeMove(move)
+            return gs.to_fen()
+    raise ServerError("illegal move " + text)
+
+
+class Session():
+    ''' One game: its position as a FEN, the moves played and the latencies of its searches '''
+    def __init__(self, sessionID, fen):
+        self.sessionID = sessionID
+        self.fen = fen
+        self.moves = []
+        self.searching = False
+        self.latencies = collections.deque(maxlen=SESSION_LATENCY_SAMPLES)
+
+
+class EngineServer():
+    ''' Sessions, the worker pool and the request handlers, shared by every connection '''
+    def __init__(self, workers, maxQueue=MAX_QUEUE, maxSessions=MAX_SESSIONS):
+        # imported here, multiprocessing is a large part of the start-up time otherwise
+        from concurrent.futures import ProcessPoolExecutor
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.slots = asyncio.Semaphore(workers)  # searches handed to the pool at once
+        self.maxQueue = maxQueue
+        self.maxSessions = maxSessions
+        self.sessions = {}
+        self.sessionIDs = itertools.count(1)
+        self.queued = 0
+        self.searching = 0
+        self.counters = collections.Counter()
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.started = time.perf_counter()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    async def handleConnection(self, reader, writer):
+        owned = set()  # sessions opened by this connection
+        inflight = asyncio.Semaphore(MAX_INFLIGHT)
+        writeLock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                await inflight.acquire()
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):  # ValueError: line longer than the stream limit
+                    break
+                if not line:
+                    break
+                task = asyncio.ensure_future(self.respond(line, owned, writer, writeLock, inflight))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for sessionID in owned:
+                self.sessions.pop(sessionID, None)
+            writer.close()
+
+    async def respond(self, line, owned, writer, writeLock, inflight):
+        received = time.perf_counter()
+        requestID = None
+        try:
+            try:
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("not an object")
+                except ValueError as e:
+                    raise ServerError("bad request: " + str(e))
+                requestID = request.get("id")
+                reply = await self.handle(request, owned, received)
+            except ServerError as e:
+                self.counters["errors"] += 1
+                reply = {"error": str(e)}
+            except Exception as e:  # a crashed worker and the like, the client still gets its reply
+                self.counters["errors"] += 1
+                reply = {"error": "internal error: %s: %s" % (type(e).__name__, e)}
+            reply["id"] = requestID
+            async with writeLock:
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            inflight.release()
+
+    async def handle(self, request, owned, received):
+        op = request.get("op")
+        self.counters[op if op in ("new", "move", "go", "stats", "close") else "unknown"] += 1
+        if op == "new":
+            if len(self.sessions) >= self.maxSessions:
+                raise ServerError("too many sessions")
+            fen = request.get("fen") or STARTPOS
+            if not isinstance(fen, str):
+                raise ServerError("bad position: fen must be a string")
+            try:
+                fen = BitboardEngine.BitboardGameState.from_fen(fen).to_fen()
+            except (ValueError, IndexError, KeyError) as e:
+                raise ServerError("bad position: " + str(e))
+            session = Session(next(self.sessionIDs), fen)
+            self.sessions[session.sessionID] = session
+            owned.add(session.sessionID)
+            return {"session": session.sessionID, "fen": fen}
+        if op == "stats" and "session" not in request:
+            return self.stats()
+        session = self.session(request, owned)
+        if op == "move":
+            if session.searching:
+                raise ServerError("session is searching")
+            session.fen = applyMove(session.fen, str(request.get("move", "")))
+            session.moves.append(request["move"])
+            return {"fen": session.fen}
+        if op == "go":
+            return await self.go(session, request, received)
+        if op == "stats":
+            return {"session": session.sessionID, "moves": len(session.moves), "latency": percentiles(session.latencies)}
+        if op == "close":
+            self.sessions.pop(session.sessionID, None)
+            owned.discard(session.sessionID)
+            return {"closed": session.sessionID}
+        raise ServerError("unknown op " + repr(op))
+
+    def session(self, request, owned):
+        sessionID = request.get("session")
+        if sessionID not in owned or sessionID not in self.sessions:
+            raise ServerError("no session " + repr(sessionID))
+        return self.sessions[sessionID]
+
+    async def go(self, session, request, received):
+        if session.searching:
+            raise ServerError("session is searching")
+        depth = request.get("depth")
+        timeLimit = request.get("time")
+        deadline = request.get("deadline")
+        if depth is not None and (not isinstance(depth, int) or isinstance(depth, bool) or depth <= 0):
+            raise ServerError("depth must be a positive integer")
+        for name, value in (("time", timeLimit), ("deadline", deadline)):
+            if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool)
+                                      or not 0 < value < math.inf):
+                raise ServerError(name + " must be a positive number")
+        if self.queued >= self.maxQueue:
+            self.counters["overloaded"] += 1
+            raise ServerError("overloaded")
+        expires = received + deadline if deadline is not None else None
+
+        session.searching = True
+        fen = session.fen
+        try:
+            self.queued += 1
+            try:
+                if expires is None:
+                    await self.slots.acquire()
+                else:
+                    await asyncio.wait_for(self.slots.acquire(), expires - time.perf_counter())
+            except asyncio.TimeoutError:
+                self.counters["expired"] += 1
+                raise ServerError("deadline exceeded")
+            finally:
+                self.queued -= 1
+            started = time.perf_counter()
+            try:
+                if expires is not None:
+                    remaining = expires - started - DEADLINE_MARGIN
+                    if remaining <= 0:
+                        self.counters["expired"] += 1
+                        raise ServerError("deadline exceeded")
+                    timeLimit = remaining if timeLimit is None else min(timeLimit, remaining)
+                self.searching += 1
+                try:
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(self.pool, analyze.analyzePosition, fen, depth, timeLimit)
+                finally:
+                    self.searching -= 1
+            finally:
+                self.slots.release()
+        finally:
+            session.searching = False
+
+        if "error" in result:
+            raise ServerError(result["error"])
+        reply = {key: result[key] for key in ("move", "score", "depth", "nodes", "seconds", "result") if key in result}
+        if request.get("play") and result["move"] is not None:
+            session.fen = applyMove(fen, result["move"])
+            session.moves.append(result["move"])
+            reply["fen"] = session.fen
+        latency = time.perf_counter() - received
+        reply["queued"] = round(started - received, 4)
+        reply["latency"] = round(latency, 4)
+        session.latencies.append(latency)
+        self.latencies.append(latency)
+        self.counters["searches"] += 1
+        return reply
+
+    def stats(self):
+        uptime = time.perf_counter() - self.started
+        return {"sessions": len(self.sessions), "workers": self.workers, "searching": self.searching,
+                "queued": self.queued, "uptime": round(uptime, 2), "requests": dict(self.counters),
+                "searchesPerSecond": round(self.counters["searches"] / max(uptime, 1e-9), 2),
+                "latency": percentiles(self.latencies)}
+
+
+async def serve(host, port, unixPath, workers, maxQueue, maxSessions, ready=None):
+    ''' Runs the server until cancelled, ready is called with the listening address '''
+    engine = EngineServer(workers, maxQueue, maxSessions)
+    try:
+        # stop on SIGTERM like on Ctrl+C, so the pool and the socket file are cleaned up
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except (NotImplementedError, AttributeError):  # Windows
+        pass
+    try:
+        if unixPath is not None:
+            server = await asyncio.start_unix_server(engine.handleConnection, unixPath)
+            address = unixPath
+        else:
+            server = await asyncio.start_server(engine.handleConnection, host, port)
+            address = "%s:%d" % server.sockets[0].getsockname()[:2]
+        if ready is not None:
+            ready(address)
+        async with server:
+            await server.serve_forever()
+    finally:
+        engine.close()
+        if unixPath is not None and os.path.exists(unixPath):
+            os.remove(unixPath)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSON-lines engine server hosting many games over a local socket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port, 0 picks a free one")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="search processes")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE, help="go requests waiting for a worker before new ones are refused")
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS)
+    profiling.addProfileOption(parser)
+    args = parser.parse_args(argv)
+    return profiling.runProfiled(args.profile, run, args)
+
+
+def run(args):
+    def ready(address):
+        print("listening on " + address, file=sys.stderr, flush=True)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.max_queue, args.max_sessions, ready))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
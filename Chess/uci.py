@@ -0,0 +1,266 @@
+'''
+UCI front-end, so the engine can run behind chess GUIs and match runners over stdin/stdout.
+
+    python -m Chess.uci
+
+Supports uci, isready, ucinewgame, position startpos|fen ... [moves ...], go with depth, movetime,
+wtime/btime/winc/binc/movestogo, infinite or ponder, ponderhit, stop, quit and the OwnBook and Ponder
+options. go searches in a background thread, so the engine keeps reading commands and stop answers
+within a few nodes. go ponder searches without a limit until ponderhit, which gives it the time
+limit of its clock parameters counted from the go, or stop. The engine always
+promotes to a queen, so a promotion letter in the position moves is ignored.
+'''
+import argparse
+import sys
+import threading
+import time
+
+from . import BitboardEngine, OpeningBook, SmartMoveFinder, Tablebase, profiling
+
+ENGINE_NAME = "Python Chess SmartMoveFinder"
+ENGINE_AUTHOR = "Python Chess Game"
+STARTPOS = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# with only wtime/btime, plan for this many more moves
+MOVES_TO_GO = 30
+# kept back from the clock for the time it takes to send the move
+MOVE_OVERHEAD = 0.05
+
+
+def uciMove(move):
+    ''' Move in UCI coordinate notation, e7e8q for promotions '''
+    return move.getChessNotation() + ("q" if move.isPawnPromotion else "")
+
+
+def uciScore(score, pv, gs=None):
+    '''
+    score (tenths of a pawn, side to move) as a UCI "cp" or "mate" score. Tablebase wins and losses
+    are mates too, counted along pv on gs when it reaches a covered position, else from the score.
+    '''
+    if abs(score) >= SmartMoveFinder.CHECKMATE:
+        plies = len(pv)
+    elif abs(score) > SmartMoveFinder.TABLEBASE_WIN - Tablebase.MAX_PLIES:
+        plies = SmartMoveFinder.tablebasePlies(gs, pv) if gs is not None else None
+        if plies is None:
+            plies = len(pv) + SmartMoveFinder.TABLEBASE_WIN - abs(score)
+    else:
+        return "cp %d" % (score * 10)
+    moves = (plies + 1) // 2
+    return "mate %d" % (moves if score > 0 else -moves)
+
+
+def timeLimit(params, whiteToMove):
+    '''
+    Seconds to search for the parsed go parameters, None for no limit.
+    Uses movetime when given, otherwise an even share of the remaining clock plus the increment.
+    '''
+    if "movetime" in params:
+        return max(params["movetime"] / 1000 - MOVE_OVERHEAD, 0.01)
+    clock = params.get("wtime" if whiteToMove else "btime")
+    if clock is None:
+        return None
+    increment = params.get("winc" if whiteToMove else "binc", 0)
+    movesToGo = params.get("movestogo", MOVES_TO_GO)
+    budget = (clock / max(movesToGo, 1) + increment) / 1000
+    return max(min(budget, clock / 1000 - MOVE_OVERHEAD), 0.01)
+
+
+class UciEngine():
+    ''' Reads UCI commands with handle() and writes the replies to out, profiler (cProfile) records the searches '''
+    def __init__(self, out=sys.stdout, profiler=None):
+        self.out = out
+        self.profiler = profiler
+        self.outLock = threading.Lock()
+        self.gs = BitboardEngine.BitboardGameState()
+        self.searchThread = None
+        self.stopEvent = threading.Event()
+        self.releaseEvent = threading.Event()  # a ponder search holds its bestmove until ponderhit or stop
+        self.searchContext = None
+        self.ponderLimit = None
+        self.book = OpeningBook.loadBook()
+        SmartMoveFinder.openingBook = self.book
+        SmartMoveFinder.tablebase = Tablebase.loadTablebase()
+
+    def send(self, line):
+        with self.outLock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def handle(self, line):
+        ''' Runs one command line, returns False on quit '''
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name OwnBook type check default " + ("true" if self.book is not None else "false"))
+            self.send("option name Ponder type check default true")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stopSearch()
+            SmartMoveFinder.getTranspositionTable().clear()
+        elif command == "position":
+            self.stopSearch()
+            self.setPosition(args)
+        elif command == "go":
+            self.stopSearch()
+            self.go(args)
+        elif command == "ponderhit":
+            self.ponderhit()
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "setoption":
+            self.setOption(args)
+        elif command == "quit":
+            self.stopSearch()
+            return False
+        # anything else (debug, register, ...) is ignored as the protocol asks
+        return True
+
+    def setOption(self, args):
+        ''' setoption name <name> value <value>, only OwnBook is supported '''
+        if "value" not in args:
+            return
+        split = args.index("value")
+        name = " ".join(args[1:split]).lower()
+        value = " ".join(args[split + 1:]).lower()
+        if name == "ownbook":
+            SmartMoveFinder.openingBook = self.book if value == "true" else None
+
+    def setPosition(self, args):
+        ''' position startpos|fen <fen> [moves <move> ...] '''
+        if "moves" in args:
+            split = args.index("moves")
+            args, moves = args[:split], args[split + 1:]
+        else:
+            moves = []
+        if args and args[0] == "fen":
+            fen = " ".join(args[1:])
+        else:
+            fen = STARTPOS
+        try:
+            gs = BitboardEngine.BitboardGameState.from_fen(fen)
+        except (ValueError, IndexError, KeyError) as e:
+            self.send("info string bad position: " + str(e))
+            return
+        for text in moves:
+            move = None
+            for m in gs.getValidMoves():
+                if m.getChessNotation() == text[:4]:
+                    move = m
+                    break
+            if move is None:
+                self.send("info string illegal move " + text)
+                break
+            gs.makeMove(move)
+        self.gs = gs
+
+    def go(self, args):
+        params = {}
+        infinite = ponder = False
+        i = 0
+        while i < len(args):
+            if args[i] == "infinite":
+                infinite = True
+            elif args[i] == "ponder":
+                ponder = True
+            elif args[i] in ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo") and i + 1 < len(args):
+                try:
+                    params[args[i]] = int(args[i + 1])
+                except ValueError:
+                    pass
+                i += 1
+            i += 1
+        if infinite:
+            time_limit, max_depth = None, SmartMoveFinder.MAX_DEPTH
+        else:
+            time_limit = timeLimit(params, self.gs.whiteToMove)
+            max_depth = params.get("depth")
+            if max_depth is None and time_limit is None:
+                max_depth = SmartMoveFinder.DEPTH
+        self.ponderLimit = None
+        if ponder and time_limit is not None:
+            # search on the opponent's time, ponderhit switches to the clock
+            self.ponderLimit, time_limit = time_limit, None
+            if max_depth is None:
+                max_depth = SmartMoveFinder.MAX_DEPTH
+        self.stopEvent = threading.Event()
+        self.releaseEvent = threading.Event()
+        if not ponder:
+            self.releaseEvent.set()
+        self.searchContext = SmartMoveFinder.SearchContext(stopEvent=self.stopEvent)
+        args = (self.gs, time_limit, max_depth, infinite, self.searchContext, self.releaseEvent)
+        if self.profiler is not None:
+            # cProfile only sees the thread it runs in
+            args = (self.search,) + args
+        self.searchThread = threading.Thread(target=self.search if self.profiler is None else self.profiler.runcall, args=args, daemon=True)
+        self.searchThread.start()
+
+    def search(self, gs, time_limit, max_depth, infinite, context, releaseEvent):
+        ''' Search thread: streams an info line per completed depth, then sends bestmove '''
+        start = time.perf_counter()
+
+        def onIteration(depth, move, score):
+            pv = SmartMoveFinder.getPrincipalVariation(gs, depth, context.tt)
+            if not pv or pv[0] != move:
+                pv = [move]
+            elapsed = time.perf_counter() - start
+            self.send("info depth %d score %s nodes %d nps %d time %d pv %s" % (
+                depth, uciScore(score, pv, gs), context.nodes, context.nodes / max(elapsed, 1e-9),
+                elapsed * 1000, " ".join(uciMove(m) for m in pv)))
+
+        context.onIteration = onIteration
+        validMoves = gs.getValidMoves()
+        move = None if infinite else SmartMoveFinder.bookMove(gs, validMoves)
+        if move is not None:
+            self.send("info string book move")
+        elif not infinite:
+            move = SmartMoveFinder.tablebaseMove(gs, validMoves)
+            if move is not None:
+                self.send("info string tablebase move")
+        if move is None:
+            move, score, depth = SmartMoveFinder.iterativeDeepening(gs, validMoves, time_limit, max_depth, context)
+        if infinite:
+            context.stopEvent.wait()  # under go infinite the move is only sent after stop
+        releaseEvent.wait()  # and under go ponder after ponderhit or stop
+        self.send("bestmove " + (uciMove(move) if move is not None else "0000"))
+
+    def ponderhit(self):
+        ''' The opponent played the move pondered on: the search goes on as a normal one '''
+        if self.searchThread is not None and not self.releaseEvent.is_set():
+            self.searchContext.ponderhit(self.ponderLimit)
+            self.releaseEvent.set()
+
+    def stopSearch(self):
+        ''' Stops a running search and waits for its bestmove '''
+        if self.searchThread is not None:
+            self.stopEvent.set()
+            self.releaseEvent.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="UCI chess engine, reads commands from stdin")
+    profiling.addProfileOption(parser)
+    args = parser.parse_args(argv)
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+    engine = UciEngine(profiler=profiler)
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.stopSearch()
+    if profiler is not None:
+        profiling.writeProfile(profiler, args.profile)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
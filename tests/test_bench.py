@@ -0,0 +1,21 @@
+import io
+
+from Chess import SmartMoveFinder, bench
+
+
+def testConfigsStartWithEmptyCaches(monkeypatch):
+    monkeypatch.setattr(bench, "BENCH_POSITIONS", bench.BENCH_POSITIONS[:2])
+    saved = SmartMoveFinder.pawnTable, SmartMoveFinder.evalCache
+    seen = []
+
+    def makeContext():
+        if len(seen) % 2 == 0:  # first position of a configuration
+            assert SmartMoveFinder.evalCache.getStats()["used"] == 0
+            assert SmartMoveFinder.pawnTable.getStats()["used"] == 0
+        seen.append(SmartMoveFinder.evalCache)
+        return SmartMoveFinder.SearchContext(tt=SmartMoveFinder.TranspositionTable(), orderer=SmartMoveFinder.MoveOrderer())
+
+    totals = bench.runConfigs({"first": makeContext, "second": makeContext}, 2, out=io.StringIO())
+    assert totals["first"][0] == totals["second"][0]
+    assert seen[0] is seen[1] and seen[1] is not seen[2]
+    assert (SmartMoveFinder.pawnTable, SmartMoveFinder.evalCache) == saved
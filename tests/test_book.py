@@ -0,0 +1,82 @@
+import io
+import random
+
+import pytest
+
+from Chess import BitboardEngine, OpeningBook
+
+CORPUS = """# a small corpus, the second and third games transpose
+e2e4 e7e5 g1f3 b8c6 f1b5 a7a6
+d2d4 g8f6 c2c4 e7e6 b1c3 f8b4
+c2c4 e7e6 d2d4 g8f6 b1c3 f8b4 1-0
+e2e4 e7e5 g1f3 g8f6
+e2e4 c7c5 g1f3 d7d6 e1e2
+"""
+
+
+@pytest.fixture
+def book(tmp_path):
+    corpus = tmp_path / "corpus.txt"
+    corpus.write_text(CORPUS)
+    path = str(tmp_path / "book.bin")
+    assert OpeningBook.main([str(corpus), path, "--plies", "5"]) == 0
+    book = OpeningBook.OpeningBook(path)
+    yield book
+    book.close()
+
+
+def positions(plies=5):
+    ''' (gs, move) for every book ply of the corpus, up to its first illegal move '''
+    for line in CORPUS.splitlines():
+        if line.startswith("#"):
+            continue
+        gs = BitboardEngine.BitboardGameState()
+        for text in line.split()[:plies]:
+            move = next((m for m in gs.getValidMoves() if m.getChessNotation() == text), None)
+            if move is None:
+                break
+            yield gs, move
+            gs.makeMove(move)
+
+
+def testLookupFindsEveryPosition(book):
+    counts = {}
+    for gs, move in positions():
+        counts[gs.zobristHash, move.code] = counts.get((gs.zobristHash, move.code), 0) + 1
+    assert len(book) == len(counts)
+    for (key, code), count in counts.items():
+        assert (code, count) in book.lookup(key)
+    start = BitboardEngine.BitboardGameState().zobristHash
+    assert sorted(book.lookup(start)) == sorted([(code, count) for (key, code), count in counts.items() if key == start])
+
+
+def testPickMoveIsLegal(book):
+    rng = random.Random(5)
+    for gs, move in positions():
+        validMoves = gs.getValidMoves()
+        booked = {code & 0xFFF for code, weight in book.lookup(gs.zobristHash)}
+        for _ in range(10):
+            picked = book.pickMove(gs, validMoves, rng)
+            assert picked in validMoves and picked.moveID in booked
+
+
+def testOutOfBook(book):
+    gs = BitboardEngine.BitboardGameState.from_fen("4k3/8/8/8/8/8/8/4K2R w K - 0 1")
+    assert book.lookup(gs.zobristHash) == []
+    assert book.pickMove(gs, gs.getValidMoves()) is None
+
+
+def testIllegalMoveEndsTheGame():
+    errors = io.StringIO()
+    counts = OpeningBook.compileBook(["e2e4 e7e5 e1e3 d7d5"], errors=errors)
+    assert len(counts) == 2 and "line 1: illegal move e1e3" in errors.getvalue()
+
+
+def testRejectsOtherFiles(tmp_path):
+    path = tmp_path / "empty.bin"
+    path.write_bytes(b"")
+    assert OpeningBook.loadBook(str(path)) is None
+    path.write_bytes(b"not a book at all")
+    with pytest.raises(ValueError):
+        OpeningBook.OpeningBook(str(path))
+    assert OpeningBook.loadBook(str(tmp_path / "missing.bin")) is None
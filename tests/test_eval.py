@@ -0,0 +1,57 @@
+import pytest
+
+from Chess import SmartMoveFinder, bench, perft
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    ''' Fresh pawn table and eval cache, every evaluation checked against a full rescan '''
+    monkeypatch.setattr(SmartMoveFinder, "DEBUG_EVAL", True)
+    monkeypatch.setattr(SmartMoveFinder, "pawnTable", SmartMoveFinder.PawnHashTable())
+    monkeypatch.setattr(SmartMoveFinder, "evalCache", SmartMoveFinder.EvalCache())
+    return SmartMoveFinder.pawnTable, SmartMoveFinder.evalCache
+
+
+@pytest.mark.parametrize("engine", sorted(perft.ENGINES))
+def testSearchKeepsEvaluationInSync(engine, tables):
+    pawnTable, evalCache = tables
+    evaluations = []
+
+    def record(gs):
+        score = SmartMoveFinder.evaluate(gs)
+        assert score == SmartMoveFinder.scoreBoardFull(gs)
+        evaluations.append(score)
+        return score
+
+    for warm in (False, True):  # the second pass starts with the caches of the first
+        for fen in bench.BENCH_POSITIONS:
+            gs = perft.ENGINES[engine].from_fen(fen)
+            key = gs.zobristHash
+            context = SmartMoveFinder.SearchContext(tt=SmartMoveFinder.TranspositionTable(), orderer=SmartMoveFinder.MoveOrderer())
+            context.evaluate = record
+            SmartMoveFinder.iterativeDeepening(gs, gs.getValidMoves(), max_depth=2, context=context)
+            assert gs.to_fen() == fen
+            assert gs.zobristHash == key == gs.computeHash()
+            fresh = perft.ENGINES[engine].from_fen(fen)
+            fresh.enableIncrementalEval(SmartMoveFinder.pieceValues, SmartMoveFinder.positionValues)
+            assert (gs.materialScore, gs.positionScore) == (fresh.materialScore, fresh.positionScore)
+        if not warm:
+            assert evaluations and pawnTable.misses > 0
+            evalCache.resetStats()
+    assert evalCache.hits > 0
+
+
+def testCachesStoreByKey():
+    evalCache = SmartMoveFinder.EvalCache(sizeBits=4)
+    assert evalCache.probe(5) is None
+    evalCache.store(5, 42)
+    assert evalCache.probe(5) == 42
+    evalCache.store(5 + 16, 7)  # same slot, replaces
+    assert evalCache.probe(5) is None and evalCache.probe(5 + 16) == 7
+    assert (evalCache.hits, evalCache.misses) == (2, 2)
+
+    pawnTable = SmartMoveFinder.PawnHashTable(sizeBits=4)
+    gs = perft.ENGINES["bitboard"].from_fen(bench.BENCH_POSITIONS[1])
+    structure = SmartMoveFinder.pawnStructure(gs.board)
+    assert pawnTable.probe(gs) == structure and pawnTable.misses == 1
+    assert pawnTable.probe(gs) == structure and pawnTable.hits == 1
@@ -0,0 +1,50 @@
+import pytest
+
+from Chess import BitboardEngine, ChessEngine, analyze
+
+ENGINES = [ChessEngine.GameState, BitboardEngine.BitboardGameState]
+
+GOOD = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "k7/8/1K6/8/8/8/8/6Q1 w - - 12 40",
+]
+
+BAD = [
+    "8/8/8/8/8/8/8/8 w - - 0 1",  # no kings
+    "k7/8/8/8/8/8/8/KK6 w - - 0 1",  # two white kings
+    "k7/8/1K6/8/8/8/8/7Q w - - 0 1",  # black, not to move, is in check
+    "k7/8/1K6/8/8/8/8/6Q1 x - - 0 1",  # side to move
+    "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e6 0 1",  # en passant on the wrong rank
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR b KQkq e3 0 1",  # no pawn made the double push
+    "k6P/8/8/8/8/8/8/K7 w - - 0 1",  # pawn on the last rank
+    "k7/8/8/8/8/8/8/K7 w Kx - 0 1",  # castling field
+    "k7/8/8/8/8/8/8/K7 w - - x 1",  # move counters
+    "k7/8/8/8/8/8/K7 w - - 0 1",  # seven ranks
+]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("fen", GOOD)
+def testRoundTrip(engine, fen):
+    assert engine.from_fen(fen).to_fen() == fen
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def testCastlingRightsNeedKingAndRook(engine):
+    assert engine.from_fen("4k3/8/8/8/8/8/8/4K2R w KQkq - 0 1").to_fen() == "4k3/8/8/8/8/8/8/4K2R w K - 0 1"
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("fen", BAD)
+def testBadFenRaises(engine, fen):
+    with pytest.raises(ValueError):
+        engine.from_fen(fen)
+
+
+def testAnalyzeReportsBadFens():
+    results = list(analyze.analyzeStream(BAD[:3] + GOOD[-1:], depth=1))
+    assert ["error" in result for result in results] == [True, True, True, False]
+    assert results[-1]["move"] == "g1g8"
@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from Chess import perft
+
+
+@pytest.mark.parametrize("engine", sorted(perft.ENGINES))
+@pytest.mark.parametrize("name,fen", [(name, fen) for name, fen, counts in perft.SUITE])
+def testMakeUndoRestoresPosition(engine, name, fen):
+    rng = random.Random(name)
+    gs = perft.ENGINES[engine].from_fen(fen)
+    for game in range(4):
+        history = []
+        for ply in range(40):
+            moves = gs.getValidMoves()
+            if not moves:
+                break
+            history.append((gs.to_fen(), gs.zobristHash, gs.pawnHash))
+            if ply % 7 == 3 and not gs.inCheck():
+                gs.makeNullMove()
+                assert gs.zobristHash == gs.computeHash()
+                gs.undoNullMove()
+                assert (gs.to_fen(), gs.zobristHash, gs.pawnHash) == history[-1]
+            gs.makeMove(rng.choice(moves))
+            assert gs.zobristHash == gs.computeHash()
+            assert gs.pawnHash == gs.computePawnHash()
+        while history:
+            gs.undoMove()
+            assert (gs.to_fen(), gs.zobristHash, gs.pawnHash) == history.pop()
+
+
+def testEnginesAgreeOnHashes():
+    rng = random.Random(1)
+    mailbox, bitboard = (perft.ENGINES[engine]() for engine in ("mailbox", "bitboard"))
+    for ply in range(60):
+        moves = bitboard.getValidMoves()
+        if not moves:
+            break
+        notation = rng.choice(moves).getChessNotation()
+        for gs in (mailbox, bitboard):
+            gs.makeMove(next(move for move in gs.getValidMoves() if move.getChessNotation() == notation))
+        assert mailbox.zobristHash == bitboard.zobristHash
+        assert mailbox.to_fen() == bitboard.to_fen()
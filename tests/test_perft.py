@@ -0,0 +1,31 @@
+import io
+
+import pytest
+
+from Chess import perft
+
+
+@pytest.mark.parametrize("engine", sorted(perft.ENGINES))
+def testSuite(engine):
+    out = io.StringIO()
+    ok, nodes, seconds = perft.runSuite(perft.ENGINES[engine], out=out)
+    assert ok, out.getvalue()
+
+
+@pytest.mark.parametrize("engine", sorted(perft.ENGINES))
+def testDivideAddsUp(engine):
+    gs = perft.ENGINES[engine].from_fen(perft.SUITE[1][1])
+    results = perft.divide(gs, 2)
+    assert len(results) == perft.SUITE[1][2][1]
+    assert sum(nodes for notation, nodes in results) == perft.SUITE[1][2][2]
+    assert gs.to_fen() == perft.SUITE[1][1]
+
+
+def testRegressNeedsAMatchingBaseline(tmp_path, capsys):
+    baseline = str(tmp_path / "baseline.json")
+    assert perft.main(["--save-baseline", baseline, "--engine", "bitboard"]) == 0
+    assert perft.main(["--regress", baseline, "--engine", "bitboard", "--threshold", "0.9"]) == 0
+    capsys.readouterr()
+    assert perft.main(["--regress", baseline, "--engine", "mailbox"]) == 1
+    assert perft.main(["--regress", baseline, "--engine", "bitboard", "--full"]) == 1
+    assert "not --engine bitboard --full" in capsys.readouterr().out
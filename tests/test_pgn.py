@@ -0,0 +1,63 @@
+import pytest
+
+from Chess import Pgn
+
+# no [Event tags, a multi-line comment with a line that looks like a tag, a ; comment holding a
+# brace, a variation and a NAG
+GAMES = b"""[White "A"]
+[Black "B"]
+
+1. e4 e5 {a comment
+[Note "not a tag"]
+that ends here} 2. Nf3 Nc6 1-0
+
+[Site "?"]
+
+1. d4 ; a line comment {with a brace
+d5 2. c4 (2. Nf3 Nf6) e6 $1 3. Nc3 0-1
+
+[Event "third"]
+[FEN "k7/8/1K6/8/8/8/8/6Q1 w - - 0 1"]
+
+1. Qg8# 1-0
+"""
+
+EXPECTED = [["e2e4", "e7e5", "g1f3", "b8c6"], ["d2d4", "d7d5", "c2c4", "e7e6", "b1c3"], ["g1g8"]]
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "games.pgn"
+    path.write_bytes(GAMES)
+    return str(path)
+
+
+def replayed(game):
+    return [move.getChessNotation() for gs, move in Pgn.replay(game)]
+
+
+def testReadGames(path):
+    with open(path, "rb") as f:
+        games = list(Pgn.readGames(f))
+    assert [replayed(game) for game in games] == EXPECTED
+    assert games[0].headers == {"White": "A", "Black": "B"}
+    assert [game.result for game in games] == ["1-0", "0-1", "1-0"]
+
+
+@pytest.mark.parametrize("chunkBytes", [1, 7, 40, 100, 1000])
+def testRangesSplitBetweenGames(path, chunkBytes):
+    games = []
+    for start, end in Pgn.gameRanges(path, chunkBytes):
+        with open(path, "rb") as f:
+            f.seek(start)
+            games.extend(Pgn.readGames(f, end))
+    assert [replayed(game) for game in games] == EXPECTED
+
+
+def testExtractWithWorkers(path, tmp_path):
+    single, parallel = str(tmp_path / "single.fen"), str(tmp_path / "parallel.fen")
+    assert Pgn.extract(path, single) == (3, 10, 0)
+    assert Pgn.extract(path, parallel, workers=2) == (3, 10, 0)
+    with open(single) as a, open(parallel) as b:
+        assert a.read() == b.read()
+
@@ -0,0 +1,74 @@
+import io
+import time
+
+import pytest
+
+from Chess import BitboardEngine, SmartMoveFinder, bench, uci
+
+KIWIPETE = bench.BENCH_POSITIONS[1]
+
+
+@pytest.fixture(autouse=True)
+def noBook(monkeypatch):
+    ''' Searches everything, and puts back the book and tablebase UciEngine installs '''
+    monkeypatch.setattr(SmartMoveFinder, "openingBook", None)
+    monkeypatch.setattr(SmartMoveFinder, "tablebase", None)
+
+
+def waitFor(condition, seconds=5.0):
+    deadline = time.perf_counter() + seconds
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def testCancelStopsTheSearch():
+    gs = BitboardEngine.BitboardGameState.from_fen(KIWIPETE)
+    search = SmartMoveFinder.BackgroundSearch(gs, gs.getValidMoves(), max_depth=SmartMoveFinder.MAX_DEPTH)
+    time.sleep(0.2)
+    assert not search.done()
+    start = time.perf_counter()
+    search.cancel()
+    assert search.result() is None
+    assert time.perf_counter() - start < 1.0
+    assert gs.to_fen() == KIWIPETE  # searched on its own copy
+
+
+def testPonderhitStartsTheClock():
+    gs = BitboardEngine.BitboardGameState.from_fen(KIWIPETE)
+    moves = gs.getValidMoves()
+    search = SmartMoveFinder.BackgroundSearch(gs, moves, time_limit=0.2, ponder=True)
+    time.sleep(0.5)
+    assert not search.done()  # no limit while pondering
+    search.ponderhit()  # pondered longer than the limit already, stops at once
+    assert waitFor(search.done, 1.0)
+    assert search.result() in moves
+
+
+def testPonderWaitsForPonderhit():
+    out = io.StringIO()
+    engine = uci.UciEngine(out=out)
+    engine.handle("position fen " + KIWIPETE)
+    engine.handle("go ponder depth 1")
+    assert waitFor(lambda: "info depth 1" in out.getvalue())
+    time.sleep(0.2)
+    assert "bestmove" not in out.getvalue()  # searched, but holds the move
+    engine.handle("ponderhit")
+    assert waitFor(lambda: "bestmove" in out.getvalue())
+    engine.handle("quit")
+
+
+def testStopEndsAPonderSearch():
+    out = io.StringIO()
+    engine = uci.UciEngine(out=out)
+    engine.handle("position fen " + KIWIPETE)
+    engine.handle("go ponder wtime 60000 btime 60000")
+    time.sleep(0.3)
+    assert "bestmove" not in out.getvalue()
+    start = time.perf_counter()
+    engine.handle("stop")  # returns once the bestmove is out
+    assert time.perf_counter() - start < 1.0
+    lines = out.getvalue().splitlines()
+    assert lines[-1].startswith("bestmove ") and lines[-1] != "bestmove 0000"
@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from Chess import BitboardEngine, SmartMoveFinder, bench, perft
+from Chess.SmartMoveFinder import NO_MOVE
+
+
+def search(fen, depth, **options):
+    gs = BitboardEngine.BitboardGameState.from_fen(fen)
+    options.setdefault("tt", SmartMoveFinder.TranspositionTable())
+    options.setdefault("orderer", SmartMoveFinder.MoveOrderer())
+    context = SmartMoveFinder.SearchContext(**options)
+    move, score, reached = SmartMoveFinder.iterativeDeepening(gs, gs.getValidMoves(), max_depth=depth, context=context)
+    return move.getChessNotation(), score
+
+
+def testSeededRootTieBreakRepeats():
+    start = BitboardEngine.BitboardGameState().to_fen()
+    moves = {search(start, 2, rng=random.Random(seed)) for seed in range(8)}
+    assert len(moves) > 1  # equal root moves are picked at random
+    for seed in range(3):
+        assert search(start, 2, rng=random.Random(seed)) == search(start, 2, rng=random.Random(seed))
+
+
+class NoTable():
+    ''' Transposition table that never finds anything, for searching without one '''
+    hits = misses = 0
+
+    def newSearch(self):
+        pass
+
+    def probe(self, key):
+        return None
+
+    def store(self, key, depth, score, flag, moveID):
+        pass
+
+
+# pruning that can change the score (null move, LMR, SEE) is off, so only the search order differs
+EXACT_OPTIONS = dict(nullMove=False, lateMoveReductions=False, staticExchange=False)
+
+
+@pytest.mark.parametrize("fen", bench.BENCH_POSITIONS)
+def testOrderingAndTableKeepTheScore(fen):
+    plain = search(fen, 3, tt=NoTable(), orderer=SmartMoveFinder.NoOrdering(), quiescence=False, **EXACT_OPTIONS)
+    default = search(fen, 3, quiescence=False, **EXACT_OPTIONS)
+    assert plain[1] == default[1]
+
+
+@pytest.mark.parametrize("fen", [bench.BENCH_POSITIONS[i] for i in (0, 2, 5)])
+def testOrderingAndTableKeepTheQuiescenceScore(fen):
+    plain = search(fen, 2, tt=NoTable(), orderer=SmartMoveFinder.NoOrdering(), **EXACT_OPTIONS)
+    assert plain[1] == search(fen, 2, **EXACT_OPTIONS)[1]
+
+
+def testTableReturnsStoredBound():
+    tt = SmartMoveFinder.TranspositionTable(sizeBits=4)
+    assert tt.probe(3) is None
+    for flag in (SmartMoveFinder.EXACT, SmartMoveFinder.LOWERBOUND, SmartMoveFinder.UPPERBOUND):
+        tt.store(3, 4, -17, flag, 99)
+        assert tt.probe(3) == (4, -17, flag, 99)
+    assert tt.probe(3 + 16) is None and tt.collisions == 1
+    tt.store(3 + 16, 2, 5, SmartMoveFinder.EXACT, 1)  # shallower result of the same search keeps the slot
+    assert tt.probe(3)[0] == 4
+    tt.newSearch()
+    tt.store(3 + 16, 2, 5, SmartMoveFinder.EXACT, 1)  # older entries make way
+    assert tt.probe(3) is None and tt.probe(3 + 16) == (2, 5, SmartMoveFinder.EXACT, 1)
+
+
+def testSearchUsesStoredBound():
+    gs = BitboardEngine.BitboardGameState()
+    tt = SmartMoveFinder.TranspositionTable()
+    context = SmartMoveFinder.SearchContext(tt=tt, orderer=SmartMoveFinder.MoveOrderer())
+    tt.store(gs.zobristHash, 5, 300, SmartMoveFinder.LOWERBOUND, NO_MOVE)
+    score = SmartMoveFinder.findMoveNegaMaxAlphaBeta(gs, gs.getValidMoves(), 3, -1000, 200, 1, context, 1)
+    assert score == 300 and context.nodes == 1  # fails high on the stored bound without searching
+    tt.store(gs.zobristHash, 5, -300, SmartMoveFinder.UPPERBOUND, NO_MOVE)
+    assert SmartMoveFinder.findMoveNegaMaxAlphaBeta(gs, gs.getValidMoves(), 3, -200, 1000, 1, context, 1) == -300
+
+
+def testRootResultIsStored():
+    gs = BitboardEngine.BitboardGameState.from_fen(bench.BENCH_POSITIONS[4])
+    tt = SmartMoveFinder.TranspositionTable()
+    context = SmartMoveFinder.SearchContext(tt=tt, orderer=SmartMoveFinder.MoveOrderer())
+    move, score, depth = SmartMoveFinder.iterativeDeepening(gs, gs.getValidMoves(), max_depth=2, context=context)
+    assert tt.probe(gs.zobristHash) == (2, score, SmartMoveFinder.EXACT, move.moveID)
+
+
+# (fen, depth, best move, lowest score for the side to move)
+TACTICS = [
+    ("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1", 1, "a1a8", SmartMoveFinder.CHECKMATE),  # back rank mate
+    ("r5k1/5ppp/8/8/8/8/5PPP/6K1 b - - 0 1", 1, "a8a1", SmartMoveFinder.CHECKMATE),
+    ("k7/8/2K5/8/8/8/8/7R w - - 0 1", 3, None, SmartMoveFinder.CHECKMATE),  # mate in 2, Kb6 or Kc7
+    ("4k3/8/8/3q4/8/8/3R4/4K3 w - - 0 1", 2, "d2d5", 50),  # hanging queen
+    ("r3k3/8/8/1N6/8/8/8/7K w - - 0 1", 3, "b5c7", 20),  # knight fork of king and rook
+]
+
+
+@pytest.mark.parametrize("engine", sorted(perft.ENGINES))
+@pytest.mark.parametrize("fen,depth,best,minScore", TACTICS)
+def testFindsTactics(engine, fen, depth, best, minScore):
+    gs = perft.ENGINES[engine].from_fen(fen)
+    context = SmartMoveFinder.SearchContext(tt=SmartMoveFinder.TranspositionTable(), orderer=SmartMoveFinder.MoveOrderer())
+    assert context.quiescence and context.nullMove and context.lateMoveReductions
+    move, score, reached = SmartMoveFinder.iterativeDeepening(gs, gs.getValidMoves(), max_depth=depth, context=context)
+    if best is not None:
+        assert move.getChessNotation() == best
+    assert score >= minScore
+    assert gs.to_fen() == fen
+
+
+def testQuiescenceSeesTheRecapture():
+    # the queen takes a pawn defended by a pawn: a depth 1 search only sees the pawn won
+    fen = "4k3/2p5/3p4/8/8/8/8/3QK3 w - - 0 1"
+    assert search(fen, 1, quiescence=False)[0] == "d1d6"
+    move, score = search(fen, 1)
+    assert move != "d1d6" and score > -20
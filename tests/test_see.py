@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from Chess import perft
+
+VALUES = {"p": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 100}
+
+# (fen, capture, material it wins with VALUES)
+POSITIONS = [
+    ("1k1r4/1pp4p/p7/4p3/8/P5P1/1PP4P/2K1R3 w - - 0 1", "e1e5", 1),  # undefended pawn
+    ("1k1r3q/1ppn3p/p4b2/4p3/8/P2N2P1/1PP1R1BP/2K1Q3 w - - 0 1", "d3e5", -2),  # knight for a pawn
+    ("3r2k1/8/8/3p4/8/8/3R4/3RK3 w - - 0 1", "d2d5", 1),  # the rook behind recaptures
+    ("3r2k1/3r4/8/3p4/8/8/3R4/3RK3 w - - 0 1", "d2d5", -4),  # outnumbered along the file
+    ("4k3/8/8/3q4/4P3/8/8/4K3 w - - 0 1", "e4d5", 9),
+    ("4k3/2p5/3n4/8/4B3/8/8/4K3 w - - 0 1", "e4d5", 0),  # a quiet move wins nothing
+    ("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1", "e5d6", 1),  # en passant
+    ("3rk3/2P5/8/8/8/8/8/4K3 w - - 0 1", "c7d8", 5 + 9 - 1 - 9),  # promotes, the king takes the queen
+    ("3r4/2P5/8/8/8/7k/8/4K3 w - - 0 1", "c7d8", 5 + 9 - 1),
+]
+
+
+@pytest.mark.parametrize("engine", sorted(perft.ENGINES))
+@pytest.mark.parametrize("fen,notation,expected", POSITIONS)
+def testKnownExchanges(engine, fen, notation, expected):
+    gs = perft.ENGINES[engine].from_fen(fen)
+    move = next(move for move in gs.getValidMoves() if move.getChessNotation() == notation)
+    assert gs.staticExchange(move, VALUES) == expected
+    assert gs.to_fen() == fen
+
+
+def testEnginesAgree():
+    rng = random.Random(3)
+    mailbox, bitboard = (perft.ENGINES[engine]() for engine in ("mailbox", "bitboard"))
+    captures = 0
+    for game in range(10):
+        for ply in range(80):
+            moves = {move.getChessNotation(): move for move in mailbox.getValidMoves()}
+            if not moves:
+                break
+            for move in bitboard.getValidMoves():
+                if move.pieceCaptured != "--" or move.isEnpassantmove:
+                    captures += 1
+                    other = moves[move.getChessNotation()]
+                    assert mailbox.staticExchange(other, VALUES) == bitboard.staticExchange(move, VALUES), mailbox.to_fen()
+            notation = rng.choice(sorted(moves))
+            for gs in (mailbox, bitboard):
+                gs.makeMove(next(move for move in gs.getValidMoves() if move.getChessNotation() == notation))
+        for gs in (mailbox, bitboard):
+            while gs.moveLog:
+                gs.undoMove()
+    assert captures > 100
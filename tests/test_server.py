@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+import pytest
+
+from Chess import server
+
+
+def run(requests):
+    ''' Replies of one connection's requests, handled in order by a one-worker server '''
+    async def main():
+        engine = server.EngineServer(1)
+        owned = set()
+        replies = []
+        try:
+            for request in requests:
+                if "session" in request and request["session"] is None:
+                    request = dict(request, session=max(owned))
+                try:
+                    replies.append(await engine.handle(request, owned, time.perf_counter()))
+                except server.ServerError as e:
+                    replies.append({"error": str(e)})
+        finally:
+            engine.close()
+        return replies
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("fen", ["8/8/8/8/8/8/8/8 w - - 0 1", "k7/8/1K6/8/8/8/8/7Q w - - 0 1",
+                                 "k7/8/1K6/8/8/8/8/6Q1 x - - 0 1", 42])
+def testNewRejectsBadPositions(fen):
+    reply, = run([{"op": "new", "fen": fen}])
+    assert reply["error"].startswith("bad position")
+
+
+@pytest.mark.parametrize("depth", [True, 2.5, 0, "2"])
+def testGoRejectsBadDepths(depth):
+    replies = run([{"op": "new"}, {"op": "go", "session": None, "depth": depth}])
+    assert replies[1] == {"error": "depth must be a positive integer"}
+
+
+def testGoPlays():
+    replies = run([{"op": "new", "fen": "k7/8/1K6/8/8/8/8/6Q1 w - - 0 1"},
+                   {"op": "go", "session": None, "depth": 1, "play": True}])
+    assert replies[1]["move"] == "g1g8"
+    assert replies[1]["fen"].startswith("k5Q1/")
@@ -0,0 +1,86 @@
+import io
+import random
+from array import array
+
+import pytest
+
+from Chess import BitboardEngine, SmartMoveFinder, Tablebase, uci
+
+
+@pytest.fixture(scope="module")
+def directory(tmp_path_factory):
+    ''' A directory holding KQvK, generated once for the module (about 20 seconds) '''
+    path = str(tmp_path_factory.mktemp("tablebases"))
+    Tablebase.generate(["KQvK"], path, workers=1, out=io.StringIO())
+    return path
+
+
+def key(fen):
+    gs = BitboardEngine.BitboardGameState.from_fen(fen)
+    pieces = [(piece, sq) for piece, bb in gs.bitboards.items() if bb for sq in BitboardEngine.squares(bb)]
+    return Tablebase.positionKey(pieces, gs.whiteToMove)
+
+
+def testMateInOne(directory):
+    tablebase = Tablebase.Tablebase(directory)
+    gs = BitboardEngine.BitboardGameState.from_fen("k7/8/1K6/8/8/8/8/6Q1 w - - 0 1")
+    assert tablebase.probe(gs) == (Tablebase.WIN, 1)
+    move = tablebase.bestMove(gs, gs.getValidMoves())
+    assert move.getChessNotation() == "g1g8"
+
+
+def testProbesAgreeWithTheirChildren(directory):
+    tablebase = Tablebase.Tablebase(directory)
+    rng = random.Random(1)
+    checked = 0
+    while checked < 200:
+        rows = [["1"] * 8 for _ in range(8)]
+        for letter, sq in zip("KQk", rng.sample(range(64), 3)):
+            rows[sq >> 3][sq & 7] = letter
+        fen = "/".join("".join(row) for row in rows) + " " + rng.choice("wb") + " - - 0 1"
+        try:
+            gs = BitboardEngine.BitboardGameState.from_fen(fen.replace("11111111", "8"))
+        except ValueError:
+            continue  # the side not to move is in check
+        result = tablebase.probe(gs)
+        children = []
+        for move in gs.getValidMoves():
+            gs.makeMove(move)
+            children.append(tablebase.probe(gs))
+            gs.undoMove()
+        losses = [plies for outcome, plies in children if outcome == Tablebase.LOSS]
+        if not children:
+            expected = (Tablebase.LOSS, 0) if gs.inCheck() else (Tablebase.DRAW, 0)
+        elif losses:
+            expected = (Tablebase.WIN, min(losses) + 1)
+        elif any(outcome == Tablebase.DRAW for outcome, plies in children):
+            expected = (Tablebase.DRAW, 0)
+        else:
+            expected = (Tablebase.LOSS, max(plies for outcome, plies in children) + 1)
+        assert result == expected, fen
+        checked += 1
+
+
+def testLostThroughCapturesOnly(directory):
+    # Kxb7 is the only move and reaches a lost KQvK: lost in 16 plies, not a draw
+    name, index = key("k7/1R6/8/8/8/8/8/2Q1K3 b - - 0 1")
+    assert name == "KQRvK"
+    values, quiet, subWin, subLongest = Tablebase.SetSolver(name, directory).initial(index, index + 1)
+    assert (values[0], quiet[0], subWin[0], subLongest[0]) == (Tablebase.PENDING, 0, 0, 15)
+    decided, counters, longest = bytearray(1), bytearray(1), bytearray(1)
+    buckets = [array("I") for _ in range(256)]
+    Tablebase.queueInitial(decided, counters, longest, buckets, 0, values, quiet, subWin, subLongest)
+    assert Tablebase.decodeValue(decided[0]) == (Tablebase.LOSS, 16)
+    assert list(buckets[16]) == [0]
+
+
+def testUciReportsTablebaseMates(directory, monkeypatch):
+    monkeypatch.setattr(SmartMoveFinder, "tablebase", Tablebase.Tablebase(directory))
+    gs = BitboardEngine.BitboardGameState.from_fen("k7/8/1K6/8/8/8/8/6Q1 w - - 0 1")
+    move, score, depth = SmartMoveFinder.iterativeDeepening(gs, gs.getValidMoves(), max_depth=2)
+    assert score == SmartMoveFinder.TABLEBASE_WIN  # the mated position one ply down is 0 plies from mate
+    assert uci.uciScore(score, [move], gs) == "mate 1"
+    gs = BitboardEngine.BitboardGameState.from_fen("k7/8/2K5/8/8/8/8/6Q1 b - - 0 1")
+    result = Tablebase.Tablebase(directory).probe(gs)
+    assert result[0] == Tablebase.LOSS
+    assert uci.uciScore(SmartMoveFinder.tablebaseScore(gs), [], gs) == "mate -%d" % (result[1] // 2)
@@ -0,0 +1,17 @@
+from Chess import SmartMoveFinder, uci
+
+
+def testCentipawns():
+    assert uci.uciScore(15, []) == "cp 150"
+    assert uci.uciScore(-3, []) == "cp -30"
+
+
+def testCheckmate():
+    assert uci.uciScore(SmartMoveFinder.CHECKMATE, [None] * 3) == "mate 2"
+    assert uci.uciScore(-SmartMoveFinder.CHECKMATE, [None] * 2) == "mate -1"
+
+
+def testTablebaseScoreWithoutTables():
+    # a win in 5 plies two plies down the pv: mate in 4 moves
+    assert uci.uciScore(SmartMoveFinder.TABLEBASE_WIN - 5, [None] * 2) == "mate 4"
+    assert uci.uciScore(-(SmartMoveFinder.TABLEBASE_WIN - 3), [None]) == "mate -2"